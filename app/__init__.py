@@ -1,13 +1,14 @@
 import logging
 import os
+import threading
 
 from dotenv import load_dotenv
-from py2neo import Graph
 
 load_dotenv()
 
 LOG_FORMAT = "%(asctime)s - %(name)s - %(levelname)s - %(message)s"
-file_handler = logging.FileHandler("app.log")
+# app.log is only created once something is logged
+file_handler = logging.FileHandler("app.log", delay=True)
 stream_handler = logging.StreamHandler()
 stream_handler.setFormatter(logging.Formatter(LOG_FORMAT))
 file_handler.setFormatter(logging.Formatter(LOG_FORMAT))
@@ -16,10 +17,34 @@ LOGGER.setLevel(logging.INFO)
 LOGGER.addHandler(file_handler)
 LOGGER.addHandler(stream_handler)
 
-neo4j_graph = Graph(
-    os.getenv("NEO4J_URI", "bolt://localhost:7687"),
-    auth=(os.getenv("NEO4J_USERNAME", "neo4j"), os.getenv("NEO4J_PASSWORD", "neo4j")),
-)
+
+def connect_graph(name: str = None):
+    # py2neo is slow to import, commands that never use the graph skip it
+    from py2neo import Graph
+
+    return Graph(
+        os.getenv("NEO4J_URI", "bolt://localhost:7687"),
+        auth=(
+            os.getenv("NEO4J_USERNAME", "neo4j"),
+            os.getenv("NEO4J_PASSWORD", "neo4j"),
+        ),
+        name=name,
+    )
+
+
+_graph = None
+_graph_lock = threading.Lock()
+
+
+# the shared connection, opened on first use instead of at import time
+def get_graph():
+    global _graph
+
+    with _graph_lock:
+        if _graph is None:
+            _graph = connect_graph()
+
+    return _graph
 
 
 COMPLEX_PORTAL_RELEASE_FTP = (
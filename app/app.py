@@ -1,10 +1,38 @@
-from py2neo.bulk import merge_nodes, merge_relationships
-
-from app import COMPLEX_PORTAL_RELEASE_FTP, LOGGER, neo4j_graph
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from typing import List
+
+from app import COMPLEX_PORTAL_RELEASE_FTP, LOGGER
+from app.graph import (
+    Statement,
+    get_writer,
+    merge_nodes_statement,
+    merge_relationships_statement,
+)
 from app.model import Assembly, Complex, Entity
 from app.model import Entry as EntryModel
 from app.model import RfamFamily, Taxonomy, UniProt
+from app.schema import (
+    ASSEMBLY_KEY,
+    COMPLEX_KEY,
+    ENTITY_KEY,
+    ENTRY_KEY,
+    RFAM_KEY,
+    TAXONOMY_KEY,
+    UNIPROT_KEY,
+)
+from app.signature import (
+    ENTITY,
+    RFAM,
+    UNIPROT,
+    UNMAPPED,
+    Participant,
+    encode_signature,
+    make_signature,
+    signature_hash,
+)
 from app.utils import (
+    NUCLEIC_ACID_TYPES,
+    batched,
     get_molecule_type,
     get_polymer_type,
     parse_assembly_xml,
@@ -14,10 +42,129 @@ from app.utils import (
     parse_uniprot_json,
 )
 
+DROP_ENTRY_QUERY = """
+MATCH
+    (e:Entry {ID: $entry_id})-[:HAS_ENTITY]->(ent:Entity)-
+    [r:IS_PART_OF_ASSEMBLY]->(a:Assembly)
+DETACH DELETE e, ent, a
+"""
+
+# the prepared rows of an entry by name, nodes by (model, merge key) and
+# relationships by (type, start node key, end node key, property keys); the
+# statements are only ever built from these, so rows sent by app.workqueue
+# workers cannot change the queries
+ENTRY_NODE_ROWS = {
+    "entry": (EntryModel, ENTRY_KEY),
+    "entities": (Entity, ENTITY_KEY),
+    "assemblies": (Assembly, ASSEMBLY_KEY),
+    "uniprots": (UniProt, UNIPROT_KEY),
+    "rfams": (RfamFamily, RFAM_KEY),
+    "taxonomies": (Taxonomy, TAXONOMY_KEY),
+}
+ENTRY_RELATIONSHIP_ROWS = {
+    "entry_entities": ("HAS_ENTITY", ENTRY_KEY, ENTITY_KEY, []),
+    "assembly_entities": (
+        "IS_PART_OF_ASSEMBLY",
+        ENTITY_KEY,
+        ASSEMBLY_KEY,
+        ["NUMBER_OF_CHAINS"],
+    ),
+    "entity_uniprots": ("HAS_UNIPROT", ENTITY_KEY, UNIPROT_KEY, ["BEST_MAPPING"]),
+    "entity_rfams": ("HAS_RFAM", ENTITY_KEY, RFAM_KEY, []),
+    "uniprot_taxonomies": ("HAS_TAXONOMY", UNIPROT_KEY, TAXONOMY_KEY, []),
+}
+
+
+def _check_node_rows(name: str, rows) -> List[dict]:
+    (model, _) = ENTRY_NODE_ROWS[name]
+    if not isinstance(rows, list) or not all(isinstance(x, dict) for x in rows):
+        raise ValueError(f"{name} rows must be a list of objects")
+
+    result = []
+    for row in rows:
+        node = model(**row).dict()
+        if set(row) - set(node):
+            raise ValueError(f"Unknown {name} properties: {set(row) - set(node)}")
+        result.append(node)
+
+    return result
+
+
+def _check_relationship_rows(name: str, rows) -> List[tuple]:
+    keys = ENTRY_RELATIONSHIP_ROWS[name][3]
+    if not isinstance(rows, list):
+        raise ValueError(f"{name} rows must be a list")
+
+    result = []
+    for row in rows:
+        if (
+            not isinstance(row, (list, tuple))
+            or len(row) != 3
+            or not isinstance(row[0], str)
+            or not isinstance(row[2], str)
+            or not isinstance(row[1], list)
+            or len(row[1]) != len(keys)
+            or not all(isinstance(x, (str, int)) for x in row[1])
+        ):
+            raise ValueError(f"Invalid {name} row: {row!r:.200}")
+        result.append((row[0], list(row[1]), row[2]))
+
+    return result
+
+
+def check_entry_rows(entry_id: str, rows) -> dict:
+    # validates rows prepared elsewhere against the models, and that the
+    # entry, entity and assembly rows belong to the entry
+    names = list(ENTRY_NODE_ROWS) + list(ENTRY_RELATIONSHIP_ROWS)
+    if not isinstance(rows, dict) or set(rows) != set(names):
+        raise ValueError(f"Entry rows must be an object with the keys {names}")
+
+    result = {x: _check_node_rows(x, rows[x]) for x in ENTRY_NODE_ROWS}
+    result.update(
+        {x: _check_relationship_rows(x, rows[x]) for x in ENTRY_RELATIONSHIP_ROWS}
+    )
+
+    prefix = f"{entry_id}_"
+    if [x["ID"] for x in result["entry"]] != [entry_id]:
+        raise ValueError(f"Entry rows are not the rows of entry {entry_id}")
+    if not all(
+        x["UNIQID"].startswith(prefix)
+        for x in result["entities"] + result["assemblies"]
+    ) or not all(x[0] == entry_id for x in result["entry_entities"]):
+        raise ValueError(f"Entity or assembly rows not of entry {entry_id}")
+
+    return result
+
+
+def entry_statements(rows: dict) -> List[Statement]:
+    # all nodes and relationships of the entry, written in one transaction
+    return [
+        merge_nodes_statement(rows[name], merge_key=merge_key)
+        for name, (_, merge_key) in ENTRY_NODE_ROWS.items()
+    ] + [
+        merge_relationships_statement(
+            rows[name],
+            rel_type,
+            start_node_key=start_key,
+            end_node_key=end_key,
+            keys=keys,
+        )
+        for name, (
+            rel_type,
+            start_key,
+            end_key,
+            keys,
+        ) in ENTRY_RELATIONSHIP_ROWS.items()
+    ]
+
 
 class Entry:
-    def __init__(self, entry_id: str):
+    def __init__(self, entry_id: str, uniprot_store=None, rfam_store=None):
         self.entry_id = entry_id
+        # app.stores.UniProtStore and RfamMappingStore, the data is fetched
+        # from the REST APIs when not set
+        self.uniprot_store = uniprot_store
+        self.rfam_store = rfam_store
         self.cif_data = None
         self.entry_node_model = None
         self.entity_node_model = None
@@ -103,16 +250,22 @@ class Entry:
 
     def _prepare_uniprot_dict(self):
         uniprots = set([x[2] for x in self.entity_uniprot_rels])
+
+        if self.uniprot_store is not None:
+            self.uniprot_dict = self.uniprot_store.get_many(uniprots)
+            return
+
         for x in uniprots:
             self.uniprot_dict[x] = parse_uniprot_json(x)
 
     def _prepare_uniprot_node_model(self):
         for x, data in self.uniprot_dict.items():
-            recommended_name = data["proteinDescription"].get("recommendedName")
+            # unknown (eg. obsolete) accessions only get the ACCESSION
+            recommended_name = data.get("proteinDescription", {}).get("recommendedName")
             self.uniprot_node_model.append(
                 UniProt(
                     ACCESSION=x,
-                    NAME=data["uniProtkbId"],
+                    NAME=data.get("uniProtkbId"),
                     DESCR=recommended_name["fullName"]["value"]
                     if recommended_name
                     else None,
@@ -120,7 +273,17 @@ class Entry:
             )
 
     def _prepare_entity_rfam_rels(self):
-        rfam_result = parse_entry_rfam_mapping_api(self.entry_id).get("Rfam")
+        # protein only entries have no Rfam mappings
+        if not any(
+            x.POLYMER_TYPE in NUCLEIC_ACID_TYPES
+            for x in self.entity_node_model.values()
+        ):
+            return
+
+        if self.rfam_store is not None:
+            rfam_result = self.rfam_store.get(self.entry_id).get("Rfam")
+        else:
+            rfam_result = parse_entry_rfam_mapping_api(self.entry_id).get("Rfam")
 
         if rfam_result:
             for accession in rfam_result:
@@ -156,131 +319,162 @@ class Entry:
 
         self.tax_node_mode = [Taxonomy(TAX_ID=x) for x in tax_ids]
 
+    def _entity_participants(self, entity: Entity, number_of_chains: int):
+        # the participants of an entity as ASSEMBLY_QUERY in app.pdbe_complex
+        # derives them from the graph: best mapped UniProt accessions with a
+        # taxonomy, else Rfam families, else the polymer type
+        best_mappings = {}
+        for entity_id, (best_mapping,), accession in self.entity_uniprot_rels:
+            if entity_id == entity.UNIQID:
+                best_mappings[accession] = best_mapping
+
+        tax_ids = {x: tax_id for x, _, tax_id in self.uniprot_tax_rels}
+        uniprots = [
+            Participant(UNIPROT, x, number_of_chains, tax_ids[x])
+            for x, best_mapping in best_mappings.items()
+            if best_mapping == "1" and x in tax_ids
+        ]
+        if uniprots:
+            return uniprots
+
+        rfams = [
+            Participant(RFAM, x)
+            for entity_id, _, x in self.entity_rfam_rels
+            if entity_id == entity.UNIQID
+        ]
+        if rfams:
+            return rfams
+
+        if entity.POLYMER_TYPE == "R":
+            return [Participant(UNMAPPED, "RNA")]
+        if entity.POLYMER_TYPE == "D":
+            return [Participant(UNMAPPED, "DNA")]
+        if entity.POLYMER_TYPE == "D/R":
+            return [Participant(UNMAPPED, "DNA/RNA")]
+        if entity.POLYMER_TYPE == "P":
+            return [Participant(ENTITY, entity.UNIQID, number_of_chains)]
+
+        return []
+
+    def _prepare_assembly_signatures(self):
+        # stored on the Assembly nodes, so the analysis groups assemblies on
+        # SIGNATURE_HASH instead of traversing the graph
+        entities = {x.UNIQID: x for x in self.entity_node_model.values()}
+        participants = {x.UNIQID: [] for x in self.assembly_node_model}
+
+        for entity_id, (number_of_chains,), assembly_id in self.assembly_entity_rels:
+            entity = entities.get(entity_id)
+            if entity is not None and entity.TYPE == "p":
+                participants[assembly_id].extend(
+                    self._entity_participants(entity, number_of_chains)
+                )
+
+        for assembly in self.assembly_node_model:
+            signature = make_signature(participants[assembly.UNIQID])
+            assembly.SIGNATURE = encode_signature(signature)
+            assembly.SIGNATURE_HASH = signature_hash(signature)
+
     def _drop_entry(self):
-        query = f"""
-        MATCH
-            (e:Entry {{ID: "{self.entry_id}"}})-[:HAS_ENTITY]->(ent:Entity)-
-            [r:IS_PART_OF_ASSEMBLY]->(a:Assembly)
-        DETACH DELETE e, ent, a
-        """
-
-        neo4j_graph.run(query)
+        get_writer().run(DROP_ENTRY_QUERY, {"entry_id": self.entry_id})
         LOGGER.info(f"Entry {self.entry_id} dropped")
 
-    def run(self):
-        LOGGER.info(f"Processing entry {self.entry_id}")
+    def prepare(self):
+        # get data from api/xml/cif
+        self._prepare_cif_data()
+        self._prepare_assembly_data()
+
+        # prepare node and relationships data
+        self._prepare_entry_node_model()
+        self._prepare_entity_node_model()
+        self._prepare_entry_entity_rels()
+        self._prepare_assembly_node_model()
+        self._prepare_assembly_entity_rels()
+        self._prepare_entity_uniprot_rels()
+        self._prepare_uniprot_dict()
+        self._prepare_uniprot_node_model()
+        self._prepare_entity_rfam_rels()
+        self._prepare_rfam_node_model()
+        self._prepare_uniprot_tax_rels()
+        self._prepare_tax_node_model()
+        self._prepare_assembly_signatures()
+
+    def rows(self) -> dict:
+        return {
+            "entry": [self.entry_node_model.dict()],
+            "entities": [x.dict() for x in self.entity_node_model.values()],
+            "assemblies": [x.dict() for x in self.assembly_node_model],
+            "uniprots": [x.dict() for x in self.uniprot_node_model],
+            "rfams": [x.dict() for x in self.rfam_node_model],
+            "taxonomies": [x.dict() for x in self.tax_node_mode],
+            "entry_entities": self.entry_entity_rels,
+            "assembly_entities": self.assembly_entity_rels,
+            "entity_uniprots": self.entity_uniprot_rels,
+            "entity_rfams": self.entity_rfam_rels,
+            "uniprot_taxonomies": self.uniprot_tax_rels,
+        }
+
+    def _failed(self, error: Exception):
+        LOGGER.error(f"Error processing entry {self.entry_id}: {error}", exc_info=True)
 
+        # the entry writes are one transaction, this removes the data of an
+        # earlier load of the entry; the graph may be the cause of the error
         try:
-            # get data from api/xml/cif
-            self._prepare_cif_data()
-            self._prepare_assembly_data()
-
-            # prepare node and relationships data
-            self._prepare_entry_node_model()
-            self._prepare_entity_node_model()
-            self._prepare_entry_entity_rels()
-            self._prepare_assembly_node_model()
-            self._prepare_assembly_entity_rels()
-            self._prepare_entity_uniprot_rels()
-            self._prepare_uniprot_dict()
-            self._prepare_uniprot_node_model()
-            self._prepare_entity_rfam_rels()
-            self._prepare_rfam_node_model()
-            self._prepare_uniprot_tax_rels()
-            self._prepare_tax_node_model()
-
-            # create all nodes and relationships
-            merge_nodes(
-                neo4j_graph.auto(),
-                [self.entry_node_model.dict()],
-                merge_key=("Entry", "ID"),
-            )
-            merge_nodes(
-                neo4j_graph.auto(),
-                [x.dict() for x in self.entity_node_model.values()],
-                merge_key=("Entity", "UNIQID"),
-            )
-            merge_nodes(
-                neo4j_graph.auto(),
-                [x.dict() for x in self.assembly_node_model],
-                merge_key=("Assembly", "UNIQID"),
-            )
-            merge_nodes(
-                neo4j_graph.auto(),
-                [x.dict() for x in self.uniprot_node_model],
-                merge_key=("UniProt", "ACCESSION"),
-            )
-            merge_nodes(
-                neo4j_graph.auto(),
-                [x.dict() for x in self.rfam_node_model],
-                merge_key=("RfamFamily", "RFAM_ACC"),
-            )
-            merge_nodes(
-                neo4j_graph.auto(),
-                [x.dict() for x in self.tax_node_mode],
-                merge_key=("Taxonomy", "TAX_ID"),
-            )
-            merge_relationships(
-                neo4j_graph.auto(),
-                self.entry_entity_rels,
-                "HAS_ENTITY",
-                start_node_key=("Entry", "ID"),
-                end_node_key=("Entity", "UNIQID"),
-                keys=[],
-            )
-            merge_relationships(
-                neo4j_graph.auto(),
-                self.assembly_entity_rels,
-                "IS_PART_OF_ASSEMBLY",
-                start_node_key=("Entity", "UNIQID"),
-                end_node_key=("Assembly", "UNIQID"),
-                keys=["NUMBER_OF_CHAINS"],
-            )
-            merge_relationships(
-                neo4j_graph.auto(),
-                self.entity_uniprot_rels,
-                "HAS_UNIPROT",
-                start_node_key=("Entity", "UNIQID"),
-                end_node_key=("UniProt", "ACCESSION"),
-                keys=["BEST_MAPPING"],
-            )
-            merge_relationships(
-                neo4j_graph.auto(),
-                self.entity_rfam_rels,
-                "HAS_RFAM",
-                start_node_key=("Entity", "UNIQID"),
-                end_node_key=("RfamFamily", "RFAM_ACC"),
-                keys=[],
-            )
-            merge_relationships(
-                neo4j_graph.auto(),
-                self.uniprot_tax_rels,
-                "HAS_TAXONOMY",
-                start_node_key=("UniProt", "ACCESSION"),
-                end_node_key=("Taxonomy", "TAX_ID"),
-                keys=[],
-            )
+            self._drop_entry()
+        except Exception as drop_error:
+            LOGGER.error(f"Could not drop entry {self.entry_id}: {drop_error}")
+
+    def write(self, rows: dict = None):
+        # rows prepared elsewhere (eg. by an app.workqueue worker) are checked
+        # and written in place of the ones of this instance, invalid rows fail
+        # before the graph is touched
+        statements = entry_statements(
+            self.rows() if rows is None else check_entry_rows(self.entry_id, rows)
+        )
+        try:
+            get_writer().write(statements)
+        except Exception as e:
+            # classified and possibly retried by app.loader or app.workqueue
+            self._failed(e)
+            raise
+
+        LOGGER.info(f"Processed entry {self.entry_id}")
 
-            LOGGER.info(f"Processed entry {self.entry_id}")
+    def run(self):
+        LOGGER.info(f"Processing entry {self.entry_id}")
 
+        try:
+            self.prepare()
         except Exception as e:
-            self._drop_entry()
-            LOGGER.error(f"Error processing entry {self.entry_id}: {e.with_traceback}")
-            LOGGER.info(f"Skipping entry {self.entry_id}")
+            self._failed(e)
+            raise
 
+        self.write()
 
-def run_entry(entry_id):
-    entry = Entry(entry_id)
+
+def run_entry(entry_id, uniprot_store=None, rfam_store=None):
+    entry = Entry(entry_id, uniprot_store, rfam_store)
     entry.run()
 
 
+# rows per Complex Portal merge transaction, and merges run at a time
+COMPLEX_PORTAL_CHUNK_SIZE = 5000
+COMPLEX_PORTAL_THREADS = 4
+
+
 class ComplexPortal:
-    def __init__(self) -> None:
+    def __init__(
+        self,
+        threads: int = COMPLEX_PORTAL_THREADS,
+        chunk_size: int = COMPLEX_PORTAL_CHUNK_SIZE,
+    ) -> None:
+        self.threads = threads
+        self.chunk_size = chunk_size
         self.data = None
         self.nodes = None
         self.complex_data = None
         self.components = None
         self.component_data = None
+        self.component_uniprots = None
         self.xrefs = None
         self.xrefs_data = {}
         self.entry_nodes = None
@@ -318,26 +512,59 @@ class ComplexPortal:
             for x in self.data
         }
 
-    def _create_complex_nodes(self):
-        merge_nodes(
-            neo4j_graph.auto(),
-            [x.dict() for x in self.complex_data.values()],
-            merge_key=("Complex", "COMPLEX_ID"),
+    def _write_chunks(self, description: str, chunks: list):
+        # chunks are lists of statements, each written in its own transaction,
+        # in parallel sessions
+        LOGGER.info(f"{description}: {len(chunks)} chunks - START")
+
+        with ThreadPoolExecutor(max_workers=self.threads) as executor:
+            futures = [executor.submit(get_writer().write, x) for x in chunks]
+            for count, future in enumerate(as_completed(futures), 1):
+                future.result()
+                LOGGER.info(f"{description}: {count}/{len(chunks)} chunks")
+
+        LOGGER.info(f"{description} - DONE")
+
+    def _node_statements(self, data: list, merge_key: tuple):
+        return [
+            merge_nodes_statement(x, merge_key=merge_key)
+            for x in batched(data, self.chunk_size)
+        ]
+
+    def _relationship_chunk(self, uniprot_rows: list, entry_rows: list):
+        statements = []
+        for rows, start_node_key, keys in (
+            (uniprot_rows, UNIPROT_KEY, ["STOICHIOMETRY"]),
+            (entry_rows, ENTRY_KEY, []),
+        ):
+            if rows:
+                statements.append(
+                    merge_relationships_statement(
+                        rows,
+                        "IS_PART_OF_COMPLEX",
+                        start_node_key=start_node_key,
+                        end_node_key=COMPLEX_KEY,
+                        keys=keys,
+                    )
+                )
+
+        return statements
+
+    def _complex_node_statements(self):
+        return self._node_statements(
+            [x.dict() for x in self.complex_data.values()], COMPLEX_KEY
         )
-        LOGGER.info(f"Created/Recreated {len(self.complex_data)} Complex nodes")
 
     def _prepare_component_uniprot_nodes(self):
         self.component_uniprots = {
             x[1]: UniProt(ACCESSION=x[1]) for x in self.components
         }
 
-    def _create_component_uniprot_nodes(self):
-        merge_nodes(
-            neo4j_graph.auto(),
+    def _component_uniprot_node_statements(self):
+        return self._node_statements(
             [{"ACCESSION": x.ACCESSION} for x in self.component_uniprots.values()],
-            merge_key=("UniProt", "ACCESSION"),
+            UNIPROT_KEY,
         )
-        LOGGER.info(f"Created/Recreated {len(self.component_uniprots)} UniProt nodes")
 
     def _prepare_xrefs_data(self):
         for x in self.xrefs:
@@ -352,67 +579,92 @@ class ComplexPortal:
 
         self.entry_nodes = [{"ID": x} for x in entries]
 
-    def _create_xref_entry_nodes(self):
-        merge_nodes(
-            neo4j_graph.auto(),
-            self.entry_nodes,
-            merge_key=("Entry", "ID"),
-        )
-        LOGGER.info(f"Created/Recreated {len(self.entry_nodes)} Entry nodes")
+    def _xref_entry_node_statements(self):
+        return self._node_statements(self.entry_nodes, ENTRY_KEY)
 
-    def _create_complex_uniprot_rels(self):
-        data = []
+    def _relationship_chunks(self):
+        # all relationships of a complex are written in the same chunk, so
+        # concurrent transactions never lock the same Complex node; UniProt
+        # and Entry nodes shared by complexes of different chunks can still
+        # deadlock, which the writers retry as transient errors
+        rows = {}
         for complex_id, uniprot, stoichiometry in self.components:
             complex_node = self.complex_data[complex_id]
             uniprot_node = self.component_uniprots[uniprot]
-            data.append(
-                (uniprot_node.ACCESSION, [stoichiometry], complex_node.COMPLEX_ID),
+            rows.setdefault(complex_node.COMPLEX_ID, ([], []))[0].append(
+                (uniprot_node.ACCESSION, [stoichiometry], complex_node.COMPLEX_ID)
             )
 
-        merge_relationships(
-            neo4j_graph.auto(),
-            data,
-            "IS_PART_OF_COMPLEX",
-            end_node_key=("Complex", "COMPLEX_ID"),
-            start_node_key=("UniProt", "ACCESSION"),
-            keys=["STOICHIOMETRY"],
-        )
-
-    def _create_complex_pdb_rels(self):
-        data = []
         for complex_id, pdb_ids in self.xrefs_data.items():
             complex_node = self.complex_data[complex_id]
             for pdb_id in pdb_ids:
-                data.append(
-                    (pdb_id, [], complex_node.COMPLEX_ID),
+                rows.setdefault(complex_node.COMPLEX_ID, ([], []))[1].append(
+                    (pdb_id, [], complex_node.COMPLEX_ID)
                 )
-        merge_relationships(
-            neo4j_graph.auto(),
-            data,
-            "IS_PART_OF_COMPLEX",
-            end_node_key=("Complex", "COMPLEX_ID"),
-            start_node_key=("Entry", "ID"),
-            keys=[],
-        )
 
-    def run(self):
-        self._parse_complexes()
-        self._prepare_complex_data()
-        self._create_complex_nodes()
+        chunks = []
+        uniprot_rows = []
+        entry_rows = []
+        for complex_uniprot_rows, complex_entry_rows in rows.values():
+            uniprot_rows.extend(complex_uniprot_rows)
+            entry_rows.extend(complex_entry_rows)
+
+            if len(uniprot_rows) + len(entry_rows) >= self.chunk_size:
+                chunks.append(self._relationship_chunk(uniprot_rows, entry_rows))
+                uniprot_rows = []
+                entry_rows = []
+
+        if uniprot_rows or entry_rows:
+            chunks.append(self._relationship_chunk(uniprot_rows, entry_rows))
+
+        return chunks
+
+    def prepare(self):
+        # the three files are downloaded and parsed concurrently
+        with ThreadPoolExecutor(max_workers=3) as executor:
+            futures = [
+                executor.submit(self._parse_complexes),
+                executor.submit(self._parse_complex_components),
+                executor.submit(self._parse_xrefs),
+            ]
+            for future in futures:
+                future.result()
 
-        self._parse_complex_components()
+        self._prepare_complex_data()
         self._prepare_component_uniprot_nodes()
-        self._create_component_uniprot_nodes()
-
-        self._parse_xrefs()
         self._prepare_xrefs_data()
         self._prepare_xref_entry_nodes()
-        self._create_xref_entry_nodes()
 
-        self._create_complex_uniprot_rels()
-        self._create_complex_pdb_rels()
+    def write(self):
+        if None in (self.complex_data, self.component_uniprots, self.entry_nodes):
+            raise RuntimeError(
+                "Complex Portal data is not prepared, call prepare() before write()"
+            )
+
+        # relationships only match their nodes, so all node chunks are merged
+        # before the first relationship chunk starts
+        self._write_chunks(
+            f"Creating {len(self.complex_data)} Complex, "
+            f"{len(self.component_uniprots)} UniProt and {len(self.entry_nodes)} "
+            "Entry nodes",
+            [
+                [x]
+                for x in self._complex_node_statements()
+                + self._component_uniprot_node_statements()
+                + self._xref_entry_node_statements()
+            ],
+        )
+        self._write_chunks(
+            "Creating IS_PART_OF_COMPLEX relationships", self._relationship_chunks()
+        )
+
+    def run(self):
+        self.prepare()
+        self.write()
 
 
-def run_complex_portal():
-    complex_portal = ComplexPortal()
+def run_complex_portal(
+    threads: int = COMPLEX_PORTAL_THREADS, chunk_size: int = COMPLEX_PORTAL_CHUNK_SIZE
+):
+    complex_portal = ComplexPortal(threads, chunk_size)
     complex_portal.run()
@@ -1,11 +1,38 @@
-from concurrent.futures import ThreadPoolExecutor
-from pathlib import Path
+import json
 
 import click
 
-from app.app import run_complex_portal, run_entry
-from app.pdbe_complex import run_pdbe_complex
-from app.utils import create_schema_indexes, drop_everything
+from app.similarity import SIMILARITY_METRICS
+from app.subcomplex import SUBCOMPLEX_ENGINES
+
+# modules are imported by the commands using them, so --help and commands
+# that never touch the graph do not pay for py2neo, gemmi and pydantic
+
+
+def store_options(command):
+    command = click.option(
+        "--rfam-store",
+        type=click.Path(exists=True, dir_okay=False),
+        help="Rfam mapping store built with build-rfam-store, used instead of "
+        "the PDBe Rfam mapping API",
+    )(command)
+    command = click.option(
+        "--uniprot-store",
+        type=click.Path(exists=True, dir_okay=False),
+        help="UniProt store built with build-uniprot-store, used instead of the "
+        "UniProt REST API",
+    )(command)
+
+    return command
+
+
+def open_stores(uniprot_store: str, rfam_store: str):
+    from app.stores import RfamMappingStore, UniProtStore
+
+    return {
+        "uniprot_store": UniProtStore(uniprot_store) if uniprot_store else None,
+        "rfam_store": RfamMappingStore(rfam_store) if rfam_store else None,
+    }
 
 
 @click.group()
@@ -14,16 +41,37 @@ def main():
 
 
 @main.command(
-    help="Create schema indexes",
+    help="Create schema indexes and uniqueness constraints",
 )
 def create_indexes():
-    create_schema_indexes()
+    from app.schema import create_schema
+
+    create_schema()
+
+
+@main.command(
+    name="verify-query-plans",
+    help="Check that pipeline queries are planned without label scans or "
+    "cartesian products",
+)
+def verify_query_plans_command():
+    from app.schema import verify_query_plans
+
+    violations = verify_query_plans()
+
+    if violations:
+        raise click.ClickException(
+            "Query plan check failed: "
+            + ", ".join(f"{name} ({operator})" for name, operator in violations)
+        )
 
 
 @main.command(
     help="Remove all nodes and relationships",
 )
 def remove_all():
+    from app.utils import drop_everything
+
     drop_everything()
 
 
@@ -36,8 +84,15 @@ def remove_all():
     required=True,
     help="PDB entry ID",
 )
-def load_entry(entry: str):
-    run_entry(entry)
+@store_options
+def load_entry(entry: str, uniprot_store: str, rfam_store: str):
+    from app.app import run_entry
+    from app.failures import classify_failure
+
+    try:
+        run_entry(entry, **open_stores(uniprot_store, rfam_store))
+    except Exception as e:
+        raise click.ClickException(f"Entry {entry} failed ({classify_failure(e)}): {e}")
 
 
 @main.command(
@@ -46,31 +101,327 @@ def load_entry(entry: str):
 @click.option(
     "--entries",
     required=True,
-    help="PDB entry IDs separated by comma or a file with one entry per line",
+    help="PDB entry IDs separated by comma, a file (.gz or not) with one entry "
+    "per line or - to read them from stdin",
 )
 @click.option(
     "--threads",
     default=4,
     help="Number of threads to use",
 )
-def load_entries(entries: str, threads: int):
-    entries_list = []
+@click.option(
+    "--max-pending",
+    type=int,
+    help="Number of entries submitted at a time, twice the threads by default",
+)
+@click.option(
+    "--retries",
+    default=3,
+    help="Number of retries of entries failing with a transient error",
+)
+@click.option(
+    "--retry-delay",
+    default=10.0,
+    help="Seconds before the first retry, doubled for every further retry",
+)
+@click.option(
+    "--failure-report",
+    default="load_failures.json",
+    help="JSON file listing the entries that could not be loaded",
+)
+@store_options
+def load_entries(
+    entries: str,
+    threads: int,
+    max_pending: int,
+    retries: int,
+    retry_delay: float,
+    failure_report: str,
+    uniprot_store: str,
+    rfam_store: str,
+):
+    from app.loader import EntryLoader, read_entries
 
-    if Path(entries).is_file():
-        with open(entries) as f:
-            entries_list = [x.strip() for x in f.readlines()]
-    else:
-        entries_list = entries.split(",")
+    loader = EntryLoader(
+        threads=threads,
+        retries=retries,
+        retry_delay=retry_delay,
+        max_pending=max_pending,
+        **open_stores(uniprot_store, rfam_store),
+    )
+    failures = loader.load(read_entries(entries))
+    loader.write_failure_report(failure_report)
+
+    click.echo(
+        f"Loaded {loader.loaded} of {loader.entries} entries, {len(failures)} "
+        f"failed (see {failure_report})"
+    )
+
+
+@main.command(
+    name="coordinate-entries",
+    help="Publish PDB entries to a work queue for run-worker processes, and "
+    "write the entries prepared by workers started with --send-rows",
+)
+@click.option(
+    "--entries",
+    required=True,
+    help="PDB entry IDs separated by comma, a file (.gz or not) with one entry "
+    "per line or - to read them from stdin",
+)
+@click.option(
+    "--queue",
+    default="entry_queue.sqlite",
+    help="SQLite work queue file, publishing to an existing queue resumes it",
+)
+@click.option(
+    "--serve",
+    help="host:port to serve the queue on, for workers on other hosts; requires "
+    "the shared WORK_QUEUE_TOKEN environment variable",
+)
+@click.option(
+    "--threads",
+    default=4,
+    help="Number of threads writing prepared entries",
+)
+@click.option(
+    "--retries",
+    default=3,
+    help="Number of retries of entries failing with a transient error or "
+    "whose worker lease expired",
+)
+@click.option(
+    "--retry-delay",
+    default=10.0,
+    help="Seconds before the first retry, doubled for every further retry",
+)
+@click.option(
+    "--failure-report",
+    default="load_failures.json",
+    help="JSON file listing the entries that could not be loaded",
+)
+def coordinate_entries(
+    entries: str,
+    queue: str,
+    serve: str,
+    threads: int,
+    retries: int,
+    retry_delay: float,
+    failure_report: str,
+):
+    from app.loader import read_entries
+    from app.workqueue import WorkQueue, run_coordinator
+
+    failures = run_coordinator(
+        WorkQueue(queue, retries=retries, retry_delay=retry_delay),
+        read_entries(entries),
+        threads=threads,
+        serve=serve,
+        failure_report=failure_report,
+    )
+
+    click.echo(f"Queue {queue} finished, {len(failures)} failed (see {failure_report})")
+
+
+@main.command(
+    name="run-worker",
+    help="Load PDB entries claimed from a work queue until it is finished",
+)
+@click.option(
+    "--queue",
+    default="entry_queue.sqlite",
+    help="SQLite work queue file or the http:// address of coordinate-entries "
+    "--serve, which needs the WORK_QUEUE_TOKEN of the coordinator",
+)
+@click.option(
+    "--threads",
+    default=4,
+    help="Number of threads to use",
+)
+@click.option(
+    "--lease",
+    default=900.0,
+    help="Seconds an entry is held before it is handed to another worker",
+)
+@click.option(
+    "--send-rows",
+    is_flag=True,
+    help="Send the prepared entries to the coordinator instead of writing them "
+    "to the graph",
+)
+@click.option(
+    "--worker-id",
+    help="Name of the worker in the queue, host name and process ID by default",
+)
+@click.option(
+    "--queue-timeout",
+    default=300.0,
+    help="Seconds to retry an unreachable work queue before the worker exits",
+)
+@store_options
+def run_worker(
+    queue: str,
+    threads: int,
+    lease: float,
+    send_rows: bool,
+    worker_id: str,
+    queue_timeout: float,
+    uniprot_store: str,
+    rfam_store: str,
+):
+    from app.workqueue import open_queue
+    from app.workqueue import run_worker as run_queue_worker
+
+    processed = run_queue_worker(
+        open_queue(queue),
+        threads=threads,
+        lease=lease,
+        send_rows=send_rows,
+        worker=worker_id,
+        timeout=queue_timeout,
+        **open_stores(uniprot_store, rfam_store),
+    )
+
+    click.echo(f"Processed {processed} entries")
+
+
+@main.command(
+    name="build-uniprot-store",
+    help="Build a local UniProt store from UniProt release flat files",
+)
+@click.option(
+    "--output",
+    "-o",
+    required=True,
+    help="SQLite file to write",
+)
+@click.option(
+    "--input",
+    "-i",
+    "inputs",
+    required=True,
+    multiple=True,
+    type=click.Path(exists=True, dir_okay=False),
+    help="UniProt flat file, eg. uniprot_sprot.dat.gz; can be repeated",
+)
+def build_uniprot_store_command(output: str, inputs):
+    from app.stores import build_uniprot_store
+
+    build_uniprot_store(output, inputs)
+
+
+@main.command(
+    name="build-rfam-store",
+    help="Build a local Rfam mapping store from mapping files, or by fetching "
+    "the mappings of a list of entries ahead of time",
+)
+@click.option(
+    "--output",
+    "-o",
+    required=True,
+    help="SQLite file to write",
+)
+@click.option(
+    "--mapping-file",
+    "-m",
+    "mapping_files",
+    multiple=True,
+    type=click.Path(exists=True, dir_okay=False),
+    help="Tab separated file (.gz or not) without a header and one entity "
+    "mapping per line: PDB ID, entity ID, Rfam accession, Rfam ID, eg. "
+    "'1ffk 9 RF02540 LSU_rRNA_archaea' with tabs; lines starting with # are "
+    "skipped, further columns ignored. Rfam's chain based pdb_full_region.txt "
+    "is not accepted. Can be repeated",
+)
+@click.option(
+    "--entries",
+    type=click.Path(exists=True, dir_okay=False),
+    help="File with one entry per line to fetch from the PDBe Rfam mapping API",
+)
+def build_rfam_store_command(output: str, mapping_files, entries: str):
+    from app.stores import (
+        build_rfam_store,
+        parse_rfam_mapping_api,
+        parse_rfam_mapping_tsv,
+    )
+
+    if not mapping_files and not entries:
+        raise click.UsageError("One of --mapping-file or --entries is required")
+
+    def mappings():
+        for mapping_file in mapping_files:
+            yield from parse_rfam_mapping_tsv(mapping_file)
 
-    with ThreadPoolExecutor(max_workers=threads) as executor:
-        executor.map(run_entry, entries_list)
+        if entries:
+            with open(entries) as f:
+                yield from parse_rfam_mapping_api(x.strip() for x in f if x.strip())
+
+    build_rfam_store(output, mappings())
 
 
 @main.command(
     help="Load Complex portal data",
 )
-def load_complex_portal_data():
-    run_complex_portal()
+@click.option(
+    "--threads",
+    default=4,
+    help="Number of merge transactions to run at a time",
+)
+@click.option(
+    "--chunk-size",
+    default=5000,
+    help="Rows per merge transaction",
+)
+def load_complex_portal_data(threads: int, chunk_size: int):
+    from app.app import run_complex_portal
+
+    run_complex_portal(threads, chunk_size)
+
+
+@main.command(
+    name="generate-synthetic-data",
+    help="Load a synthetic dataset of entries and Complex Portal complexes for "
+    "scaling tests, or write it as neo4j-admin import files",
+)
+@click.option(
+    "--entries",
+    type=int,
+    required=True,
+    help="Number of synthetic entries",
+)
+@click.option(
+    "--seed",
+    default=0,
+    help="Random seed",
+)
+@click.option(
+    "--import-dir",
+    type=click.Path(file_okay=False),
+    help="Write CSV files for neo4j-admin database import instead of loading "
+    "the graph",
+)
+@click.option(
+    "--no-signatures",
+    is_flag=True,
+    help="Do not store assembly signatures, as for entries loaded before they "
+    "were stored",
+)
+def generate_synthetic_data(
+    entries: int, seed: int, import_dir: str, no_signatures: bool
+):
+    from app.graph import get_writer
+    from app.synthetic import (
+        SyntheticDataset,
+        write_synthetic_graph,
+        write_synthetic_import_files,
+    )
+
+    dataset = SyntheticDataset(entries, seed=seed, signatures=not no_signatures)
+
+    if import_dir:
+        write_synthetic_import_files(import_dir, dataset)
+    else:
+        write_synthetic_graph(get_writer(), dataset)
 
 
 @main.command(
@@ -82,8 +433,255 @@ def load_complex_portal_data():
     help="Complex-Subcomplex output CSV file",
     required=True,
 )
-def run_pdbe_complex_analysis(outcsv: str):
-    run_pdbe_complex(outcsv)
+@click.option(
+    "--transitive-reduction",
+    is_flag=True,
+    help="Only store the covering IS_SUB_COMPLEX_OF relationships",
+)
+@click.option(
+    "--index-file",
+    default="complex_index.json",
+    show_default=True,
+    help="Participant index file used by query-complexes",
+)
+@click.option(
+    "--snapshot-dir",
+    help="Also write a memory-mappable binary snapshot to this directory "
+    "(requires numpy)",
+)
+@click.option(
+    "--near-matches",
+    help="Also write Complex Portal complexes similar to each PDB complex to "
+    "this CSV file (requires numpy and scipy)",
+)
+@click.option(
+    "--similarity",
+    type=click.Choice(SIMILARITY_METRICS),
+    default="jaccard",
+    show_default=True,
+    help="Score of the near-match search",
+)
+@click.option(
+    "--threshold",
+    type=click.FloatRange(0, 1),
+    default=0.5,
+    show_default=True,
+    help="Minimum near-match score",
+)
+@click.option(
+    "--subcomplex-engine",
+    type=click.Choice(SUBCOMPLEX_ENGINES),
+    default="python",
+    show_default=True,
+    help="Find sub complexes from the participant signatures in memory or with "
+    "batched Cypher queries in the database",
+)
+def run_pdbe_complex_analysis(
+    outcsv: str,
+    transitive_reduction: bool,
+    index_file: str,
+    snapshot_dir: str,
+    near_matches: str,
+    similarity: str,
+    threshold: float,
+    subcomplex_engine: str,
+):
+    from app.pdbe_complex import run_pdbe_complex
+
+    run_pdbe_complex(
+        outcsv,
+        transitive_reduction,
+        index_file,
+        snapshot_dir,
+        near_matches,
+        similarity,
+        threshold,
+        subcomplex_engine,
+    )
+
+
+@main.command(
+    help="Create the indexes, load the Complex Portal data and the entries, then "
+    "run the complex analysis; stages whose inputs did not change since their "
+    "last run are skipped",
+)
+@click.option(
+    "--entries",
+    required=True,
+    help="PDB entry IDs separated by comma, a file (.gz or not) with one entry "
+    "per line or - to read them from stdin",
+)
+@click.option(
+    "--outcsv",
+    "-o",
+    help="Complex-Subcomplex output CSV file",
+    required=True,
+)
+@click.option(
+    "--threads",
+    default=4,
+    help="Number of threads to use per stage",
+)
+@store_options
+@click.option(
+    "--failure-report",
+    default="load_failures.json",
+    help="JSON file listing the entries that could not be loaded",
+)
+@click.option(
+    "--transitive-reduction",
+    is_flag=True,
+    help="Only store the covering IS_SUB_COMPLEX_OF relationships",
+)
+@click.option(
+    "--index-file",
+    default="complex_index.json",
+    show_default=True,
+    help="Participant index file used by query-complexes",
+)
+@click.option(
+    "--snapshot-dir",
+    help="Also write a memory-mappable binary snapshot to this directory "
+    "(requires numpy)",
+)
+@click.option(
+    "--state-file",
+    default="build_state.json",
+    show_default=True,
+    help="JSON file with the input fingerprints of the finished stages",
+)
+@click.option(
+    "--force",
+    is_flag=True,
+    help="Run every stage, whatever the recorded fingerprints",
+)
+def build(
+    entries: str,
+    outcsv: str,
+    threads: int,
+    uniprot_store: str,
+    rfam_store: str,
+    failure_report: str,
+    transitive_reduction: bool,
+    index_file: str,
+    snapshot_dir: str,
+    state_file: str,
+    force: bool,
+):
+    from app.pipeline import run_build
+
+    try:
+        run_build(
+            state_file,
+            force,
+            entries=entries,
+            outcsv=outcsv,
+            threads=threads,
+            uniprot_store=uniprot_store,
+            rfam_store=rfam_store,
+            failure_report=failure_report,
+            transitive_reduction=transitive_reduction,
+            index_file=index_file,
+            snapshot_dir=snapshot_dir,
+        )
+    except RuntimeError as e:
+        raise click.ClickException(str(e))
+
+
+@main.command(
+    help="Find the PDB complexes containing all the given UniProt or Rfam "
+    "accessions, using the index written by run-pdbe-complex-analysis",
+)
+@click.option(
+    "--index-file",
+    default="complex_index.json",
+    show_default=True,
+    help="Participant index file",
+)
+@click.option(
+    "--participants",
+    "-p",
+    help="Accessions separated by comma",
+)
+@click.option(
+    "--queries",
+    "-q",
+    type=click.File("r"),
+    help="File with one comma separated query per line, - for stdin",
+)
+def query_complexes(index_file: str, participants: str, queries):
+    from app.lookup import ComplexLookup
+
+    if not participants and not queries:
+        raise click.UsageError("One of --participants or --queries is required")
+
+    lookup = ComplexLookup(index_file)
+    lines = [participants] if participants else queries
+
+    for line in lines:
+        if not line.strip():
+            continue
+
+        # picks up the index of a newer analysis run
+        lookup.refresh()
+
+        query = line.strip().split(",")
+        click.echo(json.dumps({"query": query, "complexes": lookup.lookup(query)}))
+
+
+@main.command(
+    help="List the complexes a PDB complex is a sub complex of, and its sub "
+    "complexes, following IS_SUB_COMPLEX_OF transitively",
+)
+@click.option(
+    "--complex-id",
+    "-c",
+    required=True,
+    help="PDB complex ID, eg. PDB-CPX-1",
+)
+def subcomplex_closure(complex_id: str):
+    from app.pdbe_complex import PDBeComplex
+
+    complex = PDBeComplex(outcsv=None)
+    (super_complexes, sub_complexes) = complex.get_subcomplex_closure(complex_id)
+
+    click.echo(f"Sub complex of: {','.join(sorted(super_complexes))}")
+    click.echo(f"Sub complexes: {','.join(sorted(sub_complexes))}")
+
+
+@main.command(
+    help="Profile the analysis queries and the batched statements of the "
+    "analysis and write the per-operator metrics to a JSON baseline",
+)
+@click.option(
+    "--output",
+    "-o",
+    required=True,
+    help="JSON file to write the profile to",
+)
+@click.option(
+    "--baseline",
+    "-b",
+    help="Previous profile JSON to compare against",
+)
+@click.option(
+    "--database",
+    "-d",
+    help="Neo4j database to profile, defaults to the server default database",
+)
+@click.option(
+    "--batch-size",
+    type=click.IntRange(1),
+    default=1000,
+    show_default=True,
+    help="Rows of the sample batch, read from the analysed graph, given to each "
+    "batched statement",
+)
+def profile(output: str, baseline: str, database: str, batch_size: int):
+    from app.profiling import run_profile
+
+    for line in run_profile(output, baseline, database, batch_size):
+        click.echo(line)
 
 
 if __name__ == "__main__":
@@ -0,0 +1,63 @@
+from xml.parsers.expat import ExpatError
+
+import requests
+
+# failure categories of a PDB entry load, only TRANSIENT ones are retried
+TRANSIENT = "transient"
+# the upstream service has no data for the request (eg. 404) or rejects it
+UPSTREAM = "upstream"
+# the downloaded data could not be read or turned into nodes
+PARSE = "parse"
+GRAPH = "graph"
+# anything else, eg. a bug, is not taken for a problem of the entry data
+UNKNOWN = "unknown"
+
+TRANSIENT_STATUS_CODES = {408, 425, 429, 500, 502, 503, 504}
+
+# errors of gemmi (ValueError), xmltodict, JSON decoding and pydantic
+# validation (both ValueError), and of fields missing from the data
+PARSE_ERRORS = (ValueError, KeyError, IndexError, ExpatError)
+
+# connection level errors of py2neo and the neo4j driver, by class name so that
+# neither has to be imported here
+TRANSIENT_GRAPH_ERRORS = {
+    "ConnectionBroken",
+    "ConnectionUnavailable",
+    "ServiceUnavailable",
+    "SessionExpired",
+    "TransientError",
+    "WriteServiceUnavailable",
+}
+
+
+def _is_graph_error(error: Exception):
+    return type(error).__module__.split(".")[0] in ("py2neo", "neo4j")
+
+
+def classify_failure(error: Exception) -> str:
+    if isinstance(
+        error,
+        (requests.ConnectionError, requests.Timeout, ConnectionError, TimeoutError),
+    ):
+        return TRANSIENT
+
+    if isinstance(error, requests.HTTPError):
+        response = error.response
+        if response is not None and response.status_code in TRANSIENT_STATUS_CODES:
+            return TRANSIENT
+
+        return UPSTREAM
+
+    if _is_graph_error(error):
+        # Neo4j status codes look like Neo.TransientError.Transaction.DeadlockDetected
+        if type(error).__name__ in TRANSIENT_GRAPH_ERRORS or "TransientError" in str(
+            getattr(error, "code", "")
+        ):
+            return TRANSIENT
+
+        return GRAPH
+
+    if isinstance(error, PARSE_ERRORS):
+        return PARSE
+
+    return UNKNOWN
@@ -0,0 +1,221 @@
+from abc import ABC, abstractmethod
+import atexit
+import os
+import threading
+from typing import Iterator, List, NamedTuple, Optional
+
+from app import LOGGER, connect_graph, get_graph
+
+
+class Statement(NamedTuple):
+    query: str
+    parameters: dict
+    # set on bulk merges, ("nodes", merge key) or ("relationships", type,
+    # start key, end key, keys), for backends that do not run Cypher
+    merge: Optional[tuple] = None
+
+
+# the statements are the ones py2neo.bulk runs, so verify-query-plans checks
+# exactly what every backend executes
+def merge_nodes_statement(data: List[dict], merge_key: tuple) -> Statement:
+    from py2neo.cypher.queries import unwind_merge_nodes_query
+
+    return Statement(
+        *unwind_merge_nodes_query(data, merge_key), merge=("nodes", merge_key)
+    )
+
+
+def merge_relationships_statement(
+    data: list, rel_type: str, start_node_key: tuple, end_node_key: tuple, keys=None
+) -> Statement:
+    from py2neo.cypher.queries import unwind_merge_relationships_query
+
+    return Statement(
+        *unwind_merge_relationships_query(
+            data,
+            rel_type,
+            start_node_key=start_node_key,
+            end_node_key=end_node_key,
+            keys=keys,
+        ),
+        merge=("relationships", rel_type, start_node_key, end_node_key, keys or []),
+    )
+
+
+class GraphWriter(ABC):
+    # write() runs all statements in one managed transaction, retried as a
+    # whole on transient errors
+    @abstractmethod
+    def write(self, statements: List[Statement]):
+        pass
+
+    # stream() yields the rows of a read query as value sequences
+    @abstractmethod
+    def stream(self, query: str, parameters: dict = None) -> Iterator:
+        pass
+
+    @abstractmethod
+    def data(self, query: str, parameters: dict = None) -> List[dict]:
+        pass
+
+    def close(self):
+        pass
+
+    def run(self, query: str, parameters: dict = None):
+        self.write([Statement(query, parameters or {})])
+
+    def merge_nodes(self, data: List[dict], merge_key: tuple):
+        self.write([merge_nodes_statement(data, merge_key)])
+
+    def merge_relationships(
+        self,
+        data: list,
+        rel_type: str,
+        start_node_key: tuple,
+        end_node_key: tuple,
+        keys=None,
+    ):
+        self.write(
+            [
+                merge_relationships_statement(
+                    data, rel_type, start_node_key, end_node_key, keys
+                )
+            ]
+        )
+
+
+class Py2neoWriter(GraphWriter):
+    def __init__(self, database: str = None):
+        self.graph = connect_graph(database) if database else get_graph()
+
+    def write(self, statements: List[Statement]):
+        def work(tx):
+            for statement in statements:
+                tx.update(statement.query, statement.parameters)
+
+        self.graph.update(work)
+
+    def stream(self, query: str, parameters: dict = None) -> Iterator:
+        yield from self.graph.run(query, parameters)
+
+    def data(self, query: str, parameters: dict = None) -> List[dict]:
+        return self.graph.run(query, parameters).data()
+
+
+class BoltWriter(GraphWriter):
+    # uses the official neo4j driver: a neo4j:// URI routes writes to the
+    # cluster leader and reads to the followers
+    def __init__(
+        self,
+        database: str = None,
+        pool_size: int = 100,
+        fetch_size: int = 1000,
+        max_retry_time: float = 30.0,
+    ):
+        try:
+            import neo4j
+        except ImportError:
+            raise RuntimeError(
+                "the neo4j driver is required for the bolt backend, install it "
+                "with pip install pdbe-complexes-demo[bolt]"
+            )
+
+        self.database = database
+        self.fetch_size = fetch_size
+        self.read_access = neo4j.READ_ACCESS
+        self.driver = neo4j.GraphDatabase.driver(
+            os.getenv("NEO4J_URI", "bolt://localhost:7687"),
+            auth=(
+                os.getenv("NEO4J_USERNAME", "neo4j"),
+                os.getenv("NEO4J_PASSWORD", "neo4j"),
+            ),
+            max_connection_pool_size=pool_size,
+            max_transaction_retry_time=max_retry_time,
+        )
+
+    def _session(self, **kwargs):
+        return self.driver.session(
+            database=self.database, fetch_size=self.fetch_size, **kwargs
+        )
+
+    def write(self, statements: List[Statement]):
+        def work(tx):
+            for statement in statements:
+                tx.run(statement.query, statement.parameters).consume()
+
+        with self._session() as session:
+            session.execute_write(work)
+
+    def stream(self, query: str, parameters: dict = None) -> Iterator:
+        # records are pulled from the server fetch_size at a time while the
+        # caller iterates, so large results are never held in memory at once
+        with self._session(default_access_mode=self.read_access) as session:
+            with session.begin_transaction() as tx:
+                for record in tx.run(query, parameters):
+                    yield record.values()
+
+    def data(self, query: str, parameters: dict = None) -> List[dict]:
+        def work(tx):
+            return tx.run(query, parameters).data()
+
+        with self._session() as session:
+            return session.execute_read(work)
+
+    def close(self):
+        self.driver.close()
+
+
+def _memory_writer(**kwargs):
+    from app.memory_graph import MemoryWriter
+
+    return MemoryWriter(**kwargs)
+
+
+GRAPH_BACKENDS = {
+    "py2neo": Py2neoWriter,
+    "bolt": BoltWriter,
+    "memory": _memory_writer,
+}
+
+
+def create_writer(backend: str = None, **kwargs) -> GraphWriter:
+    backend = backend or os.getenv("GRAPH_BACKEND", "py2neo")
+
+    if backend not in GRAPH_BACKENDS:
+        raise ValueError(
+            f"Unknown graph backend {backend}, expected one of "
+            f"{', '.join(GRAPH_BACKENDS)}"
+        )
+
+    if backend == "bolt":
+        for key, env, cast in (
+            ("pool_size", "NEO4J_POOL_SIZE", int),
+            ("fetch_size", "NEO4J_FETCH_SIZE", int),
+            ("max_retry_time", "NEO4J_MAX_RETRY_TIME", float),
+        ):
+            if key not in kwargs and os.getenv(env):
+                kwargs[key] = cast(os.getenv(env))
+
+    if backend == "memory" and "path" not in kwargs:
+        kwargs["path"] = os.getenv("GRAPH_MEMORY_FILE")
+
+    LOGGER.info(f"Using the {backend} graph backend")
+
+    return GRAPH_BACKENDS[backend](**kwargs)
+
+
+_writer = None
+_writer_lock = threading.Lock()
+
+
+# the shared writer, created on first use like app.get_graph()
+def get_writer() -> GraphWriter:
+    global _writer
+
+    with _writer_lock:
+        if _writer is None:
+            _writer = create_writer()
+            # closes driver connections and saves the memory graph
+            atexit.register(_writer.close)
+
+    return _writer
@@ -0,0 +1,219 @@
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from datetime import datetime
+import heapq
+import json
+from pathlib import Path
+import random
+import signal
+import sys
+import threading
+from time import monotonic, sleep
+from typing import Iterable, Iterator, Optional
+
+from app import LOGGER
+from app.app import run_entry
+from app.failures import TRANSIENT, classify_failure
+from app.utils import open_text
+
+MAX_RETRIES = 3
+# seconds before the first retry, doubled for every further attempt
+RETRY_DELAY = 10.0
+MAX_RETRY_DELAY = 300.0
+# longest sleep while only retries are waiting, so an interrupt is noticed
+POLL_INTERVAL = 1.0
+
+
+def read_entries(entries: str) -> Iterator[str]:
+    # "-" for stdin, a file (.gz or not) with one entry per line or comma
+    # separated entry IDs; files are read lazily
+    if entries == "-":
+        lines = sys.stdin
+    elif Path(entries).is_file():
+        lines = open_text(entries)
+    else:
+        lines = entries.split(",")
+
+    try:
+        for line in lines:
+            entry_id = line.strip()
+            if entry_id:
+                yield entry_id
+    finally:
+        if hasattr(lines, "close") and lines is not sys.stdin:
+            lines.close()
+
+
+class EntryLoader:
+    def __init__(
+        self,
+        threads: int = 4,
+        retries: int = MAX_RETRIES,
+        retry_delay: float = RETRY_DELAY,
+        max_pending: Optional[int] = None,
+        uniprot_store=None,
+        rfam_store=None,
+        cancel: Optional[threading.Event] = None,
+    ):
+        self.threads = threads
+        self.retries = retries
+        self.retry_delay = retry_delay
+        # entries submitted to the pool at any time, the rest of the list is
+        # only read once they finish
+        self.max_pending = max(max_pending or 2 * threads, 1)
+        self.stores = {"uniprot_store": uniprot_store, "rfam_store": rfam_store}
+        self.entries = 0
+        self.loaded = 0
+        self.retried = 0
+        self.failures = {}
+        # set by the first SIGINT, or by the caller when the loader runs in
+        # another thread than the main one (eg. in app.pipeline)
+        self.cancel = cancel or threading.Event()
+
+    @property
+    def interrupted(self):
+        return self.cancel.is_set()
+
+    def _delay(self, attempt: int):
+        delay = min(self.retry_delay * 2 ** (attempt - 1), MAX_RETRY_DELAY)
+
+        # jitter, so entries failing together are not retried together
+        return delay * random.uniform(0.5, 1.0)
+
+    def _finish(self, future, entry_id: str, attempt: int, retries: list):
+        error = future.exception()
+
+        if error is None:
+            self.loaded += 1
+            return
+
+        category = classify_failure(error)
+        failure = {
+            "entry_id": entry_id,
+            "category": category,
+            "error": f"{type(error).__name__}: {error}",
+            "attempts": attempt,
+        }
+
+        if category == TRANSIENT and attempt <= self.retries:
+            delay = self._delay(attempt)
+            heapq.heappush(
+                retries, (monotonic() + delay, entry_id, attempt + 1, failure)
+            )
+            self.retried += 1
+            LOGGER.warning(
+                f"Entry {entry_id} failed ({category}), retry {attempt} of "
+                f"{self.retries} in {delay:.0f}s"
+            )
+            return
+
+        self.failures[entry_id] = failure
+        LOGGER.error(f"Entry {entry_id} failed ({category}) after {attempt} attempts")
+
+    def _interrupt(self, signum, frame):
+        LOGGER.warning(
+            "Interrupted, waiting for the entries in progress, interrupt again "
+            "to stop immediately"
+        )
+        self.cancel.set()
+        signal.signal(signal.SIGINT, signal.default_int_handler)
+
+    def load(self, entries: Iterable[str]):
+        # the first SIGINT stops reading entries and lets the ones in progress
+        # finish, so the failure report is still written
+        handler = None
+        if threading.current_thread() is threading.main_thread():
+            handler = signal.signal(signal.SIGINT, self._interrupt)
+
+        try:
+            self._load(iter(entries))
+        finally:
+            if handler is not None:
+                signal.signal(signal.SIGINT, handler)
+
+        LOGGER.info(
+            f"Loaded {self.loaded} of {self.entries} entries, {len(self.failures)} "
+            f"failed, {self.retried} retries"
+        )
+
+        return self.failures
+
+    def _load(self, entries: Iterator[str]):
+        # transient failures wait in a heap of (due time, entry, attempt,
+        # failure) and are resubmitted once due, while other entries load
+        retries = []
+        pending = {}
+        exhausted = False
+
+        with ThreadPoolExecutor(max_workers=self.threads) as executor:
+
+            def submit(entry_id: str, attempt: int):
+                future = executor.submit(run_entry, entry_id, **self.stores)
+                pending[future] = (entry_id, attempt)
+
+            while True:
+                while (
+                    not self.interrupted
+                    and retries
+                    and retries[0][0] <= monotonic()
+                    and len(pending) < self.max_pending
+                ):
+                    (_, entry_id, attempt, _) = heapq.heappop(retries)
+                    submit(entry_id, attempt)
+
+                while (
+                    not self.interrupted
+                    and not exhausted
+                    and len(pending) < self.max_pending
+                ):
+                    entry_id = next(entries, None)
+                    if entry_id is None:
+                        exhausted = True
+                        break
+
+                    self.entries += 1
+                    submit(entry_id, 1)
+
+                if self.interrupted:
+                    # entries waiting for a retry are reported as failed
+                    for (_, entry_id, _, failure) in retries:
+                        self.failures[entry_id] = failure
+                    retries = []
+
+                if not pending and not retries:
+                    break
+
+                timeout = max(retries[0][0] - monotonic(), 0) if retries else None
+
+                if not pending:
+                    sleep(min(timeout, POLL_INTERVAL))
+                    continue
+
+                (done, _) = wait(pending, timeout=timeout, return_when=FIRST_COMPLETED)
+                for future in done:
+                    (entry_id, attempt) = pending.pop(future)
+                    self._finish(future, entry_id, attempt, retries)
+
+    def write_failure_report(self, path: str):
+        categories = {}
+        for failure in self.failures.values():
+            categories[failure["category"]] = categories.get(failure["category"], 0) + 1
+
+        with open(path, "w") as f:
+            json.dump(
+                {
+                    "created": datetime.now().isoformat(),
+                    "interrupted": self.interrupted,
+                    "entries": self.entries,
+                    "loaded": self.loaded,
+                    "retries": self.retried,
+                    "failed": len(self.failures),
+                    "categories": categories,
+                    "failures": sorted(
+                        self.failures.values(), key=lambda x: x["entry_id"]
+                    ),
+                },
+                f,
+                indent=2,
+            )
+
+        LOGGER.info(f"Wrote failure report to {path}")
@@ -0,0 +1,99 @@
+from collections import defaultdict
+from datetime import datetime
+from functools import lru_cache
+import json
+import os
+from typing import Dict, Iterable, List
+
+from app import LOGGER
+from app.signature import Participant, signature_label
+
+LOOKUP_CACHE_SIZE = 4096
+
+
+def write_complex_index(path: str, dict_pdb_complex: dict, common_complexes: list):
+    same_as = defaultdict(list)
+    for pdb_complex_id, complex_portal_id in common_complexes:
+        same_as[pdb_complex_id].append(complex_portal_id)
+
+    data = {
+        "created": datetime.now().isoformat(),
+        "complexes": {
+            complex_id: {
+                "participants": [list(x) for x in signature],
+                "entries": entries,
+                "same_as": same_as.get(complex_id, []),
+            }
+            for complex_id, (signature, entries) in dict_pdb_complex.items()
+        },
+    }
+
+    # replace the file in one step, a running lookup never sees a partial index
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, "w") as f:
+        json.dump(data, f)
+    os.replace(tmp_path, path)
+
+    LOGGER.info(f"Wrote index of {len(dict_pdb_complex)} complexes to {path}")
+
+
+class ComplexLookup:
+    def __init__(self, path: str, cache_size: int = LOOKUP_CACHE_SIZE):
+        self.path = path
+        self.mtime = None
+        self.complexes = {}
+        self.participant_index = {}
+        self._find = lru_cache(maxsize=cache_size)(self._find_complexes)
+        self.refresh()
+
+    def refresh(self):
+        mtime = os.stat(self.path).st_mtime
+        if mtime == self.mtime:
+            return False
+
+        with open(self.path) as f:
+            data = json.load(f)
+
+        complexes = {}
+        participant_index = defaultdict(set)
+        for complex_id, item in data["complexes"].items():
+            signature = tuple(Participant(*x) for x in item["participants"])
+            complexes[complex_id] = {
+                "complex_id": complex_id,
+                "participants": signature_label(signature),
+                "entries": item["entries"],
+                "same_as": item["same_as"],
+            }
+            for participant in signature:
+                participant_index[participant.id].add(complex_id)
+
+        self.complexes = complexes
+        self.participant_index = {k: frozenset(v) for k, v in participant_index.items()}
+        self.mtime = mtime
+        self._find.cache_clear()
+
+        LOGGER.info(f"Loaded index of {len(complexes)} complexes from {self.path}")
+
+        return True
+
+    def _find_complexes(self, participants: frozenset):
+        complex_ids = None
+
+        for participant in sorted(
+            participants, key=lambda x: len(self.participant_index.get(x, ()))
+        ):
+            matches = self.participant_index.get(participant, frozenset())
+            complex_ids = matches if complex_ids is None else complex_ids & matches
+
+            if not complex_ids:
+                break
+
+        return tuple(sorted(complex_ids or ()))
+
+    def lookup(self, participants: Iterable[str]) -> List[Dict]:
+        complex_ids = self._find(frozenset(x.strip() for x in participants if x))
+
+        return [self.complexes[x] for x in complex_ids]
+
+    def batch_lookup(self, queries: Iterable[Iterable[str]]) -> List[List[Dict]]:
+        return [self.lookup(x) for x in queries]
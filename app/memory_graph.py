@@ -0,0 +1,513 @@
+from collections import defaultdict
+import os
+import pickle
+import threading
+from typing import Iterator, List
+
+from app import LOGGER
+from app.app import DROP_ENTRY_QUERY
+from app.graph import GraphWriter, Statement
+from app.pdbe_complex import (
+    ASSEMBLY_QUERY,
+    ASSEMBLY_SIGNATURE_QUERY,
+    COMMON_COMPLEX_QUERY,
+    COMPLEX_PORTAL_QUERY,
+    CREATE_PDB_COMPLEX_QUERY,
+    CREATE_SUBCOMPLEX_QUERY,
+    DROP_PDB_COMPLEX_QUERY,
+    DROP_SUBCOMPLEX_QUERY,
+    MERGE_ACCESSION_QUERY,
+    MERGE_ASSEMBLY_QUERY,
+    MERGE_ENTITY_QUERY,
+    MERGE_RFAM_QUERY,
+    MERGE_UNMAPPED_POLYMER_QUERY,
+    SUB_COMPLEX_CLOSURE_QUERY,
+    SUBCOMPLEX_QUERY,
+    SUPER_COMPLEX_CLOSURE_QUERY,
+)
+from app.schema import (
+    ASSEMBLY_KEY,
+    COMPLEX_KEY,
+    ENTITY_KEY,
+    ENTRY_KEY,
+    PDB_COMPLEX_KEY,
+    RFAM_KEY,
+    TAXONOMY_KEY,
+    UNIPROT_KEY,
+    UNMAPPED_POLYMER_KEY,
+)
+from app.utils import DROP_EVERYTHING_QUERY
+
+
+class MemoryGraph:
+    # nodes are referenced by (label, merge key value), every label has a
+    # single merge key (see app.schema); relationships are kept per (type,
+    # start, end) as a list of their properties, MERGE with properties in the
+    # pattern makes parallel relationships like in Neo4j
+    def __init__(self):
+        self.nodes = defaultdict(dict)
+        self.rels = {}
+        self.outgoing = defaultdict(set)
+        self.incoming = defaultdict(set)
+
+    def node(self, ref):
+        return self.nodes[ref[0]].get(ref[1])
+
+    def merge_node(self, merge_key: tuple, value, properties: dict = None):
+        (label, key) = merge_key
+        node = self.nodes[label].setdefault(value, {key: value})
+
+        # SET += removes properties set to null
+        for name, x in (properties or {}).items():
+            if x is None:
+                node.pop(name, None)
+            else:
+                node[name] = x
+
+        return (label, value)
+
+    def merge_rel(
+        self, rel_type: str, start, end, properties: dict = None, match: dict = None
+    ):
+        # match holds the properties of the MERGE pattern, properties the SET
+        # ones
+        rels = self.rels.setdefault((rel_type, start, end), [])
+        match = match or {}
+        rel = next(
+            (x for x in rels if all(x.get(k) == v for k, v in match.items())), None
+        )
+        if rel is None:
+            rel = {k: v for k, v in match.items() if v is not None}
+            rels.append(rel)
+
+        rel.update({k: v for k, v in (properties or {}).items() if v is not None})
+        self.outgoing[start].add((rel_type, end))
+        self.incoming[end].add((rel_type, start))
+
+    def delete_rel(self, rel_type: str, start, end):
+        self.rels.pop((rel_type, start, end), None)
+        self.outgoing[start].discard((rel_type, end))
+        self.incoming[end].discard((rel_type, start))
+
+    def delete_node(self, ref):
+        for rel_type, end in list(self.outgoing.pop(ref, ())):
+            self.delete_rel(rel_type, ref, end)
+        for rel_type, start in list(self.incoming.pop(ref, ())):
+            self.delete_rel(rel_type, start, ref)
+
+        self.nodes[ref[0]].pop(ref[1], None)
+
+    def out(self, ref, rel_type: str, label: str):
+        # (end node ref, relationship properties) of matching relationships
+        return [
+            (end, rel)
+            for x, end in self.outgoing.get(ref, ())
+            if x == rel_type and end[0] == label
+            for rel in self.rels[(rel_type, ref, end)]
+        ]
+
+    def into(self, ref, rel_type: str, label: str):
+        return [
+            (start, rel)
+            for x, start in self.incoming.get(ref, ())
+            if x == rel_type and start[0] == label
+            for rel in self.rels[(rel_type, start, ref)]
+        ]
+
+    def refs(self, label: str):
+        return [(label, x) for x in self.nodes[label]]
+
+
+def _distinct(values):
+    result = []
+    for x in values:
+        if x is not None and x not in result:
+            result.append(x)
+
+    return result
+
+
+class MemoryWriter(GraphWriter):
+    # runs the pipeline without Neo4j: bulk merges are applied from the
+    # statement arguments and every other query the pipeline runs has a
+    # Python implementation below, keyed by the query constant. With a path
+    # the graph is loaded from and saved to a pickle file, so it is kept
+    # between CLI commands
+    def __init__(self, path: str = None):
+        self.path = path
+        self.lock = threading.RLock()
+        self.graph = MemoryGraph()
+
+        if path and os.path.exists(path):
+            with open(path, "rb") as f:
+                self.graph = pickle.load(f)
+
+            LOGGER.info(f"Loaded in-memory graph from {path}")
+
+        self.writes = {
+            CREATE_PDB_COMPLEX_QUERY: self._create_pdb_complex,
+            MERGE_ACCESSION_QUERY: self._merge_accession,
+            MERGE_ENTITY_QUERY: self._merge_entity,
+            MERGE_ASSEMBLY_QUERY: self._merge_assembly,
+            MERGE_RFAM_QUERY: self._merge_rfam,
+            MERGE_UNMAPPED_POLYMER_QUERY: self._merge_unmapped_polymer,
+            COMMON_COMPLEX_QUERY: self._common_complex,
+            CREATE_SUBCOMPLEX_QUERY: self._create_subcomplex,
+            DROP_PDB_COMPLEX_QUERY: self._drop_pdb_complexes,
+            DROP_SUBCOMPLEX_QUERY: self._drop_subcomplexes,
+            DROP_ENTRY_QUERY: self._drop_entry,
+            DROP_EVERYTHING_QUERY: self._drop_everything,
+        }
+        self.reads = {
+            COMPLEX_PORTAL_QUERY: self._complex_portal_rows,
+            ASSEMBLY_SIGNATURE_QUERY: self._assembly_signature_rows,
+            ASSEMBLY_QUERY: self._assembly_rows,
+            SUPER_COMPLEX_CLOSURE_QUERY: self._super_complexes,
+            SUB_COMPLEX_CLOSURE_QUERY: self._sub_complexes,
+            SUBCOMPLEX_QUERY: self._subcomplex_rows,
+        }
+
+    def _handler(self, handlers: dict, query: str):
+        if query not in handlers:
+            raise NotImplementedError(
+                f"Query not supported by the memory backend: {query.strip()[:80]}"
+            )
+
+        return handlers[query]
+
+    def write(self, statements: List[Statement]):
+        with self.lock:
+            for statement in statements:
+                if statement.merge is None:
+                    self._handler(self.writes, statement.query)(statement.parameters)
+                elif statement.merge[0] == "nodes":
+                    self._merge_nodes(
+                        statement.parameters["data"], *statement.merge[1:]
+                    )
+                else:
+                    self._merge_relationships(
+                        statement.parameters["data"], *statement.merge[1:]
+                    )
+
+    def stream(self, query: str, parameters: dict = None) -> Iterator:
+        with self.lock:
+            rows = self._handler(self.reads, query)(parameters or {})
+
+        yield from (tuple(x.values()) for x in rows)
+
+    def data(self, query: str, parameters: dict = None) -> List[dict]:
+        with self.lock:
+            return self._handler(self.reads, query)(parameters or {})
+
+    def close(self):
+        if not self.path:
+            return
+
+        with self.lock:
+            tmp_path = f"{self.path}.tmp"
+            with open(tmp_path, "wb") as f:
+                pickle.dump(self.graph, f, protocol=pickle.HIGHEST_PROTOCOL)
+            os.replace(tmp_path, self.path)
+
+        LOGGER.info(f"Saved in-memory graph to {self.path}")
+
+    # py2neo.bulk merges
+
+    def _merge_nodes(self, data: List[dict], merge_key: tuple):
+        for row in data:
+            self.graph.merge_node(merge_key, row[merge_key[1]], row)
+
+    def _merge_relationships(
+        self, data: list, rel_type: str, start_key: tuple, end_key: tuple, keys: list
+    ):
+        for start_value, values, end_value in data:
+            start = (start_key[0], start_value)
+            end = (end_key[0], end_value)
+
+            if self.graph.node(start) is None or self.graph.node(end) is None:
+                continue
+
+            self.graph.merge_rel(rel_type, start, end, dict(zip(keys, values)))
+
+    # PDBComplex writes
+
+    def _create_pdb_complex(self, parameters):
+        for row in parameters["pdb_complex_params_list"]:
+            self.graph.merge_node(
+                PDB_COMPLEX_KEY,
+                row["complex_id"],
+                {"PARTICIPANT_COUNT": row["participant_count"]},
+            )
+
+    def _merge_participants(self, rows, merge_key: tuple, row_key: str, merge=False):
+        for row in rows:
+            ref = (merge_key[0], row[row_key])
+
+            if merge:
+                self.graph.merge_node(merge_key, row[row_key])
+            elif self.graph.node(ref) is None:
+                continue
+
+            complex = (PDB_COMPLEX_KEY[0], row["complex_id"])
+            if self.graph.node(complex) is None:
+                continue
+
+            # STOICHIOMETRY is in the MERGE pattern, so a participant gets a
+            # relationship per value (eg. two entities of one UniProt accession)
+            match = (
+                {"STOICHIOMETRY": row["stoichiometry"]}
+                if "stoichiometry" in row
+                else {}
+            )
+            self.graph.merge_rel("IS_PART_OF_PDB_COMPLEX", ref, complex, match=match)
+
+    def _merge_accession(self, parameters):
+        self._merge_participants(
+            parameters["accession_params_list"], UNIPROT_KEY, "accession"
+        )
+
+    def _merge_entity(self, parameters):
+        self._merge_participants(
+            parameters["entity_params_list"], ENTITY_KEY, "entity_uniqid"
+        )
+
+    def _merge_assembly(self, parameters):
+        self._merge_participants(
+            parameters["assembly_params_list"], ASSEMBLY_KEY, "assembly_id"
+        )
+
+    def _merge_rfam(self, parameters):
+        self._merge_participants(parameters["rfam_params_list"], RFAM_KEY, "rfam_acc")
+
+    def _merge_unmapped_polymer(self, parameters):
+        self._merge_participants(
+            parameters["unmapped_polymer_params_list"],
+            UNMAPPED_POLYMER_KEY,
+            "polymer_type",
+            merge=True,
+        )
+
+    def _create_between(
+        self, rows, rel_type, start_key, start_field, end_key, end_field
+    ):
+        for row in rows:
+            start = (start_key[0], row[start_field])
+            end = (end_key[0], row[end_field])
+
+            if self.graph.node(start) is not None and self.graph.node(end) is not None:
+                self.graph.merge_rel(rel_type, start, end)
+
+    def _common_complex(self, parameters):
+        self._create_between(
+            parameters["complex_params_list"],
+            "SAME_AS",
+            PDB_COMPLEX_KEY,
+            "pdb_complex_id",
+            COMPLEX_KEY,
+            "complex_portal_id",
+        )
+
+    def _create_subcomplex(self, parameters):
+        self._create_between(
+            parameters["subcomplex_params_list"],
+            "IS_SUB_COMPLEX_OF",
+            PDB_COMPLEX_KEY,
+            "sub_complex_id",
+            PDB_COMPLEX_KEY,
+            "complex_id",
+        )
+
+    def _drop_pdb_complexes(self, parameters):
+        for ref in self.graph.refs(PDB_COMPLEX_KEY[0]):
+            self.graph.delete_node(ref)
+
+    def _drop_subcomplexes(self, parameters):
+        for ref in self.graph.refs(PDB_COMPLEX_KEY[0]):
+            for end, _ in self.graph.out(ref, "IS_SUB_COMPLEX_OF", PDB_COMPLEX_KEY[0]):
+                self.graph.delete_rel("IS_SUB_COMPLEX_OF", ref, end)
+
+    def _drop_entry(self, parameters):
+        entry = (ENTRY_KEY[0], parameters["entry_id"])
+        refs = set()
+
+        for entity, _ in self.graph.out(entry, "HAS_ENTITY", ENTITY_KEY[0]):
+            for assembly, _ in self.graph.out(
+                entity, "IS_PART_OF_ASSEMBLY", ASSEMBLY_KEY[0]
+            ):
+                refs.update((entry, entity, assembly))
+
+        for ref in refs:
+            self.graph.delete_node(ref)
+
+    def _drop_everything(self, parameters):
+        self.graph = MemoryGraph()
+
+    # analysis reads, rows are dicts in the order of the RETURN clause
+
+    def _complex_portal_rows(self, parameters):
+        rows = []
+
+        for complex in self.graph.refs(COMPLEX_KEY[0]):
+            participants = _distinct(
+                [unp[1], rel.get("STOICHIOMETRY"), tax[1]]
+                for unp, rel in self.graph.into(
+                    complex, "IS_PART_OF_COMPLEX", UNIPROT_KEY[0]
+                )
+                for tax, _ in self.graph.out(unp, "HAS_TAXONOMY", TAXONOMY_KEY[0])
+            )
+
+            if not participants:
+                continue
+
+            entries = _distinct(
+                x[1]
+                for x, _ in self.graph.into(complex, "IS_PART_OF_COMPLEX", ENTRY_KEY[0])
+            )
+            rows.append(
+                {
+                    "complex_id": complex[1],
+                    "participants": participants,
+                    "entries": entries,
+                }
+            )
+
+        return rows
+
+    def _participant(self, entity, rel, uniprot, tax, rfam):
+        polymer_type = self.graph.node(entity).get("POLYMER_TYPE")
+
+        if uniprot is not None:
+            return ["uniprot", uniprot[1], rel.get("NUMBER_OF_CHAINS"), tax[1]]
+        if rfam is not None:
+            return ["rfam", rfam[1], None, None]
+        if polymer_type == "R":
+            return ["unmapped", "RNA", None, None]
+        if polymer_type == "D":
+            return ["unmapped", "DNA", None, None]
+        if polymer_type == "D/R":
+            return ["unmapped", "DNA/RNA", None, None]
+        if polymer_type == "P":
+            return ["entity", entity[1], rel.get("NUMBER_OF_CHAINS"), None]
+
+        return None
+
+    def _assembly_signature_rows(self, parameters):
+        groups = {}
+
+        for assembly in self.graph.refs(ASSEMBLY_KEY[0]):
+            node = self.graph.node(assembly)
+            if node.get("PREFERED") != "True" or "SIGNATURE_HASH" not in node:
+                continue
+
+            group = groups.setdefault(
+                node["SIGNATURE_HASH"],
+                {
+                    "signature_hash": node["SIGNATURE_HASH"],
+                    "signature": node["SIGNATURE"],
+                    "assemblies": [],
+                },
+            )
+            group["assemblies"].append(assembly[1])
+
+        return list(groups.values())
+
+    def _assembly_rows(self, parameters):
+        rows = []
+
+        for assembly in self.graph.refs(ASSEMBLY_KEY[0]):
+            node = self.graph.node(assembly)
+            if node.get("PREFERED") != "True" or "SIGNATURE_HASH" in node:
+                continue
+
+            entities = [
+                (entity, rel)
+                for entity, rel in self.graph.into(
+                    assembly, "IS_PART_OF_ASSEMBLY", ENTITY_KEY[0]
+                )
+                if self.graph.node(entity).get("TYPE") == "p"
+            ]
+            if not entities:
+                continue
+
+            participants = []
+            for entity, rel in entities:
+                uniprots = [
+                    (uniprot, tax)
+                    for uniprot, mapping in self.graph.out(
+                        entity, "HAS_UNIPROT", UNIPROT_KEY[0]
+                    )
+                    if mapping.get("BEST_MAPPING") == "1"
+                    for tax, _ in self.graph.out(
+                        uniprot, "HAS_TAXONOMY", TAXONOMY_KEY[0]
+                    )
+                ] or [(None, None)]
+                rfams = [
+                    x for x, _ in self.graph.out(entity, "HAS_RFAM", RFAM_KEY[0])
+                ] or [None]
+
+                participants.extend(
+                    self._participant(entity, rel, uniprot, tax, rfam)
+                    for uniprot, tax in uniprots
+                    for rfam in rfams
+                )
+
+            rows.append(
+                {"assembly_id": assembly[1], "participants": _distinct(participants)}
+            )
+
+        return rows
+
+    def _subcomplex_rows(self, parameters):
+        rows = []
+
+        for complex_id in parameters["source_complex_ids"]:
+            src = (PDB_COMPLEX_KEY[0], complex_id)
+            if self.graph.node(src) is None:
+                continue
+
+            count = self.graph.node(src)["PARTICIPANT_COUNT"]
+            shared = defaultdict(int)
+
+            for rel_type, participant in self.graph.incoming.get(src, ()):
+                if rel_type != "IS_PART_OF_PDB_COMPLEX" or participant[0] == "Assembly":
+                    continue
+
+                candidates = [
+                    (dest, rel.get("STOICHIOMETRY", -1))
+                    for dest, rel in self.graph.out(
+                        participant, rel_type, PDB_COMPLEX_KEY[0]
+                    )
+                    if self.graph.node(dest)["PARTICIPANT_COUNT"] > count
+                ]
+                for rel in self.graph.rels[(rel_type, participant, src)]:
+                    for dest, stoichiometry in candidates:
+                        if stoichiometry == rel.get("STOICHIOMETRY", -1):
+                            shared[dest] += 1
+
+            rows.extend(
+                {"sub_complex_id": complex_id, "complex_id": dest[1]}
+                for dest, x in shared.items()
+                if x == count
+            )
+
+        return rows
+
+    def _closure(self, complex_id: str, neighbours):
+        seen = set()
+        pending = [(PDB_COMPLEX_KEY[0], complex_id)]
+
+        while pending:
+            for ref, _ in neighbours(
+                pending.pop(), "IS_SUB_COMPLEX_OF", PDB_COMPLEX_KEY[0]
+            ):
+                if ref not in seen:
+                    seen.add(ref)
+                    pending.append(ref)
+
+        return [{"complex_id": x[1]} for x in sorted(seen)]
+
+    def _super_complexes(self, parameters):
+        return self._closure(parameters["complex_id"], self.graph.out)
+
+    def _sub_complexes(self, parameters):
+        return self._closure(parameters["complex_id"], self.graph.into)
@@ -1,16 +1,18 @@
+from typing import Optional
+
 from pydantic import BaseModel
 
 
 class Entry(BaseModel):
     ID: str
-    TITLE: str = None
+    TITLE: Optional[str] = None
 
 
 class Entity(BaseModel):
     UNIQID: str
     ID: int
     DESCRIPTION: str
-    POLYMER_TYPE: str = None
+    POLYMER_TYPE: Optional[str] = None
     TYPE: str
 
 
@@ -19,6 +21,9 @@ class Assembly(BaseModel):
     ID: int
     PREFERED: str
     COMPOSITION: str
+    # participant signature, see app.signature
+    SIGNATURE: Optional[str] = None
+    SIGNATURE_HASH: Optional[str] = None
 
 
 class Complex(BaseModel):
@@ -29,13 +34,13 @@ class Complex(BaseModel):
 
 class UniProt(BaseModel):
     ACCESSION: str
-    NAME: str = None
-    DESCR: str = None
+    NAME: Optional[str] = None
+    DESCR: Optional[str] = None
 
 
 class RfamFamily(BaseModel):
     RFAM_ACC: str
-    DESCRIPTION: str = None
+    DESCRIPTION: Optional[str] = None
 
 
 class Taxonomy(BaseModel):
@@ -1,31 +1,61 @@
+from concurrent.futures import ThreadPoolExecutor
 import csv
 from datetime import datetime
-import re
 
-from app import LOGGER, neo4j_graph
+from app import LOGGER
+from app.graph import get_writer
+from app.lookup import write_complex_index
+from app.signature import (
+    ENTITY,
+    RFAM,
+    UNIPROT,
+    UNMAPPED,
+    Participant,
+    decode_signature,
+    make_signature,
+    parse_stoichiometry,
+    signature_label,
+)
+from app.similarity import find_near_matches
+from app.snapshot import write_snapshot
+from app.subcomplex import SUBCOMPLEX_ENGINES, all_pairs, covering_pairs, find_supersets
+from app.utils import batched
+
+# PDBComplex nodes are created up front, the participant queries below only
+# match them; the participant count prunes the Cypher sub complex search
+CREATE_PDB_COMPLEX_QUERY = """
+WITH $pdb_complex_params_list AS batch
+UNWIND batch AS row
+CREATE (c:PDBComplex {
+    COMPLEX_ID:row.complex_id,
+    PARTICIPANT_COUNT:row.participant_count
+})
+"""
 
 MERGE_ACCESSION_QUERY = """
 WITH $accession_params_list AS batch
 UNWIND batch AS row
 MATCH (u:UniProt {ACCESSION:row.accession})
-MERGE (c:PDBComplex {COMPLEX_ID:row.complex_id})
+WITH row, u
+MATCH (c:PDBComplex {COMPLEX_ID:row.complex_id})
 MERGE (c)<-[:IS_PART_OF_PDB_COMPLEX {STOICHIOMETRY:row.stoichiometry}]-(u)
 """
 
 MERGE_ENTITY_QUERY = """
 WITH $entity_params_list AS batch
 UNWIND batch AS row
-MATCH (e:Entry {ID:row.entry_id})-[:HAS_ENTITY]->(en:Entity {ID:row.entity_id})
-MERGE (c:PDBComplex {COMPLEX_ID:row.complex_id})
+MATCH (en:Entity {UNIQID:row.entity_uniqid})
+WITH row, en
+MATCH (c:PDBComplex {COMPLEX_ID:row.complex_id})
 MERGE (c)<-[:IS_PART_OF_PDB_COMPLEX {STOICHIOMETRY:row.stoichiometry}]-(en)
 """
 
 MERGE_ASSEMBLY_QUERY = """
 WITH $assembly_params_list AS batch
 UNWIND batch AS row
-MATCH (e:Entry {ID:row.entry_id})-[:HAS_ENTITY]->(:Entity)-
-    [:IS_PART_OF_ASSEMBLY]->(assembly:Assembly {UNIQID:row.assembly_id})
-MERGE (c:PDBComplex {COMPLEX_ID:row.complex_id})
+MATCH (assembly:Assembly {UNIQID:row.assembly_id})
+WITH row, assembly
+MATCH (c:PDBComplex {COMPLEX_ID:row.complex_id})
 MERGE (c)<-[:IS_PART_OF_PDB_COMPLEX]-(assembly)
 """
 
@@ -33,16 +63,17 @@ MERGE_RFAM_QUERY = """
 WITH $rfam_params_list AS batch
 UNWIND batch AS row
 MATCH (rfam:RfamFamily {RFAM_ACC:row.rfam_acc})
-MERGE (c:PDBComplex {COMPLEX_ID:row.complex_id})
+WITH row, rfam
+MATCH (c:PDBComplex {COMPLEX_ID:row.complex_id})
 MERGE (c)<-[:IS_PART_OF_PDB_COMPLEX]-(rfam)
 """
 
 COMMON_COMPLEX_QUERY = """
 WITH $complex_params_list AS batch
 UNWIND batch AS row
-MATCH
-    (p:PDBComplex {COMPLEX_ID:row.pdb_complex_id}),
-    (c:Complex {COMPLEX_ID:row.complex_portal_id})
+MATCH (p:PDBComplex {COMPLEX_ID:row.pdb_complex_id})
+WITH row, p
+MATCH (c:Complex {COMPLEX_ID:row.complex_portal_id})
 CREATE (p)-[:SAME_AS]->(c)
 """
 
@@ -50,18 +81,172 @@ MERGE_UNMAPPED_POLYMER_QUERY = """
 WITH $unmapped_polymer_params_list AS batch
 UNWIND batch AS row
 MERGE (up:UnmappedPolymer {TYPE:row.polymer_type})
-MERGE (c:PDBComplex {COMPLEX_ID:row.complex_id})
+WITH row, up
+MATCH (c:PDBComplex {COMPLEX_ID:row.complex_id})
 MERGE (c)<-[:IS_PART_OF_PDB_COMPLEX]-(up)
 """
 
+COMPLEX_PORTAL_QUERY = """
+MATCH
+  (complex:Complex)<-[rel:IS_PART_OF_COMPLEX]-(unp:UniProt)-[:HAS_TAXONOMY]->
+    (tax:Taxonomy)
+WITH
+  complex,
+  COLLECT(DISTINCT [unp.ACCESSION, rel.STOICHIOMETRY, tax.TAX_ID]) AS participants
+OPTIONAL MATCH
+  (complex)<-[:IS_PART_OF_COMPLEX]-(entry:Entry)
+RETURN
+  complex.COMPLEX_ID AS complex_id,
+  participants,
+  COLLECT(DISTINCT entry.ID) AS entries
+"""
+
+# preferred assemblies grouped on the signature stored by app.app.Entry
+ASSEMBLY_SIGNATURE_QUERY = """
+MATCH (assembly:Assembly {PREFERED: 'True'})
+WHERE assembly.SIGNATURE_HASH IS NOT NULL
+WITH assembly.SIGNATURE_HASH AS signature_hash, COLLECT(assembly) AS assemblies
+RETURN
+    signature_hash,
+    HEAD(assemblies).SIGNATURE AS signature,
+    [x IN assemblies | x.UNIQID] AS assemblies
+"""
+
+# assemblies of entries loaded before signatures were stored; participants are
+# returned as [kind, id, stoichiometry, tax_id] lists, with the kinds defined in
+# app.signature
+ASSEMBLY_QUERY = """
+MATCH
+    (assembly:Assembly {PREFERED: 'True'})<-[rel:IS_PART_OF_ASSEMBLY]-
+    (entity:Entity {TYPE:'p'})
+WHERE assembly.SIGNATURE_HASH IS NULL
+OPTIONAL MATCH
+    (entity)-[:HAS_UNIPROT {BEST_MAPPING:'1'}]->(uniprot:UniProt)-
+    [:HAS_TAXONOMY]->(tax:Taxonomy)
+OPTIONAL MATCH (entity)-[:HAS_RFAM]->(rfam:RfamFamily)
+WITH assembly,
+CASE
+    WHEN uniprot IS NOT NULL
+        THEN ['uniprot', uniprot.ACCESSION, rel.NUMBER_OF_CHAINS, tax.TAX_ID]
+    WHEN rfam IS NOT NULL
+        THEN ['rfam', rfam.RFAM_ACC, null, null]
+    WHEN entity.POLYMER_TYPE = 'R'
+        THEN ['unmapped', 'RNA', null, null]
+    WHEN entity.POLYMER_TYPE = 'D'
+        THEN ['unmapped', 'DNA', null, null]
+    WHEN entity.POLYMER_TYPE = 'D/R'
+        THEN ['unmapped', 'DNA/RNA', null, null]
+    WHEN entity.POLYMER_TYPE = 'P'
+        THEN ['entity', entity.UNIQID, rel.NUMBER_OF_CHAINS, null]
+END AS participant
+RETURN assembly.UNIQID AS assembly_id, COLLECT(DISTINCT participant) AS participants
+"""
+
+CREATE_SUBCOMPLEX_QUERY = """
+WITH $subcomplex_params_list AS batch
+UNWIND batch AS row
+MATCH (src_complex:PDBComplex {COMPLEX_ID:row.sub_complex_id})
+WITH row, src_complex
+MATCH (dest_complex:PDBComplex {COMPLEX_ID:row.complex_id})
+CREATE (dest_complex)<-[:IS_SUB_COMPLEX_OF]-(src_complex)
+"""
+
+# sub complexes found in the database instead of from the signatures in
+# memory, for a batch of source complexes: only complexes with more
+# participants can contain the source, and a candidate is kept when it shares
+# every participant of the source with the same stoichiometry (Rfam and
+# unmapped polymers have none); assemblies are linked to PDBComplex nodes too,
+# but are not participants
+SUBCOMPLEX_QUERY = """
+WITH $source_complex_ids AS batch
+UNWIND batch AS complex_id
+MATCH (src:PDBComplex {COMPLEX_ID:complex_id})
+    <-[rel1:IS_PART_OF_PDB_COMPLEX]-(participant)
+WHERE NOT participant:Assembly
+WITH src, rel1, participant
+MATCH (participant)-[rel2:IS_PART_OF_PDB_COMPLEX]->(dest:PDBComplex)
+WHERE dest.PARTICIPANT_COUNT > src.PARTICIPANT_COUNT
+    AND coalesce(rel2.STOICHIOMETRY, -1) = coalesce(rel1.STOICHIOMETRY, -1)
+WITH src, dest, count(participant) AS shared
+WHERE shared = src.PARTICIPANT_COUNT
+RETURN src.COMPLEX_ID AS sub_complex_id, dest.COMPLEX_ID AS complex_id
+"""
+
+# with transitive reduction only the covering relations are stored, these
+# rebuild the full closure for one complex
+SUPER_COMPLEX_CLOSURE_QUERY = """
+MATCH
+    (:PDBComplex {COMPLEX_ID:$complex_id})-[:IS_SUB_COMPLEX_OF*]->
+    (complex:PDBComplex)
+RETURN DISTINCT complex.COMPLEX_ID AS complex_id
+"""
+
+SUB_COMPLEX_CLOSURE_QUERY = """
+MATCH
+    (:PDBComplex {COMPLEX_ID:$complex_id})<-[:IS_SUB_COMPLEX_OF*]-
+    (complex:PDBComplex)
+RETURN DISTINCT complex.COMPLEX_ID AS complex_id
+"""
+
+DROP_PDB_COMPLEX_QUERY = "MATCH (p:PDBComplex) DETACH DELETE p"
+
+DROP_SUBCOMPLEX_QUERY = (
+    "MATCH (:PDBComplex)-[r:IS_SUB_COMPLEX_OF]->(:PDBComplex) DELETE r"
+)
+
+# batched statements, each row is looked up through a unique node key;
+# name -> (query, batch parameter)
+MERGE_QUERIES = {
+    "create_pdb_complex": (CREATE_PDB_COMPLEX_QUERY, "pdb_complex_params_list"),
+    "merge_accession": (MERGE_ACCESSION_QUERY, "accession_params_list"),
+    "merge_entity": (MERGE_ENTITY_QUERY, "entity_params_list"),
+    "merge_assembly": (MERGE_ASSEMBLY_QUERY, "assembly_params_list"),
+    "merge_rfam": (MERGE_RFAM_QUERY, "rfam_params_list"),
+    "merge_unmapped_polymer": (
+        MERGE_UNMAPPED_POLYMER_QUERY,
+        "unmapped_polymer_params_list",
+    ),
+    "common_complex": (COMMON_COMPLEX_QUERY, "complex_params_list"),
+    "create_subcomplex": (CREATE_SUBCOMPLEX_QUERY, "subcomplex_params_list"),
+    "subcomplexes": (SUBCOMPLEX_QUERY, "source_complex_ids"),
+}
+
+# whole-graph statements of the analysis, these read every Complex or Assembly
+# node by design
+ANALYSIS_QUERIES = {
+    "complex_portal_participants": COMPLEX_PORTAL_QUERY,
+    "assembly_signatures": ASSEMBLY_SIGNATURE_QUERY,
+    "assembly_participants": ASSEMBLY_QUERY,
+}
+
+CLEANUP_QUERIES = {
+    "drop_pdb_complexes": DROP_PDB_COMPLEX_QUERY,
+    "drop_subcomplexes": DROP_SUBCOMPLEX_QUERY,
+}
+
+
+SUBCOMPLEX_BATCH_SIZE = 10000
+# rows per transaction of the PDBComplex node and relationship writes
+PDB_COMPLEX_BATCH_SIZE = 10000
+# source complexes per SUBCOMPLEX_QUERY transaction, and queries run at a time
+SUBCOMPLEX_QUERY_BATCH_SIZE = 1000
+SUBCOMPLEX_QUERY_THREADS = 4
+
 
 class PDBeComplex:
-    def __init__(self, outcsv):
-        self._driver = neo4j_graph
+    def __init__(self, outcsv, transitive_reduction=False, subcomplex_engine="python"):
+        if subcomplex_engine not in SUBCOMPLEX_ENGINES:
+            raise ValueError(f"Unknown sub complex engine {subcomplex_engine}")
+
+        self._writer = get_writer()
         self.complex_subcomplex_outcsv = outcsv
+        self.transitive_reduction = transitive_reduction
+        self.subcomplex_engine = subcomplex_engine
         self.dict_complex_portal_id = {}
         self.dict_complex_portal_entries = {}
+        self.complex_portal_signatures = {}
         self.dict_pdb_complex = {}
+        self.dict_pdb_complex_assemblies = {}
         self.common_complexes = []
 
     def process_complex_data(self):
@@ -75,198 +260,131 @@ class PDBeComplex:
         LOGGER.info("Querying Complex Portal data")
 
         # read complex portal data from graph
-        query = """
-        MATCH
-          (complex:Complex)<-[rel:IS_PART_OF_COMPLEX]-(unp:UniProt)-[:HAS_TAXONOMY]->
-            (tax:Taxonomy)
-        OPTIONAL MATCH
-          (complex)<-[:IS_PART_OF_COMPLEX]-(entry:Entry)
-        WITH
-          complex.COMPLEX_ID AS complex_id,
-          unp.ACCESSION +'_' + rel.STOICHIOMETRY +'_' +tax.TAX_ID AS uniq_accessions,
-          COLLECT(entry.ID) AS entries ORDER BY uniq_accessions
-        WITH
-          complex_id AS complex_id,
-          COLLECT(DISTINCT uniq_accessions) AS uniq_accessions,
-          entries
-        WITH
-          complex_id AS complex_id,
-          REDUCE(s = HEAD(uniq_accessions),
-          n in TAIL(uniq_accessions) | s +',' +n) AS uniq_accessions,
-          entries
-        RETURN
-          complex_id,
-          uniq_accessions,
-          REDUCE(s = HEAD(entries), n in TAIL(entries) | s +',' +n)
-        """  # noqa: B950
-
-        mappings = self._driver.run(query)
+        mappings = self._writer.stream(COMPLEX_PORTAL_QUERY)
         for row in mappings:
-            (complex_id, accessions, entries) = row
-            self.dict_complex_portal_id[accessions] = complex_id
+            (complex_id, participants, entries) = row
+            signature = make_signature(
+                Participant(UNIPROT, accession, parse_stoichiometry(stoich), tax_id)
+                for accession, stoich, tax_id in participants
+            )
+            self.dict_complex_portal_id[signature] = complex_id
             self.dict_complex_portal_entries[complex_id] = entries
+            self.complex_portal_signatures[complex_id] = signature
 
         # drop PDB_Complex nodes if any
         LOGGER.info("Removing PDBComplex nodes, if any - START")
-        self._driver.run("MATCH (p:PDBComplex) DETACH DELETE p")
+        self._writer.run(DROP_PDB_COMPLEX_QUERY)
         LOGGER.info("Removing PDBComplex nodes, if any - DONE")
 
         LOGGER.info("Querying PDB Assembly data")
 
-        # read assembly data from graph and accumulate unique patterns
-        query = """
-        MATCH
-            (assembly:Assembly {PREFERED: 'True'})<-[rel:IS_PART_OF_ASSEMBLY]-
-            (entity:Entity {TYPE:'p'})
-        WITH assembly, rel, entity
-        OPTIONAL MATCH
-            (entity)-[:HAS_UNIPROT {BEST_MAPPING:'1'}]->(uniprot:UniProt)-
-            [:HAS_TAXONOMY]->(tax:Taxonomy)
-        OPTIONAL MATCH (entity)-[:HAS_RFAM]->(rfam:RfamFamily)
-        WITH assembly.UNIQID AS assembly_id,
-        CASE uniprot
-            WHEN null
-                THEN
-                    CASE rfam
-                        WHEN null
-                            THEN
-                                CASE entity.POLYMER_TYPE
-                                    WHEN 'R'
-                                        THEN 'RNA' +':UNMAPPED'
-                                    WHEN 'D'
-                                        THEN 'DNA' +':UNMAPPED'
-                                    WHEN 'D/R'
-                                        THEN 'DNA/RNA' +':UNMAPPED'
-                                    WHEN 'P'
-                                        THEN
-                                        'NA_' +entity.UNIQID +'_'
-                                        +rel.NUMBER_OF_CHAINS
-                                END
-                        ELSE
-                            rfam.RFAM_ACC
-                    END
-            ELSE uniprot.ACCESSION +'_' +rel.NUMBER_OF_CHAINS +'_' +tax.TAX_ID
-        END AS accession ORDER BY accession
-        WITH assembly_id AS assembly_id, COLLECT (DISTINCT accession) AS accessions
-        WITH
-            assembly_id AS assembly_id,
-            REDUCE(s = HEAD(accessions),
-            n in TAIL(accessions) | s +',' +n) AS accessions
-        WITH accessions, COLLECT(DISTINCT assembly_id) AS assemblies
-        WITH
-            accessions AS accessions,
-            REDUCE(s = HEAD(assemblies),
-            n in TAIL(assemblies) | s +',' +n) AS assemblies
-        RETURN accessions, assemblies
-        """  # noqa: B950
+        # group assemblies by their signature, stored on the Assembly nodes
+        count = 0
+        assemblies_by_signature = {}
+        mappings = self._writer.stream(ASSEMBLY_SIGNATURE_QUERY)
 
-        uniq_id = 1
-        basic_complex_string = "PDB-CPX-"
+        for row in mappings:
+            (_, encoded_signature, assemblies) = row
+            count += len(assemblies)
+            signature = decode_signature(encoded_signature)
 
-        count = 0
-        mappings = self._driver.run(query)
+            # eg. assemblies of ligands only, which the traversal never returned
+            if not signature:
+                continue
+
+            assemblies_by_signature.setdefault(signature, []).extend(assemblies)
+
+        # assemblies without a stored signature are read from the graph
+        mappings = self._writer.stream(ASSEMBLY_QUERY)
 
         for row in mappings:
             count += 1
-            (uniq_accessions, assemblies) = row
+            (assembly_id, participants) = row
+
+            if not participants:
+                LOGGER.warning(f"No participants found for assembly {assembly_id}")
+                continue
+
+            signature = make_signature(Participant(*x) for x in participants)
+            assemblies_by_signature.setdefault(signature, []).append(assembly_id)
+
+        LOGGER.info(f"{count} records")
 
-            # remove all occurences of NA_ from the unique complex combination
-            tmp_uniq_accessions = uniq_accessions.replace("NA_", "")
+        uniq_id = 1
+        basic_complex_string = "PDB-CPX-"
 
+        for signature, assemblies in assemblies_by_signature.items():
             pdb_complex_id = basic_complex_string + str(uniq_id)
-            complex_portal_id = self.dict_complex_portal_id.get(tmp_uniq_accessions)
+            complex_portal_id = self.dict_complex_portal_id.pop(signature, None)
 
-            # common complex; delete from dictionary else will be processed again
+            # common complex; removed from dictionary else will be processed again
             if complex_portal_id is not None:
-                del self.dict_complex_portal_id[tmp_uniq_accessions]
                 self.common_complexes.append((pdb_complex_id, complex_portal_id))
 
             # keep data for each PDB complex in dict_pdb_complex to be used later
             self.dict_pdb_complex[pdb_complex_id] = (
-                tmp_uniq_accessions,
-                assemblies,
+                signature,
+                sorted({x.rsplit("_", 1)[0] for x in assemblies}),
             )
+            self.dict_pdb_complex_assemblies[pdb_complex_id] = assemblies
 
-            for uniq_accession in uniq_accessions.split(","):
-                tokens = uniq_accession.split("_")
-
-                # handle cases of PDB entity
-                if len(tokens) == 4:
-                    [_, entry_id, entity_id, stoichiometry] = tokens
+            for participant in signature:
+                if participant.kind == UNIPROT:
+                    accession_params_list.append(
+                        {
+                            "complex_id": pdb_complex_id,
+                            "accession": participant.id,
+                            "stoichiometry": participant.stoichiometry,
+                        }
+                    )
+                elif participant.kind == ENTITY:
                     entity_params_list.append(
                         {
-                            "complex_id": str(pdb_complex_id),
-                            "entry_id": str(entry_id),
-                            "entity_id": str(entity_id),
-                            "stoichiometry": str(stoichiometry),
+                            "complex_id": pdb_complex_id,
+                            "entity_uniqid": participant.id,
+                            "stoichiometry": participant.stoichiometry,
                         }
                     )
-
-                # handle cases of UniProt
-                elif len(tokens) == 3:
-                    [accession, stoichiometry, tax_id] = tokens
-                    accession_params_list.append(
+                elif participant.kind == UNMAPPED:
+                    unmapped_polymer_params_list.append(
                         {
-                            "complex_id": str(pdb_complex_id),
-                            "accession": str(accession),
-                            "stoichiometry": str(stoichiometry),
+                            "complex_id": pdb_complex_id,
+                            "polymer_type": participant.id,
+                        }
+                    )
+                elif participant.kind == RFAM:
+                    rfam_params_list.append(
+                        {
+                            "complex_id": pdb_complex_id,
+                            "rfam_acc": participant.id,
                         }
                     )
 
-                # handle unmapped polymers and Rfam accessions
-                elif len(tokens) == 1:
-                    token = tokens[0]
-
-                    # check for unmapped polymers (:UNMAPPED string)
-                    if ":UNMAPPED" in token:
-                        polymer_type = token.replace(":UNMAPPED", "")
-                        unmapped_polymer_params_list.append(
-                            {
-                                "complex_id": str(pdb_complex_id),
-                                "polymer_type": str(polymer_type),
-                            }
-                        )
-
-                    # handle Rfam
-                    else:
-                        rfam_params_list.append(
-                            {
-                                "complex_id": str(pdb_complex_id),
-                                "rfam_acc": str(token),
-                            }
-                        )
-
-            for uniq_assembly in assemblies.split(","):
-                [entry, assembly_id] = uniq_assembly.split("_")
+            for assembly_id in assemblies:
                 assembly_params_list.append(
                     {
-                        "complex_id": str(pdb_complex_id),
-                        "assembly_id": str(uniq_assembly),
-                        "entry_id": str(entry),
+                        "complex_id": pdb_complex_id,
+                        "assembly_id": assembly_id,
                     }
                 )
 
             uniq_id += 1
-        LOGGER.info(f"{count} records")
 
-        for accessions in self.dict_complex_portal_id.keys():
+        for signature, complex_portal_id in self.dict_complex_portal_id.items():
             pdb_complex_id = basic_complex_string + str(uniq_id)
-            complex_portal_id = self.dict_complex_portal_id[accessions]
             entries = self.dict_complex_portal_entries.get(complex_portal_id)
 
             # keep data for each PDB complex in dict_pdb_complex to be used later
-            self.dict_pdb_complex[pdb_complex_id] = (accessions, entries)
-
-            for item in accessions.split(","):
-                [accession, stoichiometry, tax_id] = item.split("_")
+            self.dict_pdb_complex[pdb_complex_id] = (signature, sorted(entries))
 
-                # this is the data from complex portal, there won't be any PDB entity
-                # as a participant
+            # this is the data from complex portal, there won't be any PDB entity
+            # as a participant
+            for participant in signature:
                 accession_params_list.append(
                     {
-                        "complex_id": str(pdb_complex_id),
-                        "accession": str(accession),
-                        "stoichiometry": str(stoichiometry),
+                        "complex_id": pdb_complex_id,
+                        "accession": participant.id,
+                        "stoichiometry": participant.stoichiometry,
                     }
                 )
 
@@ -277,218 +395,314 @@ class PDBeComplex:
             (pdb_complex_id, complex_portal_id) = common_complex
             complex_params_list.append(
                 {
-                    "pdb_complex_id": str(pdb_complex_id),
-                    "complex_portal_id": str(complex_portal_id),
+                    "pdb_complex_id": pdb_complex_id,
+                    "complex_portal_id": complex_portal_id,
                 }
             )
 
-        LOGGER.info(
-            "Creating relationship between UniProt and PDBComplex nodes - START"
-        )
-        self._driver.run(
-            MERGE_ACCESSION_QUERY,
-            parameters={"accession_params_list": accession_params_list},
-        )
-        LOGGER.info("Creating relationship between UniProt and PDBComplex nodes - DONE")
-
-        LOGGER.info("Creating relationship between Entity and PDBComplex nodes - START")
+        LOGGER.info("Creating PDBComplex nodes - START")
+        for batch in batched(self.dict_pdb_complex.items(), PDB_COMPLEX_BATCH_SIZE):
+            self._writer.run(
+                CREATE_PDB_COMPLEX_QUERY,
+                {
+                    "pdb_complex_params_list": [
+                        {
+                            "complex_id": complex_id,
+                            "participant_count": len(signature),
+                        }
+                        for complex_id, (signature, _) in batch
+                    ]
+                },
+            )
+        LOGGER.info(f"Creating {len(self.dict_pdb_complex)} PDBComplex nodes - DONE")
+
+        # every stage only matches the PDBComplex nodes created above, so the
+        # stages are independent and run concurrently, each in its own
+        # transactions
+        stages = [
+            (
+                "UniProt",
+                MERGE_ACCESSION_QUERY,
+                "accession_params_list",
+                accession_params_list,
+            ),
+            ("Entity", MERGE_ENTITY_QUERY, "entity_params_list", entity_params_list),
+            (
+                "UnmappedPolymer",
+                MERGE_UNMAPPED_POLYMER_QUERY,
+                "unmapped_polymer_params_list",
+                unmapped_polymer_params_list,
+            ),
+            ("Rfam", MERGE_RFAM_QUERY, "rfam_params_list", rfam_params_list),
+            (
+                "Assembly",
+                MERGE_ASSEMBLY_QUERY,
+                "assembly_params_list",
+                assembly_params_list,
+            ),
+            (
+                "Complex",
+                COMMON_COMPLEX_QUERY,
+                "complex_params_list",
+                complex_params_list,
+            ),
+        ]
+
+        with ThreadPoolExecutor(max_workers=len(stages)) as executor:
+            futures = [executor.submit(self._run_stage, *x) for x in stages]
+            for future in futures:
+                future.result()
 
-        self._driver.run(
-            MERGE_ENTITY_QUERY,
-            parameters={"entity_params_list": entity_params_list},
+        LOGGER.info(
+            f"{len(self.common_complexes)} common complexes "
+            "found in PDBe and Complex Portal"
         )
-        LOGGER.info("Creating relationship between Entity and PDBComplex nodes - DONE")
 
         LOGGER.info(
-            "Creating relationship between UnmappedPolymer and PDBComplex nodes - START"
-        )
-        self._driver.run(
-            MERGE_UNMAPPED_POLYMER_QUERY,
-            parameters={"unmapped_polymer_params_list": unmapped_polymer_params_list},
+            f"Created PDBComplex nodes and it's relationships"
+            f" - Ended at {datetime.now()}"
         )
+
+    def _run_stage(self, label: str, query: str, parameter: str, rows: list):
         LOGGER.info(
-            "Creating relationship between UnmappedPolymer and PDBComplex nodes - DONE"
+            f"Creating relationship between {label} and PDBComplex nodes - START"
         )
 
-        LOGGER.info("Creating relationship between Rfam and PDBComplex nodes - START")
-        self._driver.run(
-            MERGE_RFAM_QUERY, parameters={"rfam_params_list": rfam_params_list}
-        )
-        LOGGER.info("Creating relationship between Rfam and PDBComplex nodes - DONE")
+        for batch in batched(rows, PDB_COMPLEX_BATCH_SIZE):
+            self._writer.run(query, {parameter: batch})
 
         LOGGER.info(
-            "Creating relationship between Assembly and PDBComplex nodes - START"
-        )
-        self._driver.run(
-            MERGE_ASSEMBLY_QUERY,
-            parameters={"assembly_params_list": assembly_params_list},
+            f"Creating {len(rows)} relationships between {label} and PDBComplex nodes"
+            " - DONE"
         )
+
+    def find_subcomplexes(self):
         LOGGER.info(
-            "Creating relationship between Assembly and PDBComplex nodes - DONE"
+            f"Checking for sub complexes with the {self.subcomplex_engine} engine"
+            f" - Started at {datetime.now()}"
         )
 
+        if self.subcomplex_engine == "cypher":
+            supersets = self._query_supersets()
+        else:
+            # the subset lattice is computed from the signatures in memory
+            supersets = find_supersets(
+                {
+                    key: signature
+                    for key, (signature, _) in self.dict_pdb_complex.items()
+                }
+            )
+
         LOGGER.info(
-            "Creating relationship between PDBComplex and Complex nodes - START"
-        )
-        self._driver.run(
-            COMMON_COMPLEX_QUERY,
-            parameters={"complex_params_list": complex_params_list},
+            f"{sum(len(x) for x in supersets.values())} sub complex relations found"
+            f" - Ended at {datetime.now()}"
         )
-        LOGGER.info("Creating relationship between PDBComplex and Complex nodes - DONE")
 
-        # clean up the entries in dict_pdb_complex,
-        # remove assembly id and make the list unique
-        for key in self.dict_pdb_complex.keys():
-            (accessions, entries) = self.dict_pdb_complex[key]
+        # with transitive reduction only the covering relations (the Hasse
+        # diagram) are kept
+        if self.transitive_reduction:
+            return covering_pairs(supersets)
 
-            if entries is not None:
-                entries = ",".join(set(re.sub(r"_\d+", "", entries).split(",")))
-                self.dict_pdb_complex[key] = (accessions, entries)
+        return all_pairs(supersets)
 
-        LOGGER.info(
-            f"{len(self.common_complexes)} common complexes "
-            "found in PDBe and Complex Portal"
-        )
+    def _query_supersets(self):
+        # complexes with the most participants are nobody's sub complex
+        largest = max((len(x) for x, _ in self.dict_pdb_complex.values()), default=0)
+        sources = [
+            key
+            for key, (signature, _) in self.dict_pdb_complex.items()
+            if 0 < len(signature) < largest
+        ]
 
-        LOGGER.info(
-            f"Created PDBComplex nodes and it's relationships"
-            f" - Ended at {datetime.now()}"
-        )
+        def query(batch: list):
+            return self._writer.data(SUBCOMPLEX_QUERY, {"source_complex_ids": batch})
+
+        supersets = {x: set() for x in self.dict_pdb_complex}
+        with ThreadPoolExecutor(max_workers=SUBCOMPLEX_QUERY_THREADS) as executor:
+            for rows in executor.map(
+                query, batched(sources, SUBCOMPLEX_QUERY_BATCH_SIZE)
+            ):
+                for row in rows:
+                    supersets[row["sub_complex_id"]].add(row["complex_id"])
+
+        return supersets
 
-    def process_subcomplex_data(self):
+    def process_subcomplex_data(self, subcomplexes, pairs: list = None):
         LOGGER.info(
             f"Processing Complex-Subcomplex relationships"
             f" - Started at {datetime.now()}"
         )
 
-        query = """
-        MATCH (complex:PDBComplex)<-[:IS_SUB_COMPLEX_OF]-(sub_complex:PDBComplex)
-        WITH complex AS complex, sub_complex AS sub_complex
-        MATCH
-            (complex)<-[rel1:IS_PART_OF_PDB_COMPLEX]-(u1),
-            (sub_complex)<-[rel2:IS_PART_OF_PDB_COMPLEX]-(u2)
-        WITH complex.COMPLEX_ID AS complex_id,
-        CASE u1.ACCESSION
-            WHEN null
-            THEN u1.UNIQID +'_' +rel1.STOICHIOMETRY +'_' +u1.POLYMER_TYPE
-            ELSE u1.ACCESSION +'_' +rel1.STOICHIOMETRY
-        END AS unique_complex,
-        sub_complex.COMPLEX_ID AS sub_complex_id,
-        CASE u2.ACCESSION
-            WHEN null
-            THEN u2.UNIQID +'_' +rel2.STOICHIOMETRY +'_' +u2.POLYMER_TYPE
-            ELSE u2.ACCESSION +'_' +rel2.STOICHIOMETRY
-        END AS unique_sub_complex
-        ORDER BY sub_complex, unique_sub_complex
-        WITH
-            complex_id AS complex_id,
-            COLLECT(DISTINCT unique_complex) AS unique_complex,
-            sub_complex_id AS sub_complex_id,
-            COLLECT(DISTINCT unique_sub_complex) AS unique_sub_complex
-        RETURN
-            complex_id,
-            REDUCE(s = HEAD(unique_complex), n in TAIL(unique_complex) | s +',' +n)
-                AS unique_complex,
-            sub_complex_id,
-            REDUCE(
-             s = HEAD(unique_sub_complex), n in TAIL(unique_sub_complex) | s +',' +n)
-            AS unique_sub_complex
-        """
-
-        mappings = self._driver.run(query)
-
-        with open(self.complex_subcomplex_outcsv, "w") as complex_subcomplex_file:
-            complex_subcomplex_file_csv = csv.writer(
-                complex_subcomplex_file, dialect="excel"
-            )
-            complex_subcomplex_file_csv.writerow(
-                (
-                    "PDB_COMPLEX",
-                    "PDB_COMPLEX_PARTICIPANTS",
-                    "PDB_SUBCOMPLEX",
-                    "PDB_SUBCOMPLEX_PARTICIPANTS",
-                    "PDB_ENTRIES",
-                )
-            )
-
-            for row in mappings:
-                (
-                    complex_id,
-                    unique_complex,
-                    sub_complex_id,
-                    unique_sub_complex,
-                ) = row
+        # drop existing IS_SUB_COMPLEX_OF relationship, if any
+        LOGGER.info("Dropping IS_SUB_COMPLEX_OF relationships, if any - START")
+        self._writer.run(DROP_SUBCOMPLEX_QUERY)
+        LOGGER.info("Dropping IS_SUB_COMPLEX_OF relationships, if any - DONE")
 
-                (participants, assemblies) = self.dict_pdb_complex.get(complex_id)
+        count = 0
 
+        # each batch of relationships is written in the background while the
+        # report rows for the same batch are written to the CSV file
+        with ThreadPoolExecutor(max_workers=1) as executor:
+            with open(self.complex_subcomplex_outcsv, "w") as complex_subcomplex_file:
+                complex_subcomplex_file_csv = csv.writer(
+                    complex_subcomplex_file, dialect="excel"
+                )
                 complex_subcomplex_file_csv.writerow(
                     (
-                        complex_id,
-                        unique_complex,
-                        sub_complex_id,
-                        unique_sub_complex,
-                        assemblies,
+                        "PDB_COMPLEX",
+                        "PDB_COMPLEX_PARTICIPANTS",
+                        "PDB_SUBCOMPLEX",
+                        "PDB_SUBCOMPLEX_PARTICIPANTS",
+                        "PDB_ENTRIES",
                     )
                 )
 
+                pending = None
+                for batch in batched(subcomplexes, SUBCOMPLEX_BATCH_SIZE):
+                    if pending is not None:
+                        pending.result()
+
+                    pending = executor.submit(
+                        self._writer.run,
+                        CREATE_SUBCOMPLEX_QUERY,
+                        {
+                            "subcomplex_params_list": [
+                                {
+                                    "sub_complex_id": sub_complex_id,
+                                    "complex_id": complex_id,
+                                }
+                                for sub_complex_id, complex_id in batch
+                            ]
+                        },
+                    )
+
+                    for sub_complex_id, complex_id in batch:
+                        (signature, entries) = self.dict_pdb_complex[complex_id]
+                        (sub_signature, _) = self.dict_pdb_complex[sub_complex_id]
+
+                        complex_subcomplex_file_csv.writerow(
+                            (
+                                complex_id,
+                                signature_label(signature),
+                                sub_complex_id,
+                                signature_label(sub_signature),
+                                ",".join(entries),
+                            )
+                        )
+
+                    count += len(batch)
+                    # only kept when a caller needs them, eg. for the snapshot
+                    if pairs is not None:
+                        pairs.extend(batch)
+
+                if pending is not None:
+                    pending.result()
+
+        LOGGER.info(f"Created {count} IS_SUB_COMPLEX_OF relationships")
+
         LOGGER.info(
             f"Processing Complex-Subcomplex relationships"
             f" - Ended at {datetime.now()}"
         )
 
-    def find_subcomplexes(self):
-        LOGGER.info(
-            f"Checking for sub complexes and making relationships"
-            f" - Started at {datetime.now()}"
-        )
-
-        # drop existing IS_SUB_COMPLEX_OF relationship, if any
-        LOGGER.info("Dropping IS_SUB_COMPLEX_OF relationships, if any - START")
+    def write_near_matches(
+        self, path: str, metric: str = "jaccard", threshold: float = 0.5, top: int = 5
+    ):
+        # PDB complexes seen in assemblies against every Complex Portal complex,
+        # pairs with equal signatures are already linked with SAME_AS and left out
+        LOGGER.info(f"Searching near matches - Started at {datetime.now()}")
 
-        self._driver.run(
-            "MATCH (:PDBComplex)-[r:IS_SUB_COMPLEX_OF]->(:PDBComplex) DELETE r"
-        )
+        pdb_signatures = {
+            x: self.dict_pdb_complex[x][0] for x in self.dict_pdb_complex_assemblies
+        }
+        count = 0
 
-        LOGGER.info("Dropping IS_SUB_COMPLEX_OF relationships, if any - DONE")
+        with open(path, "w") as near_match_file:
+            near_match_csv = csv.writer(near_match_file, dialect="excel")
+            near_match_csv.writerow(
+                (
+                    "PDB_COMPLEX",
+                    "PDB_COMPLEX_PARTICIPANTS",
+                    "COMPLEX_PORTAL_ID",
+                    "COMPLEX_PORTAL_PARTICIPANTS",
+                    metric.upper(),
+                )
+            )
 
-        query = """
-        MATCH
-            (src_complex:PDBComplex)<-[rel1:IS_PART_OF_PDB_COMPLEX]-()-
-            [rel2:IS_PART_OF_PDB_COMPLEX]->(dest_complex:PDBComplex)
-        WHERE rel1.STOICHIOMETRY=rel2.STOICHIOMETRY
-        WITH DISTINCT src_complex, dest_complex, rel1
-        WITH src_complex, startNode(rel1) AS relRelations, dest_complex
-        WITH src_complex, COUNT(relRelations) AS relRelationsAmount, dest_complex
-        MATCH (src_complex)<-[allRelations:IS_PART_OF_PDB_COMPLEX]-()
-        WITH
-            src_complex,
-            relRelationsAmount,
-            count(allRelations) AS allRelationsAmount,
-            dest_complex
-        WHERE relRelationsAmount = allRelationsAmount
-        CREATE (dest_complex)<-[:IS_SUB_COMPLEX_OF]-(src_complex)
-        """  # noqa: B950
+            for pdb_complex_id, complex_portal_id, score in find_near_matches(
+                pdb_signatures,
+                self.complex_portal_signatures,
+                metric=metric,
+                threshold=threshold,
+                top=top,
+            ):
+                near_match_csv.writerow(
+                    (
+                        pdb_complex_id,
+                        signature_label(pdb_signatures[pdb_complex_id]),
+                        complex_portal_id,
+                        signature_label(
+                            self.complex_portal_signatures[complex_portal_id]
+                        ),
+                        f"{score:.3f}",
+                    )
+                )
+                count += 1
 
         LOGGER.info(
-            f"Creating IS_SUB_COMPLEX_OF relationships"
-            f" - Started at {datetime.now()}"
-        )
-        self._driver.run(query)
-        LOGGER.info(
-            f"Creating IS_SUB_COMPLEX_OF relationships" f" - Ended at {datetime.now()}"
+            f"{count} near matches written to {path} - Ended at {datetime.now()}"
         )
 
-        LOGGER.info(
-            f"Checking for sub complexes and making relationships"
-            f"- Ended at {datetime.now()}"
-        )
+    def get_subcomplex_closure(self, complex_id: str):
+        super_complexes = [
+            x["complex_id"]
+            for x in self._writer.data(
+                SUPER_COMPLEX_CLOSURE_QUERY, {"complex_id": complex_id}
+            )
+        ]
+        sub_complexes = [
+            x["complex_id"]
+            for x in self._writer.data(
+                SUB_COMPLEX_CLOSURE_QUERY, {"complex_id": complex_id}
+            )
+        ]
+
+        return super_complexes, sub_complexes
 
 
-def run_pdbe_complex(complex_subcomplex_file: str):
+def run_pdbe_complex(
+    complex_subcomplex_file: str,
+    transitive_reduction=False,
+    index_file: str = None,
+    snapshot_dir: str = None,
+    near_match_file: str = None,
+    similarity: str = "jaccard",
+    threshold: float = 0.5,
+    subcomplex_engine: str = "python",
+):
     complex = PDBeComplex(
         outcsv=complex_subcomplex_file,
+        transitive_reduction=transitive_reduction,
+        subcomplex_engine=subcomplex_engine,
     )
 
     complex.process_complex_data()
-    complex.find_subcomplexes()
-    complex.process_subcomplex_data()
+
+    if near_match_file:
+        complex.write_near_matches(near_match_file, similarity, threshold)
+
+    subcomplex_pairs = [] if snapshot_dir else None
+    complex.process_subcomplex_data(complex.find_subcomplexes(), subcomplex_pairs)
+
+    if index_file:
+        write_complex_index(
+            index_file, complex.dict_pdb_complex, complex.common_complexes
+        )
+
+    if snapshot_dir:
+        write_snapshot(
+            snapshot_dir,
+            complex.dict_pdb_complex,
+            complex.dict_pdb_complex_assemblies,
+            subcomplex_pairs,
+        )
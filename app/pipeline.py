@@ -0,0 +1,339 @@
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from datetime import datetime
+import hashlib
+import json
+import os
+import threading
+from typing import Callable, Dict, List, NamedTuple, Optional, Union
+
+import requests
+
+from app import COMPLEX_PORTAL_RELEASE_FTP, LOGGER
+from app.utils import REQUEST_TIMEOUT
+
+COMPLEX_PORTAL_FILES = (
+    "complex_portal_complexes.tsv",
+    "complex_portal_components.tsv",
+    "complex_portal_xrefs.tsv",
+)
+
+
+# a stage returns False when it did not finish (eg. it was interrupted), so it
+# runs again next time, or a list of items (eg. entries failing with a
+# transient error) that the next build passes to its retry function
+StageResult = Union[None, bool, list]
+
+
+class Stage(NamedTuple):
+    name: str
+    run: Callable[[], StageResult]
+    # JSON serialisable description of the inputs, None when they cannot be
+    # described (eg. entries read from stdin) and the stage always runs
+    inputs: Callable[[], object]
+    depends: tuple = ()
+    # files the stage writes, it runs again when one is missing
+    outputs: tuple = ()
+    # runs the items left by the last run of an otherwise up to date stage
+    retry: Optional[Callable[[list], StageResult]] = None
+
+
+def file_digest(path: str):
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(2**20), b""):
+            digest.update(chunk)
+
+    return digest.hexdigest()
+
+
+def file_stat(path: str):
+    # for large files like the UniProt store, which are replaced as a whole
+    if not path:
+        return None
+
+    stat = os.stat(path)
+    return {"path": os.path.abspath(path), "size": stat.st_size, "mtime": stat.st_mtime}
+
+
+def remote_stat(url: str):
+    response = requests.head(url, timeout=REQUEST_TIMEOUT, allow_redirects=True)
+    response.raise_for_status()
+
+    return {
+        x: response.headers.get(x) for x in ("ETag", "Last-Modified", "Content-Length")
+    }
+
+
+def graph_inputs():
+    # stages are fingerprinted per graph, so a build against another database
+    # runs every stage
+    return {
+        "backend": os.environ.get("GRAPH_BACKEND", "py2neo"),
+        "uri": os.environ.get("NEO4J_URI"),
+        "memory_file": os.environ.get("GRAPH_MEMORY_FILE"),
+    }
+
+
+class Pipeline:
+    # runs stages as soon as their dependencies are done, skipping the ones
+    # whose input fingerprint matches the one recorded by their last run
+    def __init__(
+        self,
+        stages: List[Stage],
+        state_file: str,
+        force: bool = False,
+        cancel: Optional[threading.Event] = None,
+    ):
+        self.stages = stages
+        self.state_file = state_file
+        self.force = force
+        # set on Ctrl-C, stages running in the pool check it to stop early
+        self.cancel = cancel or threading.Event()
+        self.state = {}
+
+        if os.path.exists(state_file):
+            with open(state_file) as f:
+                self.state = json.load(f)
+
+    def _save(self):
+        tmp_path = f"{self.state_file}.tmp"
+        with open(tmp_path, "w") as f:
+            json.dump(self.state, f, indent=2)
+        os.replace(tmp_path, self.state_file)
+
+    def _fingerprints(self) -> Dict[str, Optional[str]]:
+        # a stage fingerprint covers its dependencies, stages are listed in
+        # dependency order
+        fingerprints = {}
+
+        for stage in self.stages:
+            inputs = stage.inputs()
+            depends = {x: fingerprints[x] for x in stage.depends}
+
+            if inputs is None or None in depends.values():
+                fingerprints[stage.name] = None
+                continue
+
+            fingerprints[stage.name] = hashlib.sha256(
+                json.dumps(
+                    {"graph": graph_inputs(), "inputs": inputs, "depends": depends},
+                    sort_keys=True,
+                ).encode()
+            ).hexdigest()
+
+        return fingerprints
+
+    def _up_to_date(self, stage: Stage, fingerprint: Optional[str], ran: set):
+        return (
+            not self.force
+            and fingerprint is not None
+            and self.state.get(stage.name, {}).get("fingerprint") == fingerprint
+            and not any(x in ran for x in stage.depends)
+            and all(os.path.exists(x) for x in stage.outputs)
+        )
+
+    def _submit(self, executor, stage: Stage, fingerprint: Optional[str], ran: set):
+        # returns None when the stage is skipped
+        if not self._up_to_date(stage, fingerprint, ran):
+            LOGGER.info(f"Stage {stage.name} - START")
+            return executor.submit(stage.run)
+
+        retry = self.state[stage.name].get("retry")
+        if retry and stage.retry is not None:
+            LOGGER.info(f"Stage {stage.name} - RETRYING {len(retry)} items")
+            return executor.submit(stage.retry, retry)
+
+        LOGGER.info(f"Stage {stage.name} is up to date, skipped")
+        return None
+
+    def _finish(self, stage: Stage, fingerprint: Optional[str], result: StageResult):
+        if result is False or fingerprint is None:
+            self.state.pop(stage.name, None)
+        else:
+            self.state[stage.name] = {
+                "fingerprint": fingerprint,
+                "finished": datetime.now().isoformat(),
+            }
+            if isinstance(result, list) and result:
+                self.state[stage.name]["retry"] = result
+
+        self._save()
+
+    def run(self):
+        fingerprints = self._fingerprints()
+        remaining = list(self.stages)
+        done = set()
+        ran = set()
+        failed = []
+        pending = {}
+
+        with ThreadPoolExecutor(max_workers=len(self.stages)) as executor:
+            while remaining or pending:
+                # skipping a stage can make others ready, so this repeats
+                # until no stage is ready; nothing starts once interrupted
+                ready = [x for x in remaining if all(y in done for y in x.depends)]
+                while ready and not self.cancel.is_set():
+                    for stage in ready:
+                        remaining.remove(stage)
+
+                        future = self._submit(
+                            executor, stage, fingerprints[stage.name], ran
+                        )
+                        if future is None:
+                            done.add(stage.name)
+                        else:
+                            pending[future] = stage
+
+                    ready = [x for x in remaining if all(y in done for y in x.depends)]
+
+                if not pending:
+                    break
+
+                try:
+                    (finished, _) = wait(pending, return_when=FIRST_COMPLETED)
+                except KeyboardInterrupt:
+                    # the running stages finish what they are doing, like
+                    # load-entries on the first Ctrl-C; a second one stops
+                    # waiting for them
+                    if self.cancel.is_set():
+                        raise
+
+                    LOGGER.warning(
+                        "Interrupted, waiting for the running stages: "
+                        + ", ".join(x.name for x in pending.values())
+                    )
+                    self.cancel.set()
+                    continue
+
+                for future in finished:
+                    stage = pending.pop(future)
+
+                    try:
+                        result = future.result()
+                    except Exception as e:
+                        LOGGER.error(f"Stage {stage.name} failed: {e}", exc_info=True)
+                        failed.append(stage.name)
+                        continue
+
+                    done.add(stage.name)
+                    ran.add(stage.name)
+                    self._finish(stage, fingerprints[stage.name], result)
+
+                    LOGGER.info(f"Stage {stage.name} - DONE")
+
+        if self.cancel.is_set():
+            raise RuntimeError(
+                "Build interrupted, not run: "
+                f"{', '.join(x.name for x in remaining) or 'none'}"
+            )
+
+        if failed:
+            raise RuntimeError(
+                f"Stages {', '.join(failed)} failed, not run: "
+                f"{', '.join(x.name for x in remaining) or 'none'}"
+            )
+
+
+def build_stages(
+    entries: str,
+    outcsv: str,
+    threads: int = 4,
+    uniprot_store: str = None,
+    rfam_store: str = None,
+    failure_report: str = "load_failures.json",
+    transitive_reduction: bool = False,
+    index_file: str = None,
+    snapshot_dir: str = None,
+    cancel: Optional[threading.Event] = None,
+) -> List[Stage]:
+    # create-indexes -> (load-complex-portal-data, load-entries) ->
+    # run-pdbe-complex-analysis; Complex Portal data and entries only merge
+    # nodes, so the two load concurrently
+    from app.app import run_complex_portal
+    from app.failures import PARSE, UPSTREAM
+    from app.loader import EntryLoader, read_entries
+    from app.pdbe_complex import run_pdbe_complex
+    from app.schema import LOOKUP_KEYS, UNIQUE_KEYS, create_schema
+    from app.stores import RfamMappingStore, UniProtStore
+
+    def load_entries(entry_ids=None):
+        loader = EntryLoader(
+            threads=threads,
+            uniprot_store=UniProtStore(uniprot_store) if uniprot_store else None,
+            rfam_store=RfamMappingStore(rfam_store) if rfam_store else None,
+            cancel=cancel,
+        )
+        failures = loader.load(
+            read_entries(entries) if entry_ids is None else entry_ids
+        )
+        loader.write_failure_report(failure_report)
+
+        if loader.interrupted:
+            return False
+
+        # entries missing upstream or failing to parse fail the same way on
+        # every build, the others are retried by the next one
+        return sorted(
+            x
+            for x, failure in failures.items()
+            if failure["category"] not in (UPSTREAM, PARSE)
+        )
+
+    def entry_inputs():
+        if entries == "-":
+            return None
+
+        return {
+            "entries": file_digest(entries) if os.path.isfile(entries) else entries,
+            "uniprot_store": file_stat(uniprot_store),
+            "rfam_store": file_stat(rfam_store),
+        }
+
+    stages = []
+
+    # the memory backend has no schema
+    if graph_inputs()["backend"] != "memory":
+        stages.append(
+            Stage(
+                "indexes",
+                create_schema,
+                lambda: {"unique": UNIQUE_KEYS, "lookup": LOOKUP_KEYS},
+            )
+        )
+
+    depends = tuple(x.name for x in stages)
+    stages.extend(
+        [
+            Stage(
+                "complex_portal",
+                lambda: run_complex_portal(threads),
+                lambda: [
+                    remote_stat(f"{COMPLEX_PORTAL_RELEASE_FTP}/{x}")
+                    for x in COMPLEX_PORTAL_FILES
+                ],
+                depends,
+            ),
+            Stage("entries", load_entries, entry_inputs, depends, retry=load_entries),
+            Stage(
+                "analysis",
+                lambda: run_pdbe_complex(
+                    outcsv, transitive_reduction, index_file, snapshot_dir
+                ),
+                lambda: {
+                    "outcsv": outcsv,
+                    "transitive_reduction": transitive_reduction,
+                    "index_file": index_file,
+                    "snapshot_dir": snapshot_dir,
+                },
+                ("complex_portal", "entries"),
+                tuple(x for x in (outcsv, index_file, snapshot_dir) if x),
+            ),
+        ]
+    )
+
+    return stages
+
+
+def run_build(state_file: str = "build_state.json", force: bool = False, **kwargs):
+    cancel = threading.Event()
+    Pipeline(build_stages(cancel=cancel, **kwargs), state_file, force, cancel).run()
@@ -0,0 +1,215 @@
+from datetime import datetime
+import json
+from time import perf_counter
+
+from app import LOGGER, connect_graph
+from app.pdbe_complex import ANALYSIS_QUERIES, MERGE_QUERIES
+
+PROFILE_METRICS = ("db_hits", "rows", "page_cache_hits", "page_cache_misses")
+
+# rows of the sample batch given to each batched statement
+PROFILE_BATCH_SIZE = 1000
+
+# sample batches for MERGE_QUERIES, read from the analysed graph in a stable
+# order so profiles of the same graph are comparable; the merges match the
+# existing relationships again and new PDBComplex nodes get a new ID
+SAMPLE_QUERIES = {
+    "create_pdb_complex": """
+MATCH (c:PDBComplex)
+WITH c ORDER BY c.COMPLEX_ID LIMIT $size
+RETURN {
+    complex_id:"PROFILE-" + c.COMPLEX_ID,
+    participant_count:c.PARTICIPANT_COUNT
+} AS row
+""",
+    "merge_accession": """
+MATCH (u:UniProt)-[r:IS_PART_OF_PDB_COMPLEX]->(c:PDBComplex)
+WITH u, r, c ORDER BY c.COMPLEX_ID, u.ACCESSION LIMIT $size
+RETURN {
+    complex_id:c.COMPLEX_ID,
+    accession:u.ACCESSION,
+    stoichiometry:r.STOICHIOMETRY
+} AS row
+""",
+    "merge_entity": """
+MATCH (en:Entity)-[r:IS_PART_OF_PDB_COMPLEX]->(c:PDBComplex)
+WITH en, r, c ORDER BY c.COMPLEX_ID, en.UNIQID LIMIT $size
+RETURN {
+    complex_id:c.COMPLEX_ID,
+    entity_uniqid:en.UNIQID,
+    stoichiometry:r.STOICHIOMETRY
+} AS row
+""",
+    "merge_assembly": """
+MATCH (assembly:Assembly)-[:IS_PART_OF_PDB_COMPLEX]->(c:PDBComplex)
+WITH assembly, c ORDER BY c.COMPLEX_ID, assembly.UNIQID LIMIT $size
+RETURN {complex_id:c.COMPLEX_ID, assembly_id:assembly.UNIQID} AS row
+""",
+    "merge_rfam": """
+MATCH (rfam:RfamFamily)-[:IS_PART_OF_PDB_COMPLEX]->(c:PDBComplex)
+WITH rfam, c ORDER BY c.COMPLEX_ID, rfam.RFAM_ACC LIMIT $size
+RETURN {complex_id:c.COMPLEX_ID, rfam_acc:rfam.RFAM_ACC} AS row
+""",
+    "merge_unmapped_polymer": """
+MATCH (up:UnmappedPolymer)-[:IS_PART_OF_PDB_COMPLEX]->(c:PDBComplex)
+WITH up, c ORDER BY c.COMPLEX_ID, up.TYPE LIMIT $size
+RETURN {complex_id:c.COMPLEX_ID, polymer_type:up.TYPE} AS row
+""",
+    "common_complex": """
+MATCH (p:PDBComplex)-[:SAME_AS]->(c:Complex)
+WITH p, c ORDER BY p.COMPLEX_ID LIMIT $size
+RETURN {pdb_complex_id:p.COMPLEX_ID, complex_portal_id:c.COMPLEX_ID} AS row
+""",
+    "create_subcomplex": """
+MATCH (src:PDBComplex)-[:IS_SUB_COMPLEX_OF]->(dest:PDBComplex)
+WITH src, dest ORDER BY src.COMPLEX_ID, dest.COMPLEX_ID LIMIT $size
+RETURN {sub_complex_id:src.COMPLEX_ID, complex_id:dest.COMPLEX_ID} AS row
+""",
+    "subcomplexes": """
+MATCH (c:PDBComplex)
+WITH c ORDER BY c.COMPLEX_ID LIMIT $size
+RETURN c.COMPLEX_ID AS row
+""",
+}
+
+
+def _flatten_profile(plan, depth=0):
+    operators = [
+        {
+            "operator": plan["operatorType"].split("@")[0],
+            "depth": depth,
+            "details": plan.get("args", {}).get("Details"),
+            "db_hits": plan.get("dbHits", 0),
+            "rows": plan.get("rows", 0),
+            "page_cache_hits": plan.get("pageCacheHits", 0),
+            "page_cache_misses": plan.get("pageCacheMisses", 0),
+            # reported in nanoseconds, and only by runtimes that time operators
+            "time_ms": plan["time"] / 1e6 if "time" in plan else None,
+        }
+    ]
+
+    for child in plan.get("children", []):
+        operators.extend(_flatten_profile(child, depth + 1))
+
+    return operators
+
+
+def profile_query(graph, name: str, query: str, parameters: dict = None):
+    LOGGER.info(f"Profiling {name} - START")
+
+    # the analysis queries only read, the batched MERGE_QUERIES statements
+    # create PDBComplex nodes and relationships; every profile runs in its own
+    # transaction, which is rolled back so profiling never changes the graph
+    tx = graph.begin()
+    try:
+        start = perf_counter()
+        cursor = tx.run(f"PROFILE {query}", parameters)
+        records = sum(1 for _ in cursor)
+        wall_time = perf_counter() - start
+        operators = _flatten_profile(cursor.plan())
+    finally:
+        graph.rollback(tx)
+
+    LOGGER.info(f"Profiling {name} - DONE in {wall_time:.3f}s")
+
+    result = {
+        "wall_time": wall_time,
+        "records": records,
+        "operators": operators,
+    }
+    for metric in PROFILE_METRICS:
+        result[metric] = sum(x[metric] for x in operators)
+
+    return result
+
+
+def sample_batch(graph, name: str, size: int = PROFILE_BATCH_SIZE):
+    return [x["row"] for x in graph.run(SAMPLE_QUERIES[name], {"size": size})]
+
+
+def profile_queries(database: str = None, batch_size: int = PROFILE_BATCH_SIZE):
+    graph = connect_graph(database)
+    queries = {
+        name: profile_query(graph, name, query)
+        for name, query in ANALYSIS_QUERIES.items()
+    }
+
+    for name, (query, parameter) in MERGE_QUERIES.items():
+        batch = sample_batch(graph, name, batch_size)
+        queries[name] = profile_query(graph, name, query, {parameter: batch})
+        queries[name]["batch_size"] = len(batch)
+
+    return {
+        "created": datetime.now().isoformat(),
+        "database": database,
+        "queries": queries,
+    }
+
+
+def _change(old, new):
+    if not old:
+        return "n/a"
+
+    return f"{(new - old) / old:+.1%}"
+
+
+def compare_profiles(previous: dict, current: dict):
+    lines = []
+
+    for name, result in current["queries"].items():
+        old = previous["queries"].get(name)
+
+        if old is None:
+            lines.append(f"{name}: not in baseline")
+            continue
+
+        lines.append(f"{name}:")
+        if old.get("batch_size") != result.get("batch_size"):
+            lines.append(
+                f"  batch_size: {old.get('batch_size')} -> {result.get('batch_size')}"
+            )
+        for metric in ("wall_time",) + PROFILE_METRICS:
+            lines.append(
+                f"  {metric}: {old[metric]} -> {result[metric]} "
+                f"({_change(old[metric], result[metric])})"
+            )
+
+        old_plan = [x["operator"] for x in old["operators"]]
+        new_plan = [x["operator"] for x in result["operators"]]
+
+        if old_plan != new_plan:
+            lines.append(f"  plan changed: {' > '.join(new_plan)}")
+            continue
+
+        for old_op, new_op in zip(old["operators"], result["operators"]):
+            if old_op["db_hits"] != new_op["db_hits"]:
+                lines.append(
+                    f"  {'  ' * new_op['depth']}{new_op['operator']}: db_hits "
+                    f"{old_op['db_hits']} -> {new_op['db_hits']} "
+                    f"({_change(old_op['db_hits'], new_op['db_hits'])})"
+                )
+
+    return lines
+
+
+def run_profile(
+    output: str,
+    baseline: str = None,
+    database: str = None,
+    batch_size: int = PROFILE_BATCH_SIZE,
+):
+    previous = None
+
+    # read the baseline first, it may be the file being overwritten
+    if baseline:
+        with open(baseline) as f:
+            previous = json.load(f)
+
+    current = profile_queries(database, batch_size)
+
+    with open(output, "w") as f:
+        json.dump(current, f, indent=2)
+
+    LOGGER.info(f"Wrote query profile to {output}")
+
+    return compare_profiles(previous, current) if previous else []
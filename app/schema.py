@@ -0,0 +1,154 @@
+from py2neo.cypher.queries import (
+    unwind_merge_nodes_query,
+    unwind_merge_relationships_query,
+)
+
+from app import LOGGER, get_graph
+
+# node merge keys, shared with the bulk merges in app.py and the MERGE/MATCH
+# clauses in pdbe_complex.py
+ENTRY_KEY = ("Entry", "ID")
+ENTITY_KEY = ("Entity", "UNIQID")
+ASSEMBLY_KEY = ("Assembly", "UNIQID")
+UNIPROT_KEY = ("UniProt", "ACCESSION")
+RFAM_KEY = ("RfamFamily", "RFAM_ACC")
+TAXONOMY_KEY = ("Taxonomy", "TAX_ID")
+COMPLEX_KEY = ("Complex", "COMPLEX_ID")
+PDB_COMPLEX_KEY = ("PDBComplex", "COMPLEX_ID")
+UNMAPPED_POLYMER_KEY = ("UnmappedPolymer", "TYPE")
+
+# nodes merged in bulk by app.py
+NODE_MERGES = [
+    ENTRY_KEY,
+    ENTITY_KEY,
+    ASSEMBLY_KEY,
+    UNIPROT_KEY,
+    RFAM_KEY,
+    TAXONOMY_KEY,
+    COMPLEX_KEY,
+]
+
+# relationships merged in bulk by app.py: (type, start key, end key, properties)
+RELATIONSHIP_MERGES = [
+    ("HAS_ENTITY", ENTRY_KEY, ENTITY_KEY, []),
+    ("IS_PART_OF_ASSEMBLY", ENTITY_KEY, ASSEMBLY_KEY, ["NUMBER_OF_CHAINS"]),
+    ("HAS_UNIPROT", ENTITY_KEY, UNIPROT_KEY, ["BEST_MAPPING"]),
+    ("HAS_RFAM", ENTITY_KEY, RFAM_KEY, []),
+    ("HAS_TAXONOMY", UNIPROT_KEY, TAXONOMY_KEY, []),
+    ("IS_PART_OF_COMPLEX", UNIPROT_KEY, COMPLEX_KEY, ["STOICHIOMETRY"]),
+    ("IS_PART_OF_COMPLEX", ENTRY_KEY, COMPLEX_KEY, []),
+]
+
+# every merge key identifies exactly one node, so each one gets a uniqueness
+# constraint, which also provides the index behind the MERGE/MATCH lookups
+UNIQUE_KEYS = NODE_MERGES + [PDB_COMPLEX_KEY, UNMAPPED_POLYMER_KEY]
+
+# non-unique properties the analysis queries filter on
+LOOKUP_KEYS = [("Assembly", "PREFERED"), ("Assembly", "SIGNATURE_HASH")]
+
+SCAN_OPERATORS = {"AllNodesScan", "NodeByLabelScan"}
+CARTESIAN_OPERATORS = {"CartesianProduct"}
+
+
+def _schema_name(label: str, key: str, suffix: str = None):
+    name = f"{label.lower()}_{key.lower()}"
+    return f"{name}_{suffix}" if suffix else name
+
+
+def create_schema():
+    constraints = {
+        (tuple(labels or []), tuple(properties or []))
+        for labels, properties in get_graph().run(
+            "SHOW CONSTRAINTS YIELD labelsOrTypes, properties"
+        )
+    }
+    indexes = {
+        (tuple(labels or []), tuple(properties or [])): name
+        for name, labels, properties in get_graph().run(
+            "SHOW INDEXES YIELD name, labelsOrTypes, properties"
+        )
+    }
+
+    for label, key in UNIQUE_KEYS:
+        schema = ((label,), (key,))
+        if schema in constraints:
+            continue
+
+        # a plain index on the same property (eg. from the legacy
+        # CREATE INDEX ON syntax) blocks the constraint, so replace it
+        if schema in indexes:
+            get_graph().run(f"DROP INDEX {indexes[schema]}")
+            LOGGER.info(f"Dropped index {indexes[schema]} on :{label}({key})")
+
+        get_graph().run(
+            f"CREATE CONSTRAINT {_schema_name(label, key, 'unique')} IF NOT EXISTS "
+            f"FOR (n:{label}) REQUIRE n.{key} IS UNIQUE"
+        )
+        LOGGER.info(f"Created uniqueness constraint on :{label}({key})")
+
+    for label, key in LOOKUP_KEYS:
+        get_graph().run(
+            f"CREATE INDEX {_schema_name(label, key)} IF NOT EXISTS "
+            f"FOR (n:{label}) ON (n.{key})"
+        )
+
+    get_graph().run("CALL db.awaitIndexes()")
+    LOGGER.info("Created schema indexes and constraints")
+
+
+# yields (name, query, parameters, full_scan) for every pipeline statement;
+# full_scan statements read a whole label population by design and are only
+# checked for cartesian products
+def pipeline_queries():
+    from app.app import DROP_ENTRY_QUERY
+    from app.pdbe_complex import ANALYSIS_QUERIES, CLEANUP_QUERIES, MERGE_QUERIES
+
+    for merge_key in NODE_MERGES:
+        query, parameters = unwind_merge_nodes_query([], merge_key)
+        yield f"merge_nodes:{merge_key[0]}", query, parameters, False
+
+    for rel_type, start_key, end_key, keys in RELATIONSHIP_MERGES:
+        query, parameters = unwind_merge_relationships_query(
+            [], rel_type, start_node_key=start_key, end_node_key=end_key, keys=keys
+        )
+        yield (
+            f"merge_relationships:{start_key[0]}-{rel_type}->{end_key[0]}",
+            query,
+            parameters,
+            False,
+        )
+
+    yield "drop_entry", DROP_ENTRY_QUERY, {"entry_id": ""}, False
+
+    for name, (query, parameter) in MERGE_QUERIES.items():
+        yield name, query, {parameter: []}, False
+
+    for name, query in {**ANALYSIS_QUERIES, **CLEANUP_QUERIES}.items():
+        yield name, query, {}, True
+
+
+def plan_operators(plan):
+    # Neo4j 4.x suffixes operators with the runtime, eg. NodeByLabelScan@neo4j
+    operators = [plan["operatorType"].split("@")[0]]
+
+    for child in plan.get("children", []):
+        operators.extend(plan_operators(child))
+
+    return operators
+
+
+def verify_query_plans():
+    violations = []
+
+    for name, query, parameters, full_scan in pipeline_queries():
+        plan = get_graph().run(f"EXPLAIN {query}", parameters).plan()
+        forbidden = CARTESIAN_OPERATORS | (set() if full_scan else SCAN_OPERATORS)
+
+        for operator in plan_operators(plan):
+            if operator in forbidden:
+                violations.append((name, operator))
+                LOGGER.error(f"Query plan for {name} contains {operator}")
+
+    LOGGER.info(f"Verified query plans - {len(violations)} violations")
+
+    return violations
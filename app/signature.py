@@ -0,0 +1,73 @@
+import hashlib
+import json
+from typing import Iterable, NamedTuple, Optional, Tuple
+
+# participant kinds, in the order the assembly query prefers them
+UNIPROT = "uniprot"
+RFAM = "rfam"
+UNMAPPED = "unmapped"
+ENTITY = "entity"
+
+
+class Participant(NamedTuple):
+    # UNIPROT: accession, ENTITY: Entity.UNIQID of a protein entity without
+    # a UniProt mapping, RFAM: Rfam accession, UNMAPPED: RNA, DNA or DNA/RNA
+    kind: str
+    id: str
+    stoichiometry: Optional[int] = None
+    tax_id: Optional[str] = None
+
+    def label(self):
+        if self.kind == UNIPROT:
+            return f"{self.id}_{self.stoichiometry}"
+        if self.kind == ENTITY:
+            return f"{self.id}_{self.stoichiometry}_P"
+        if self.kind == UNMAPPED:
+            return f"{self.id}:UNMAPPED"
+
+        return self.id
+
+
+Signature = Tuple[Participant, ...]
+
+
+def _sort_key(participant: Participant):
+    return (
+        participant.kind,
+        participant.id,
+        -1 if participant.stoichiometry is None else participant.stoichiometry,
+        participant.tax_id or "",
+    )
+
+
+def make_signature(participants: Iterable[Participant]) -> Signature:
+    return tuple(sorted(set(participants), key=_sort_key))
+
+
+def signature_label(signature: Signature):
+    return ",".join(x.label() for x in signature)
+
+
+# signatures are stored on Assembly nodes as a JSON list of participant lists,
+# with a hash to group assemblies on
+def encode_signature(signature: Signature) -> str:
+    return json.dumps([list(x) for x in signature], separators=(",", ":"))
+
+
+def decode_signature(value: str) -> Signature:
+    return make_signature(Participant(*x) for x in json.loads(value))
+
+
+def signature_hash(signature: Signature) -> str:
+    return hashlib.sha1(encode_signature(signature).encode()).hexdigest()
+
+
+# Complex Portal reports an unknown stoichiometry as 0, use the same for
+# values that are not a plain count
+def parse_stoichiometry(value) -> int:
+    if isinstance(value, int):
+        return value
+
+    value = str(value or "").strip()
+
+    return int(value) if value.isdigit() else 0
@@ -0,0 +1,120 @@
+from typing import Dict, Iterator, List, Tuple
+
+from app.signature import Participant, Signature
+
+SIMILARITY_METRICS = ("jaccard", "containment")
+SIMILARITY_BATCH_SIZE = 4096
+
+
+def _scipy():
+    try:
+        import numpy
+        from scipy import sparse
+    except ImportError:
+        raise RuntimeError(
+            "numpy and scipy are required for the near-match search, install "
+            "them with pip install pdbe-complexes-demo[similarity]"
+        )
+
+    return numpy, sparse
+
+
+def _copies(participant: Participant) -> int:
+    # unknown stoichiometries (None, or 0 from Complex Portal) count once
+    return participant.stoichiometry or 1
+
+
+def _participant_rows(signatures: List[Signature], columns: dict):
+    # one column per copy of a participant, so the dot product of two rows is
+    # the number of shared copies, ie. the sum of the smaller stoichiometries
+    indptr = [0]
+    indices = []
+
+    for signature in signatures:
+        # the same accession can appear with different stoichiometries, eg.
+        # two entities mapped to one UniProt entry
+        copies = {}
+        for participant in signature:
+            key = (participant.kind, participant.id)
+            copies[key] = copies.get(key, 0) + _copies(participant)
+
+        for (kind, id), count in copies.items():
+            for copy in range(count):
+                indices.append(columns.setdefault((kind, id, copy), len(columns)))
+        indptr.append(len(indices))
+
+    return indptr, indices
+
+
+def find_near_matches(
+    complexes: Dict[str, Signature],
+    references: Dict[str, Signature],
+    metric: str = "jaccard",
+    threshold: float = 0.5,
+    top: int = 5,
+    batch_size: int = SIMILARITY_BATCH_SIZE,
+) -> Iterator[Tuple[str, str, float]]:
+    # yields (complex, reference, score) for the best scoring references of
+    # each complex, identical signatures are left out. jaccard is
+    # shared / (complex + reference - shared) copies, containment is the
+    # fraction of the reference copies found in the complex
+    if metric not in SIMILARITY_METRICS:
+        raise ValueError(f"Unknown similarity metric {metric}")
+
+    np, sparse = _scipy()
+
+    complex_ids = list(complexes)
+    reference_ids = list(references)
+    columns = {}
+    x_rows = _participant_rows([complexes[x] for x in complex_ids], columns)
+    y_rows = _participant_rows([references[x] for x in reference_ids], columns)
+
+    # both matrices share the column index, so they are built once it is final
+    def matrix(indptr, indices):
+        return sparse.csr_matrix(
+            (np.ones(len(indices), dtype=np.int32), indices, indptr),
+            shape=(len(indptr) - 1, len(columns)),
+        )
+
+    x = matrix(*x_rows)
+    y = matrix(*y_rows)
+    x_sizes = np.diff(x.indptr)
+    y_sizes = np.diff(y.indptr)
+    y_t = y.T.tocsr()
+
+    for start in range(0, len(complex_ids), batch_size):
+        end = start + batch_size
+        shared = (x[start:end] @ y_t).tocoo()
+        row_sizes = x_sizes[start + shared.row]
+        col_sizes = y_sizes[shared.col]
+
+        if metric == "jaccard":
+            scores = shared.data / (row_sizes + col_sizes - shared.data)
+        else:
+            scores = shared.data / col_sizes
+
+        # equal copy counts do not make equal signatures (eg. a known and an
+        # unknown stoichiometry), only the pairs SAME_AS links are left out
+        identical = (shared.data == row_sizes) & (shared.data == col_sizes)
+        for i in np.flatnonzero(identical):
+            identical[i] = (
+                complexes[complex_ids[start + shared.row[i]]]
+                == references[reference_ids[shared.col[i]]]
+            )
+        keep = np.flatnonzero((scores >= threshold) & ~identical)
+
+        # best scores first within each complex
+        order = keep[np.lexsort((-scores[keep], shared.row[keep]))]
+
+        ranked = {}
+        for i in order:
+            row = shared.row[i]
+            if ranked.get(row, 0) == top:
+                continue
+
+            ranked[row] = ranked.get(row, 0) + 1
+            yield (
+                complex_ids[start + row],
+                reference_ids[shared.col[i]],
+                float(scores[i]),
+            )
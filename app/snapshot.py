@@ -0,0 +1,206 @@
+from datetime import datetime
+import json
+import os
+import shutil
+from typing import Dict, Iterable, List, Tuple
+
+from app import LOGGER
+from app.signature import ENTITY, RFAM, UNIPROT, UNMAPPED, Participant, Signature
+
+SNAPSHOT_VERSION = 1
+
+# participant kinds are stored as small integer codes
+KINDS = (UNIPROT, ENTITY, RFAM, UNMAPPED)
+
+# every array is saved as <name>.npy so it can be memory-mapped, string
+# tables as a UTF-8 <name>_data blob with <name>_offsets
+STRING_TABLES = ("participant_id", "participant_tax_id", "complex_id", "assembly_id")
+
+
+def _numpy():
+    try:
+        import numpy
+    except ImportError:
+        raise RuntimeError(
+            "numpy is required for complex snapshots, install it with "
+            "pip install pdbe-complexes-demo[snapshot]"
+        )
+
+    return numpy
+
+
+class StringTable:
+    def __init__(self, offsets, data):
+        self.offsets = offsets
+        self.data = data
+        self._index = None
+
+    def __len__(self):
+        return len(self.offsets) - 1
+
+    def __getitem__(self, i: int) -> str:
+        start, end = self.offsets[i], self.offsets[i + 1]
+
+        return bytes(self.data[start:end]).decode()
+
+    def index(self, value: str) -> int:
+        # reverse lookups decode the whole table once
+        if self._index is None:
+            self._index = {self[i]: i for i in range(len(self))}
+
+        return self._index[value]
+
+
+def _string_arrays(np, values: List[str]):
+    encoded = [x.encode() for x in values]
+    offsets = np.zeros(len(encoded) + 1, dtype=np.int64)
+    np.cumsum([len(x) for x in encoded], out=offsets[1:])
+
+    return offsets, np.frombuffer(b"".join(encoded), dtype=np.uint8)
+
+
+def write_snapshot(
+    path: str,
+    dict_pdb_complex: Dict[str, Tuple[Signature, List[str]]],
+    assemblies: Dict[str, List[str]],
+    subcomplex_edges: Iterable[Tuple[str, str]],
+):
+    np = _numpy()
+
+    # participants are interned without their stoichiometry, which is stored
+    # per complex alongside the CSR indices. Each assembly belongs to a single
+    # complex, so the assembly table is already in CSR order
+    participant_ids = {}
+    complex_ids = list(dict_pdb_complex)
+    complex_positions = {x: i for i, x in enumerate(complex_ids)}
+    indptr = [0]
+    indices = []
+    stoichiometry = []
+    assembly_ids = []
+    assembly_indptr = [0]
+
+    for complex_id in complex_ids:
+        (signature, _) = dict_pdb_complex[complex_id]
+        for participant in signature:
+            key = (participant.kind, participant.id, participant.tax_id)
+            indices.append(participant_ids.setdefault(key, len(participant_ids)))
+            stoichiometry.append(
+                -1 if participant.stoichiometry is None else participant.stoichiometry
+            )
+        indptr.append(len(indices))
+
+        assembly_ids.extend(assemblies.get(complex_id, ()))
+        assembly_indptr.append(len(assembly_ids))
+
+    edges = np.array(
+        [(complex_positions[x], complex_positions[y]) for x, y in subcomplex_edges],
+        dtype=np.int32,
+    ).reshape(-1, 2)
+
+    arrays = {
+        "participant_kind": np.array(
+            [KINDS.index(x[0]) for x in participant_ids], dtype=np.uint8
+        ),
+        "complex_indptr": np.array(indptr, dtype=np.int64),
+        "complex_participants": np.array(indices, dtype=np.int32),
+        "complex_stoichiometry": np.array(stoichiometry, dtype=np.int32),
+        "complex_assembly_indptr": np.array(assembly_indptr, dtype=np.int64),
+        "subcomplex_edges": edges,
+    }
+    for name, values in (
+        ("participant_id", [x[1] for x in participant_ids]),
+        ("participant_tax_id", [x[2] or "" for x in participant_ids]),
+        ("complex_id", complex_ids),
+        ("assembly_id", assembly_ids),
+    ):
+        arrays[f"{name}_offsets"], arrays[f"{name}_data"] = _string_arrays(np, values)
+
+    # written next to the target and swapped in, like the participant index
+    tmp_path = f"{path.rstrip(os.sep)}.tmp"
+    shutil.rmtree(tmp_path, ignore_errors=True)
+    os.makedirs(tmp_path)
+
+    for name, array in arrays.items():
+        np.save(os.path.join(tmp_path, f"{name}.npy"), array)
+
+    with open(os.path.join(tmp_path, "manifest.json"), "w") as f:
+        json.dump(
+            {
+                "version": SNAPSHOT_VERSION,
+                "created": datetime.now().isoformat(),
+                "kinds": KINDS,
+                "complexes": len(complex_ids),
+                "participants": len(participant_ids),
+                "assemblies": len(assembly_ids),
+                "subcomplex_edges": len(edges),
+                "arrays": sorted(arrays),
+            },
+            f,
+            indent=2,
+        )
+
+    shutil.rmtree(path, ignore_errors=True)
+    os.replace(tmp_path, path)
+
+    LOGGER.info(
+        f"Wrote snapshot of {len(complex_ids)} complexes and {len(edges)} "
+        f"sub complex relations to {path}"
+    )
+
+
+class ComplexSnapshot:
+    def __init__(self, path: str, mmap: bool = True):
+        np = _numpy()
+
+        with open(os.path.join(path, "manifest.json")) as f:
+            self.manifest = json.load(f)
+
+        if self.manifest["version"] != SNAPSHOT_VERSION:
+            raise ValueError(
+                f"Unsupported snapshot version {self.manifest['version']} in {path}"
+            )
+
+        self.arrays = {
+            name: np.load(
+                os.path.join(path, f"{name}.npy"), mmap_mode="r" if mmap else None
+            )
+            for name in self.manifest["arrays"]
+        }
+        self.strings = {
+            name: StringTable(
+                self.arrays[f"{name}_offsets"], self.arrays[f"{name}_data"]
+            )
+            for name in STRING_TABLES
+        }
+
+    def __len__(self):
+        return self.manifest["complexes"]
+
+    def complex_index(self, complex_id: str) -> int:
+        return self.strings["complex_id"].index(complex_id)
+
+    def participants(self, i: int) -> List[Participant]:
+        start, end = self.arrays["complex_indptr"][[i, i + 1]]
+        kinds = self.manifest["kinds"]
+
+        return [
+            Participant(
+                kinds[self.arrays["participant_kind"][x]],
+                self.strings["participant_id"][x],
+                None if stoich < 0 else int(stoich),
+                self.strings["participant_tax_id"][x] or None,
+            )
+            for x, stoich in zip(
+                self.arrays["complex_participants"][start:end],
+                self.arrays["complex_stoichiometry"][start:end],
+            )
+        ]
+
+    def assemblies(self, i: int) -> List[str]:
+        start, end = self.arrays["complex_assembly_indptr"][[i, i + 1]]
+
+        return [self.strings["assembly_id"][x] for x in range(start, end)]
+
+    def subcomplex_edges(self):
+        # (sub complex, complex) rows of complex indices
+        return self.arrays["subcomplex_edges"]
@@ -0,0 +1,220 @@
+import os
+import re
+import sqlite3
+import threading
+from typing import Dict, Iterable, Iterator
+
+from app import LOGGER
+from app.utils import batched, open_text, parse_entry_rfam_mapping_api
+
+STORE_BATCH_SIZE = 10000
+# stays below the SQLite limit on query parameters
+STORE_QUERY_SIZE = 500
+
+DE_FULL_NAME = re.compile(r"Full=(.*?)(?: \{[^}]*\})?;")
+OX_TAX_ID = re.compile(r"NCBI_TaxID=(\d+)")
+
+
+def parse_uniprot_dat(path: str) -> Iterator[tuple]:
+    # yields (accessions, name, recommended name, tax id) per entry of a
+    # UniProt flat file (uniprot_sprot.dat, uniprot_trembl.dat, .gz or not)
+    accessions = []
+    name = descr = tax_id = None
+
+    with open_text(path) as f:
+        for line in f:
+            code = line[:2]
+
+            if code == "ID":
+                name = line.split()[1]
+            elif code == "AC":
+                accessions.extend(x for x in line[5:].replace(";", " ").split())
+            elif line.startswith("DE   RecName: Full=") and descr is None:
+                # nested names of Includes:/Contains: sections are indented
+                match = DE_FULL_NAME.search(line)
+                descr = match.group(1) if match else None
+            elif code == "OX" and tax_id is None:
+                match = OX_TAX_ID.search(line)
+                tax_id = match.group(1) if match else None
+            elif code == "//":
+                yield accessions, name, descr, tax_id
+                accessions = []
+                name = descr = tax_id = None
+
+
+def _create_store(path: str, schema: str):
+    # stores are written next to the target and swapped in when complete,
+    # like the participant index
+    tmp_path = f"{path}.tmp"
+    if os.path.exists(tmp_path):
+        os.remove(tmp_path)
+
+    connection = sqlite3.connect(tmp_path)
+    connection.execute("PRAGMA journal_mode = OFF")
+    connection.execute("PRAGMA synchronous = OFF")
+    connection.executescript(schema)
+
+    return connection, tmp_path
+
+
+def _finish_store(connection, tmp_path: str, path: str):
+    connection.commit()
+    connection.close()
+    os.replace(tmp_path, path)
+
+
+def build_uniprot_store(path: str, sources: Iterable[str]):
+    connection, tmp_path = _create_store(
+        path,
+        "CREATE TABLE uniprot (accession TEXT PRIMARY KEY, name TEXT, "
+        "descr TEXT, tax_id TEXT) WITHOUT ROWID;",
+    )
+
+    count = 0
+    for source in sources:
+        LOGGER.info(f"Reading UniProt entries from {source}")
+
+        rows = (
+            (x, name, descr, tax_id)
+            for accessions, name, descr, tax_id in parse_uniprot_dat(source)
+            for x in accessions
+        )
+        for batch in batched(rows, STORE_BATCH_SIZE):
+            count += len(batch)
+            connection.executemany(
+                "INSERT OR REPLACE INTO uniprot VALUES (?, ?, ?, ?)", batch
+            )
+
+    _finish_store(connection, tmp_path, path)
+    LOGGER.info(f"Wrote {count} UniProt accessions to {path}")
+
+
+class SQLiteStore:
+    # read-only, with one connection per thread
+    def __init__(self, path: str):
+        if not os.path.exists(path):
+            raise FileNotFoundError(f"Store {path} does not exist")
+
+        self.path = path
+        self._local = threading.local()
+
+    def _connection(self):
+        if not hasattr(self._local, "connection"):
+            self._local.connection = sqlite3.connect(
+                f"file:{self.path}?mode=ro", uri=True
+            )
+
+        return self._local.connection
+
+
+class UniProtStore(SQLiteStore):
+    # accession -> (name, recommended name, tax id), secondary accessions
+    # included
+
+    def get_many(self, accessions: Iterable[str]) -> Dict[str, dict]:
+        # same shape as the parts of the UniProt REST JSON used by Entry, and
+        # an empty dict for unknown accessions like a failed REST call
+        accessions = list(accessions)
+        result = {x: {} for x in accessions}
+
+        for start in range(0, len(accessions), STORE_QUERY_SIZE):
+            end = start + STORE_QUERY_SIZE
+            batch = accessions[start:end]
+            rows = self._connection().execute(
+                "SELECT accession, name, descr, tax_id FROM uniprot "
+                f"WHERE accession IN ({','.join('?' * len(batch))})",
+                batch,
+            )
+            for accession, name, descr, tax_id in rows:
+                result[accession] = {
+                    "uniProtkbId": name,
+                    "proteinDescription": {
+                        "recommendedName": {"fullName": {"value": descr}}
+                    }
+                    if descr
+                    else {},
+                    "organism": {"taxonId": int(tax_id)} if tax_id else None,
+                }
+
+        for accession, data in result.items():
+            if not data:
+                LOGGER.error(f"UniProt accession {accession} not in {self.path}")
+
+        return result
+
+    def get(self, accession: str) -> dict:
+        return self.get_many([accession])[accession]
+
+
+RFAM_MAPPING_COLUMNS = ("pdb_id", "entity_id", "rfam_acc", "rfam_id")
+
+
+def parse_rfam_mapping_tsv(path: str) -> Iterator[tuple]:
+    # one entity mapping per line in RFAM_MAPPING_COLUMNS order, without a
+    # header, # for comments, further columns are ignored. Rfam's own
+    # pdb_full_region.txt maps chains and not entities, so it is not read here
+    with open_text(path) as f:
+        for number, line in enumerate(f, 1):
+            if not line.strip() or line.startswith("#"):
+                continue
+
+            fields = line.rstrip("\n").split("\t")
+            if len(fields) < len(RFAM_MAPPING_COLUMNS) or not fields[1].isdigit():
+                raise ValueError(
+                    f"{path}:{number}: expected tab separated "
+                    f"{', '.join(RFAM_MAPPING_COLUMNS)} columns"
+                )
+
+            (pdb_id, entity_id, rfam_acc, rfam_id) = fields[:4]
+            yield pdb_id.lower(), int(entity_id), rfam_acc, rfam_id
+
+
+def parse_rfam_mapping_api(entry_ids: Iterable[str]) -> Iterator[tuple]:
+    for entry_id in entry_ids:
+        rfam_result = parse_entry_rfam_mapping_api(entry_id).get("Rfam") or {}
+
+        for rfam_acc, data in rfam_result.items():
+            for mapping in data["mappings"]:
+                yield (
+                    entry_id.lower(),
+                    int(mapping["entity_id"]),
+                    rfam_acc,
+                    data["identifier"],
+                )
+
+
+def build_rfam_store(path: str, mappings: Iterable[tuple]):
+    connection, tmp_path = _create_store(
+        path,
+        "CREATE TABLE rfam_mapping (entry_id TEXT, entity_id INTEGER, "
+        "rfam_acc TEXT, rfam_id TEXT, "
+        "PRIMARY KEY (entry_id, entity_id, rfam_acc)) WITHOUT ROWID;",
+    )
+
+    count = 0
+    for batch in batched(mappings, STORE_BATCH_SIZE):
+        count += len(batch)
+        connection.executemany(
+            "INSERT OR REPLACE INTO rfam_mapping VALUES (?, ?, ?, ?)", batch
+        )
+
+    _finish_store(connection, tmp_path, path)
+    LOGGER.info(f"Wrote {count} Rfam mappings to {path}")
+
+
+class RfamMappingStore(SQLiteStore):
+    # entry -> entity -> Rfam family mappings; entries without rows have no
+    # mapping
+    def get(self, entry_id: str) -> dict:
+        # same shape as the nucleic_mappings/rfam API response used by Entry
+        rfam = {}
+        rows = self._connection().execute(
+            "SELECT entity_id, rfam_acc, rfam_id FROM rfam_mapping "
+            "WHERE entry_id = ?",
+            (entry_id.lower(),),
+        )
+        for entity_id, rfam_acc, rfam_id in rows:
+            data = rfam.setdefault(rfam_acc, {"identifier": rfam_id, "mappings": []})
+            data["mappings"].append({"entity_id": entity_id})
+
+        return {"Rfam": rfam}
@@ -0,0 +1,56 @@
+from collections import defaultdict
+from typing import Dict, Iterator, Set, Tuple
+
+from app.signature import Signature
+
+# sub complexes are found from the signatures in memory (find_supersets) or by
+# batched SUBCOMPLEX_QUERY transactions in the database
+SUBCOMPLEX_ENGINES = ("python", "cypher")
+
+
+def find_supersets(signatures: Dict[str, Signature]) -> Dict[str, Set[str]]:
+    # complexes containing each participant, with the same stoichiometry
+    index = defaultdict(set)
+    for complex_id, signature in signatures.items():
+        for participant in signature:
+            index[participant].add(complex_id)
+
+    supersets = {}
+    for complex_id, signature in signatures.items():
+        candidates = None
+
+        # intersect starting from the rarest participant, most complexes are
+        # left without candidates after one or two participants
+        for participant in sorted(signature, key=lambda x: len(index[x])):
+            if candidates is None:
+                candidates = set(index[participant])
+            else:
+                candidates &= index[participant]
+
+            if len(candidates) == 1:
+                break
+
+        # a superset has every participant of the complex and at least one more
+        supersets[complex_id] = {
+            x for x in candidates or () if len(signatures[x]) > len(signature)
+        }
+
+    return supersets
+
+
+def covering_pairs(supersets: Dict[str, Set[str]]) -> Iterator[Tuple[str, str]]:
+    # (sub complex, complex) pairs of the Hasse diagram: a superset covers the
+    # complex unless it is also a superset of another one of its supersets
+    for complex_id, dests in supersets.items():
+        redundant = set()
+        for dest in dests:
+            redundant |= supersets[dest]
+
+        for dest in dests - redundant:
+            yield complex_id, dest
+
+
+def all_pairs(supersets: Dict[str, Set[str]]) -> Iterator[Tuple[str, str]]:
+    for complex_id, dests in supersets.items():
+        for dest in dests:
+            yield complex_id, dest
@@ -0,0 +1,448 @@
+import csv
+import os
+import random
+from typing import Dict, Iterator, List, Tuple
+
+from app import LOGGER
+from app.graph import GraphWriter, merge_nodes_statement, merge_relationships_statement
+from app.schema import (
+    ASSEMBLY_KEY,
+    COMPLEX_KEY,
+    ENTITY_KEY,
+    ENTRY_KEY,
+    RELATIONSHIP_MERGES,
+    RFAM_KEY,
+    TAXONOMY_KEY,
+    UNIPROT_KEY,
+)
+from app.signature import (
+    ENTITY,
+    RFAM,
+    UNIPROT,
+    UNMAPPED,
+    Participant,
+    encode_signature,
+    make_signature,
+    signature_hash,
+)
+from app.utils import batched
+
+# the relationship merges of app.schema, hashable
+RELATIONSHIPS = [
+    (x, start, end, tuple(keys)) for x, start, end, keys in RELATIONSHIP_MERGES
+]
+(
+    HAS_ENTITY,
+    IS_PART_OF_ASSEMBLY,
+    HAS_UNIPROT,
+    HAS_RFAM,
+    HAS_TAXONOMY,
+    UNIPROT_IN_COMPLEX,
+    ENTRY_IN_COMPLEX,
+) = RELATIONSHIPS
+
+# polymer entities per entry, most entries hold one or two
+ENTITY_COUNTS = (1, 2, 3, 4, 5, 6, 8, 12, 20)
+ENTITY_COUNT_WEIGHTS = (55, 22, 9, 5, 3, 2, 2, 1, 1)
+
+# chains per protein entity in an assembly; large homo-oligomers (eg.
+# chaperonins, capsids) are rare but produce the largest participant counts
+STOICHIOMETRIES = (1, 2, 3, 4, 5, 6, 7, 8, 12, 14, 24, 60)
+STOICHIOMETRY_WEIGHTS = (60, 20, 4, 6, 1, 4, 1, 1, 1, 0.5, 0.5, 0.3)
+
+TAXA = ("9606", "10090", "562", "559292", "10116", "3702", "7227", "83333")
+TAXON_WEIGHTS = (35, 12, 10, 8, 5, 3, 3, 24)
+
+# fraction of polymer entities that are nucleic acids, and of those with an
+# Rfam mapping; fraction of protein entities without a UniProt mapping
+NUCLEIC_ACID_FRACTION = 0.06
+RFAM_FRACTION = 0.5
+UNMAPPED_PROTEIN_FRACTION = 0.05
+# entries with a second, non preferred assembly holding a single entity
+EXTRA_ASSEMBLY_FRACTION = 0.3
+LIGAND_FRACTION = 0.4
+
+# accessions are drawn from a Zipf-like pool, so popular proteins (eg.
+# lysozyme, proteases) recur across many entries with different partners
+ACCESSION_POOL_FRACTION = 0.5
+ZIPF_EXPONENT = 1.1
+RFAM_POOL_SIZE = 300
+
+# Complex Portal complexes per entry, half of them copied from preferred
+# assemblies so that they match a PDB complex
+COMPLEX_FRACTION = 0.05
+MATCHING_COMPLEX_FRACTION = 0.5
+
+# key value and properties of a node, (start, [properties], end) of a
+# relationship, as the bulk merges of app.app take them
+Nodes = Dict[tuple, List[dict]]
+Relationships = Dict[tuple, List[tuple]]
+
+
+class SyntheticDataset:
+    # yields the nodes and relationships of synthetic entries, then of
+    # Complex Portal complexes, in the shape app.app.Entry and ComplexPortal
+    # write them. Shared UniProt, Taxonomy and Rfam nodes are only yielded
+    # the first time, so a dataset is generated once
+    def __init__(self, entries: int, seed: int = 0, signatures: bool = True):
+        self.entry_count = entries
+        self.signatures = signatures
+        self.random = random.Random(seed)
+
+        pool_size = max(int(entries * ACCESSION_POOL_FRACTION), 10)
+        self.accessions = [f"S{x:07d}" for x in range(pool_size)]
+        self.accession_weights = list(
+            _cumulative(1 / (x + 1) ** ZIPF_EXPONENT for x in range(pool_size))
+        )
+        self.taxa = self.random.choices(TAXA, TAXON_WEIGHTS, k=pool_size)
+        self.rfams = [f"RFS{x:05d}" for x in range(RFAM_POOL_SIZE)]
+
+        self.seen = set()
+        self.complex_count = max(int(entries * COMPLEX_FRACTION), 1)
+        self.candidates = []
+        self.candidate_count = 0
+
+    def _accession(self) -> int:
+        return self.random.choices(
+            range(len(self.accessions)), cum_weights=self.accession_weights
+        )[0]
+
+    def _shared(self, nodes: Nodes, rels: Relationships, ref: tuple):
+        # UniProt (with its taxonomy) and Rfam nodes, on first use
+        if ref in self.seen:
+            return
+
+        self.seen.add(ref)
+        (key, value) = ref
+
+        if key == UNIPROT_KEY:
+            index = int(value[1:])
+            tax_id = self.taxa[index]
+            nodes[UNIPROT_KEY].append(
+                {
+                    "ACCESSION": value,
+                    "NAME": f"{value}_SYN",
+                    "DESCR": f"Protein {value}",
+                }
+            )
+            rels[HAS_TAXONOMY].append((value, [], tax_id))
+
+            if (TAXONOMY_KEY, tax_id) not in self.seen:
+                self.seen.add((TAXONOMY_KEY, tax_id))
+                nodes[TAXONOMY_KEY].append({"TAX_ID": tax_id})
+        else:
+            nodes[RFAM_KEY].append({"RFAM_ACC": value, "DESCRIPTION": f"{value}_SYN"})
+
+    def _entities(self, entry_id: str, nodes: Nodes, rels: Relationships):
+        # (entity id, participant) of every polymer entity, the stoichiometry
+        # is set per assembly
+        count = self.random.choices(ENTITY_COUNTS, ENTITY_COUNT_WEIGHTS)[0]
+        entities = []
+
+        for x in range(1, count + 1):
+            uniqid = f"{entry_id}_{x}"
+            nucleic_acid = self.random.random() < NUCLEIC_ACID_FRACTION
+            polymer_type = self.random.choice("RRD") if nucleic_acid else "P"
+
+            nodes[ENTITY_KEY].append(
+                {
+                    "ID": x,
+                    "UNIQID": uniqid,
+                    "DESCRIPTION": f"Entity {x}",
+                    "POLYMER_TYPE": polymer_type,
+                    "TYPE": "p",
+                }
+            )
+            rels[HAS_ENTITY].append((entry_id, [], uniqid))
+
+            if nucleic_acid:
+                if polymer_type == "R" and self.random.random() < RFAM_FRACTION:
+                    rfam = self.random.choice(self.rfams)
+                    self._shared(nodes, rels, (RFAM_KEY, rfam))
+                    rels[HAS_RFAM].append((uniqid, [], rfam))
+                    entities.append((uniqid, Participant(RFAM, rfam)))
+                else:
+                    entities.append(
+                        (
+                            uniqid,
+                            Participant(
+                                UNMAPPED, "RNA" if polymer_type == "R" else "DNA"
+                            ),
+                        )
+                    )
+            elif self.random.random() < UNMAPPED_PROTEIN_FRACTION:
+                entities.append((uniqid, Participant(ENTITY, uniqid)))
+            else:
+                index = self._accession()
+                accession = self.accessions[index]
+                self._shared(nodes, rels, (UNIPROT_KEY, accession))
+                rels[HAS_UNIPROT].append((uniqid, ["1"], accession))
+                entities.append(
+                    (uniqid, Participant(UNIPROT, accession, None, self.taxa[index]))
+                )
+
+        if self.random.random() < LIGAND_FRACTION:
+            x = count + 1
+            nodes[ENTITY_KEY].append(
+                {
+                    "ID": x,
+                    "UNIQID": f"{entry_id}_{x}",
+                    "DESCRIPTION": "Ligand",
+                    "POLYMER_TYPE": "B",
+                    "TYPE": "b",
+                }
+            )
+            rels[HAS_ENTITY].append((entry_id, [], f"{entry_id}_{x}"))
+
+        return entities
+
+    def _assembly(
+        self,
+        entry_id: str,
+        assembly_id: int,
+        prefered: bool,
+        members: List[tuple],
+        nodes: Nodes,
+        rels: Relationships,
+    ):
+        uniqid = f"{entry_id}_{assembly_id}"
+        participants = []
+
+        for entity_id, participant, chains in members:
+            rels[IS_PART_OF_ASSEMBLY].append((entity_id, [chains], uniqid))
+            # only UniProt and protein entity participants have a stoichiometry
+            if participant.kind in (UNIPROT, ENTITY):
+                participant = participant._replace(stoichiometry=chains)
+            participants.append(participant)
+
+        signature = make_signature(participants)
+        assembly = {
+            "UNIQID": uniqid,
+            "ID": assembly_id,
+            "PREFERED": str(prefered),
+            "COMPOSITION": "synthetic",
+        }
+
+        if self.signatures:
+            assembly["SIGNATURE"] = encode_signature(signature)
+            assembly["SIGNATURE_HASH"] = signature_hash(signature)
+
+        nodes[ASSEMBLY_KEY].append(assembly)
+
+        if prefered and all(x.kind == UNIPROT for x in signature):
+            self._sample_candidate(entry_id, signature)
+
+    def _sample_candidate(self, entry_id: str, signature: tuple):
+        # reservoir sample of UniProt-only preferred assemblies, to copy into
+        # matching Complex Portal complexes
+        size = int(self.complex_count * MATCHING_COMPLEX_FRACTION)
+        self.candidate_count += 1
+
+        if len(self.candidates) < size:
+            self.candidates.append((entry_id, signature))
+        else:
+            x = self.random.randrange(self.candidate_count)
+            if x < size:
+                self.candidates[x] = (entry_id, signature)
+
+    def _entry(self, index: int) -> Tuple[Nodes, Relationships]:
+        nodes = {x: [] for x in (ENTRY_KEY, ENTITY_KEY, ASSEMBLY_KEY)}
+        nodes.update({x: [] for x in (UNIPROT_KEY, RFAM_KEY, TAXONOMY_KEY)})
+        rels = {x: [] for x in RELATIONSHIPS[:5]}
+
+        entry_id = f"s{index:07d}"
+        nodes[ENTRY_KEY].append({"ID": entry_id, "TITLE": f"Synthetic {entry_id}"})
+
+        entities = self._entities(entry_id, nodes, rels)
+
+        # the first entity is the one most likely to form a homo-oligomer
+        members = [
+            (
+                entity_id,
+                participant,
+                self.random.choices(STOICHIOMETRIES, STOICHIOMETRY_WEIGHTS)[0]
+                if x == 0
+                else self.random.choice((1, 1, 1, 2)),
+            )
+            for x, (entity_id, participant) in enumerate(entities)
+        ]
+        self._assembly(entry_id, 1, True, members, nodes, rels)
+
+        if self.random.random() < EXTRA_ASSEMBLY_FRACTION:
+            (entity_id, participant, _) = members[0]
+            self._assembly(
+                entry_id, 2, False, [(entity_id, participant, 1)], nodes, rels
+            )
+
+        return nodes, rels
+
+    def entries(self) -> Iterator[Tuple[Nodes, Relationships]]:
+        for x in range(self.entry_count):
+            yield self._entry(x)
+
+    def complexes(self) -> Tuple[Nodes, Relationships]:
+        # Complex Portal data, to be generated after the entries
+        nodes = {COMPLEX_KEY: [], UNIPROT_KEY: [], TAXONOMY_KEY: [], RFAM_KEY: []}
+        rels = {HAS_TAXONOMY: [], UNIPROT_IN_COMPLEX: [], ENTRY_IN_COMPLEX: []}
+
+        complexes = [(entry_id, list(x)) for entry_id, x in self.candidates]
+
+        # the others are random UniProt combinations, some sharing most of
+        # their participants with PDB complexes
+        while len(complexes) < self.complex_count:
+            participants = {}
+            for _ in range(self.random.randint(2, 6)):
+                index = self._accession()
+                participants[index] = Participant(
+                    UNIPROT,
+                    self.accessions[index],
+                    self.random.choice((0, 1, 1, 2, 3, 4)),
+                    self.taxa[index],
+                )
+            complexes.append((None, list(participants.values())))
+
+        for x, (entry_id, participants) in enumerate(complexes):
+            complex_id = f"CPX-S{x}"
+            nodes[COMPLEX_KEY].append(
+                {
+                    "COMPLEX_ID": complex_id,
+                    "RECOMMENDED_NAME": f"Synthetic complex {x}",
+                    "COMPLEX_ASSEMBLY": "synthetic",
+                }
+            )
+
+            for participant in participants:
+                self._shared(nodes, rels, (UNIPROT_KEY, participant.id))
+                rels[UNIPROT_IN_COMPLEX].append(
+                    (participant.id, [str(participant.stoichiometry)], complex_id)
+                )
+
+            if entry_id is not None:
+                rels[ENTRY_IN_COMPLEX].append((entry_id, [], complex_id))
+
+        return nodes, rels
+
+
+def _cumulative(values) -> Iterator[float]:
+    total = 0
+    for x in values:
+        total += x
+        yield total
+
+
+def _merge(batch: List[Tuple[Nodes, Relationships]]):
+    nodes = {}
+    rels = {}
+
+    for x, y in batch:
+        for key, rows in x.items():
+            nodes.setdefault(key, []).extend(rows)
+        for spec, rows in y.items():
+            rels.setdefault(spec, []).extend(rows)
+
+    return nodes, rels
+
+
+def _statements(nodes: Nodes, rels: Relationships):
+    statements = [
+        merge_nodes_statement(rows, merge_key=key)
+        for key, rows in nodes.items()
+        if rows
+    ]
+    statements.extend(
+        merge_relationships_statement(
+            rows, rel_type, start_node_key=start, end_node_key=end, keys=list(keys)
+        )
+        for (rel_type, start, end, keys), rows in rels.items()
+        if rows
+    )
+
+    return statements
+
+
+def write_synthetic_graph(
+    writer: GraphWriter, dataset: SyntheticDataset, batch_size: int = 1000
+):
+    # entries are written batch_size at a time, one transaction per batch
+    count = 0
+    for batch in batched(dataset.entries(), batch_size):
+        writer.write(_statements(*_merge(batch)))
+        count += len(batch)
+        LOGGER.info(f"Wrote {count} of {dataset.entry_count} synthetic entries")
+
+    writer.write(_statements(*dataset.complexes()))
+    LOGGER.info(f"Wrote {dataset.complex_count} synthetic Complex Portal complexes")
+
+
+# neo4j-admin import: integer properties, every other one is a string
+IMPORT_INT_PROPERTIES = {"ID", "NUMBER_OF_CHAINS"}
+
+
+class _ImportFiles:
+    def __init__(self, path: str):
+        self.path = path
+        self.files = {}
+
+    def _writer(self, name: str, header: List[str]):
+        if name not in self.files:
+            f = open(os.path.join(self.path, f"{name}.csv"), "w", newline="")
+            self.files[name] = (f, csv.writer(f))
+            self.files[name][1].writerow(header)
+
+        return self.files[name][1]
+
+    def nodes(self, key: tuple, rows: List[dict]):
+        (label, merge_key) = key
+        names = list(rows[0])
+        header = [
+            f"{x}:ID({label})"
+            if x == merge_key
+            else f"{x}:int"
+            if x in IMPORT_INT_PROPERTIES
+            else x
+            for x in names
+        ]
+        writer = self._writer(label, header + [":LABEL"])
+        writer.writerows([row.get(x) for x in names] + [label] for row in rows)
+
+    def relationships(self, spec: tuple, rows: List[tuple]):
+        (rel_type, start, end, keys) = spec
+        header = [f":START_ID({start[0]})", f":END_ID({end[0]})"]
+        header.extend(f"{x}:int" if x in IMPORT_INT_PROPERTIES else x for x in keys)
+        writer = self._writer(f"{start[0]}_{rel_type}_{end[0]}", header + [":TYPE"])
+        writer.writerows(
+            [start_value, end_value] + list(values) + [rel_type]
+            for start_value, values, end_value in rows
+        )
+
+    def close(self):
+        for f, _ in self.files.values():
+            f.close()
+
+        return sorted(self.files)
+
+
+def write_synthetic_import_files(path: str, dataset: SyntheticDataset):
+    # one CSV file per label and relationship, for neo4j-admin database import
+    os.makedirs(path, exist_ok=True)
+    files = _ImportFiles(path)
+
+    def write(nodes: Nodes, rels: Relationships):
+        for key, rows in nodes.items():
+            if rows:
+                files.nodes(key, rows)
+        for spec, rows in rels.items():
+            if rows:
+                files.relationships(spec, rows)
+
+    try:
+        for nodes, rels in dataset.entries():
+            write(nodes, rels)
+
+        write(*dataset.complexes())
+    finally:
+        names = files.close()
+
+    LOGGER.info(f"Wrote {dataset.entry_count} synthetic entries to {path}")
+
+    return names
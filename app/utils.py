@@ -1,10 +1,18 @@
 import csv
+import gzip
+from itertools import islice
 
 from gemmi import cif
 import requests
 import xmltodict
 
-from app import LOGGER, neo4j_graph
+from app import LOGGER
+from app.graph import get_writer
+
+DROP_EVERYTHING_QUERY = "MATCH (n) DETACH DELETE n"
+
+# seconds, a stalled download fails (and is retried) instead of hanging
+REQUEST_TIMEOUT = 60
 
 
 def get_molecule_type(type: str):
@@ -36,31 +44,38 @@ def get_polymer_type(type: str):
     return type_dict[type]
 
 
-def drop_everything():
-    query = "MATCH (n) DETACH DELETE n"
-    neo4j_graph.run(query)
-    LOGGER.info("Dropped all nodes and relationships")
+# POLYMER_TYPE values of nucleic acid entities, the only ones with Rfam mappings
+NUCLEIC_ACID_TYPES = {"D", "R", "D/R"}
+
 
+def batched(iterable, size: int):
+    iterator = iter(iterable)
+    while True:
+        batch = list(islice(iterator, size))
+        if not batch:
+            return
+        yield batch
 
-def create_schema_indexes():
-    indexes = [
-        "CREATE INDEX ON :UniProt(ACCESSION)",
-        "CREATE INDEX ON :Entry(ID)",
-        "CREATE INDEX ON :RfamFamily(RFAM_ACC)",
-        "CREATE INDEX ON :Complex(COMPLEX_ID)",
-        "CREATE INDEX ON :Taxonomy(TAX_ID)",
-    ]
 
-    for index in indexes:
-        neo4j_graph.run(index)
-    LOGGER.info("Created schema indexes")
+def open_text(path: str):
+    if path.endswith(".gz"):
+        return gzip.open(path, "rt")
+
+    return open(path)
+
+
+def drop_everything():
+    get_writer().run(DROP_EVERYTHING_QUERY)
+    LOGGER.info("Dropped all nodes and relationships")
 
 
 def parse_entry_cif(entry_id: str):
     LOGGER.info(f"Fetching CIF for {entry_id}")
     response = requests.get(
-        f"https://www.ebi.ac.uk/pdbe/entry-files/download/{entry_id}_updated.cif"
+        f"https://www.ebi.ac.uk/pdbe/entry-files/download/{entry_id}_updated.cif",
+        timeout=REQUEST_TIMEOUT,
     )
+    response.raise_for_status()
     LOGGER.info(f"Fetching CIF for {entry_id} - DONE")
     data = response.content.decode("utf-8")
     cif_doc = cif.read_string(data)
@@ -73,13 +88,16 @@ def parse_entry_rfam_mapping_api(entry_id: str):
     LOGGER.info(f"Fetching Rfam mapping for {entry_id}")
 
     response = requests.get(
-        f"https://www.ebi.ac.uk/pdbe/api/nucleic_mappings/rfam/{entry_id}"
+        f"https://www.ebi.ac.uk/pdbe/api/nucleic_mappings/rfam/{entry_id}",
+        timeout=REQUEST_TIMEOUT,
     )
 
-    if response.status_code != 200:
-        LOGGER.error(f"Error while fetching rfam mapping for {entry_id}")
+    # the API answers 404 for entries without mappings
+    if response.status_code == 404:
         return {}
 
+    response.raise_for_status()
+
     data = response.json()
     return data[entry_id]
 
@@ -87,8 +105,10 @@ def parse_entry_rfam_mapping_api(entry_id: str):
 def parse_assembly_xml(entry_id: str):
     LOGGER.info(f"Fetching assembly XML for {entry_id}")
     response = requests.get(
-        f"https://www.ebi.ac.uk/pdbe/static/entry/download/{entry_id}-assembly.xml"
+        f"https://www.ebi.ac.uk/pdbe/static/entry/download/{entry_id}-assembly.xml",
+        timeout=REQUEST_TIMEOUT,
     )
+    response.raise_for_status()
     LOGGER.info(f"Fetching assembly XML for {entry_id} - DONE")
     return xmltodict.parse(response.content, force_list=True)
 
@@ -96,20 +116,25 @@ def parse_assembly_xml(entry_id: str):
 def parse_uniprot_json(accession: str):
     LOGGER.info(f"Fetching UniProt JSON for {accession}")
 
-    response = requests.get(f"https://rest.uniprot.org/uniprotkb/{accession}.json")
+    response = requests.get(
+        f"https://rest.uniprot.org/uniprotkb/{accession}.json",
+        timeout=REQUEST_TIMEOUT,
+    )
 
-    if response.status_code != 200:
-        LOGGER.error(f"Error while fetching UniProt JSON for {accession}")
+    if response.status_code == 404:
+        LOGGER.error(f"UniProt accession {accession} not found")
         return {}
 
+    response.raise_for_status()
+
     return response.json()
 
 
 def parse_tsv(url: str):
-    response = requests.get(url)
+    response = requests.get(url, timeout=REQUEST_TIMEOUT)
 
     if response.status_code != 200:
         LOGGER.error(f"Error while fetching TSV from {url}")
-        return {}
+    response.raise_for_status()
 
     return csv.reader(response.text.split("\n"), delimiter="\t")
@@ -0,0 +1,513 @@
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from datetime import datetime
+import hmac
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+import json
+import os
+import random
+import socket
+import sqlite3
+import threading
+from time import monotonic, sleep, time
+from typing import Iterable, Optional
+
+import requests
+
+from app import LOGGER
+from app.app import Entry, check_entry_rows
+from app.failures import TRANSIENT, classify_failure
+from app.loader import MAX_RETRIES, MAX_RETRY_DELAY, RETRY_DELAY
+from app.utils import REQUEST_TIMEOUT, batched
+
+# seconds a worker holds an entry before it is handed to another worker, it
+# must be longer than the slowest entry takes to load
+LEASE_SECONDS = 900.0
+POLL_INTERVAL = 5.0
+PUBLISH_BATCH_SIZE = 10000
+# prepared entries written by the coordinator per round
+PREPARED_BATCH_SIZE = 100
+# seconds the coordinator keeps serving a finished queue, so polling workers
+# are told it is finished instead of finding the connection closed
+FINISHED_GRACE = 3 * POLL_INTERVAL
+# seconds a worker retries an unreachable queue before it exits, its leased
+# entries go to other workers once the leases expire
+QUEUE_TIMEOUT = 300.0
+MAX_QUEUE_RETRY_DELAY = 60.0
+
+PENDING = "pending"
+LEASED = "leased"
+# fetched by a worker started with --send-rows, waiting to be written
+PREPARED = "prepared"
+DONE = "done"
+FAILED = "failed"
+
+QUEUE_SCHEMA = """
+CREATE TABLE IF NOT EXISTS queue (
+    entry_id TEXT PRIMARY KEY,
+    state TEXT NOT NULL DEFAULT 'pending',
+    attempts INTEGER NOT NULL DEFAULT 0,
+    worker TEXT,
+    available REAL NOT NULL DEFAULT 0,
+    lease_expires REAL,
+    category TEXT,
+    error TEXT,
+    rows TEXT
+);
+CREATE INDEX IF NOT EXISTS queue_state ON queue (state, available);
+"""
+
+
+class WorkQueue:
+    # entry leases in a SQLite file: workers on the coordinator host (or
+    # sharing the file over a filesystem with working locks) open it directly,
+    # the others go through serve_queue and RemoteWorkQueue
+    def __init__(
+        self,
+        path: str,
+        retries: int = MAX_RETRIES,
+        retry_delay: float = RETRY_DELAY,
+    ):
+        self.path = path
+        self.retries = retries
+        self.retry_delay = retry_delay
+        self._local = threading.local()
+
+        self._connection().executescript(QUEUE_SCHEMA)
+
+    def _connection(self):
+        if not hasattr(self._local, "connection"):
+            # transactions are started explicitly, see _transaction
+            self._local.connection = sqlite3.connect(
+                self.path, timeout=60, isolation_level=None
+            )
+        return self._local.connection
+
+    @contextmanager
+    def _transaction(self):
+        connection = self._connection()
+        # takes the write lock up front, so two workers never claim the same
+        # entry
+        connection.execute("BEGIN IMMEDIATE")
+        try:
+            yield connection
+        except BaseException:
+            connection.execute("ROLLBACK")
+            raise
+        connection.execute("COMMIT")
+
+    def _delay(self, attempt: int):
+        delay = min(self.retry_delay * 2 ** (attempt - 1), MAX_RETRY_DELAY)
+        return delay * random.uniform(0.5, 1.0)
+
+    def publish(self, entries: Iterable[str]):
+        # entries already in the queue keep their state, so publishing the
+        # same list again resumes it
+        count = 0
+        for batch in batched(entries, PUBLISH_BATCH_SIZE):
+            with self._transaction() as connection:
+                connection.executemany(
+                    "INSERT OR IGNORE INTO queue (entry_id) VALUES (?)",
+                    ((x,) for x in batch),
+                )
+            count += len(batch)
+
+        LOGGER.info(f"Published {count} entries to {self.path}")
+
+        return count
+
+    def claim(self, worker: str, count: int = 1, lease: float = LEASE_SECONDS):
+        now = time()
+
+        with self._transaction() as connection:
+            # leases of crashed workers expire, the entry then counts as a
+            # transient failure of that attempt
+            connection.execute(
+                "UPDATE queue SET state = ?, category = ?, "
+                "error = 'lease expired' WHERE state = ? AND lease_expires < ? "
+                "AND attempts > ?",
+                (FAILED, TRANSIENT, LEASED, now, self.retries),
+            )
+            entries = [
+                x
+                for (x,) in connection.execute(
+                    "SELECT entry_id FROM queue WHERE (state = ? AND available <= ?) "
+                    "OR (state = ? AND lease_expires < ?) LIMIT ?",
+                    (PENDING, now, LEASED, now, count),
+                )
+            ]
+            connection.executemany(
+                "UPDATE queue SET state = ?, worker = ?, lease_expires = ?, "
+                "attempts = attempts + 1 WHERE entry_id = ?",
+                ((LEASED, worker, now + lease, x) for x in entries),
+            )
+
+        return entries
+
+    def submit(self, worker: str, entry_id: str, rows: dict):
+        # only the prepared rows of the entry are accepted, the coordinator
+        # builds the statements from them (see app.app.entry_statements)
+        rows = json.dumps(check_entry_rows(entry_id, rows), separators=(",", ":"))
+
+        with self._transaction() as connection:
+            connection.execute(
+                "UPDATE queue SET state = ?, rows = ? "
+                "WHERE entry_id = ? AND state = ? AND worker = ?",
+                (PREPARED, rows, entry_id, LEASED, worker),
+            )
+
+    def prepared(self, count: int = PREPARED_BATCH_SIZE):
+        return (
+            self._connection()
+            .execute(
+                "SELECT entry_id, rows FROM queue WHERE state = ? LIMIT ?",
+                (PREPARED, count),
+            )
+            .fetchall()
+        )
+
+    def complete(self, entry_id: str):
+        # the entry writes are idempotent merges, so an entry finished by a
+        # worker whose lease expired is done all the same
+        with self._transaction() as connection:
+            connection.execute(
+                "UPDATE queue SET state = ?, rows = NULL, category = NULL, "
+                "error = NULL WHERE entry_id = ?",
+                (DONE, entry_id),
+            )
+
+    def fail(
+        self, entry_id: str, category: str, error: str, worker: Optional[str] = None
+    ):
+        # worker is None for write failures of prepared entries on the
+        # coordinator; failures of a worker whose lease was taken over are
+        # ignored
+        with self._transaction() as connection:
+            row = connection.execute(
+                "SELECT attempts FROM queue WHERE entry_id = ? AND state IN (?, ?) "
+                "AND (? IS NULL OR worker = ?)",
+                (entry_id, LEASED, PREPARED, worker, worker),
+            ).fetchone()
+            if row is None:
+                return
+
+            (attempts,) = row
+            if category == TRANSIENT and attempts <= self.retries:
+                state = PENDING
+                LOGGER.warning(
+                    f"Entry {entry_id} failed ({category}), retry {attempts} of "
+                    f"{self.retries}"
+                )
+            else:
+                state = FAILED
+                LOGGER.error(
+                    f"Entry {entry_id} failed ({category}) after {attempts} attempts"
+                )
+
+            connection.execute(
+                "UPDATE queue SET state = ?, available = ?, category = ?, error = ?, "
+                "rows = NULL WHERE entry_id = ?",
+                (state, time() + self._delay(attempts), category, error, entry_id),
+            )
+
+    def finished(self):
+        return not _remaining(self.counts())
+
+    def counts(self):
+        counts = {x: 0 for x in (PENDING, LEASED, PREPARED, DONE, FAILED)}
+        counts.update(
+            self._connection().execute(
+                "SELECT state, COUNT(*) FROM queue GROUP BY state"
+            )
+        )
+        return counts
+
+    def failures(self):
+        return [
+            {"entry_id": x, "category": category, "error": error, "attempts": attempts}
+            for (x, category, error, attempts) in self._connection().execute(
+                "SELECT entry_id, category, error, attempts FROM queue "
+                "WHERE state = ? ORDER BY entry_id",
+                (FAILED,),
+            )
+        ]
+
+    def write_failure_report(self, path: str):
+        # same layout as the load-entries report
+        counts = self.counts()
+        failures = self.failures()
+        categories = {}
+        for failure in failures:
+            categories[failure["category"]] = categories.get(failure["category"], 0) + 1
+
+        with open(path, "w") as f:
+            json.dump(
+                {
+                    "created": datetime.now().isoformat(),
+                    "interrupted": False,
+                    "entries": sum(counts.values()),
+                    "loaded": counts[DONE],
+                    "failed": len(failures),
+                    "categories": categories,
+                    "failures": failures,
+                },
+                f,
+                indent=2,
+            )
+
+        LOGGER.info(f"Wrote failure report to {path}")
+
+
+# queue methods workers call over HTTP
+REMOTE_METHODS = ("claim", "submit", "complete", "fail", "counts", "finished")
+# shared secret of the coordinator and its remote workers, sent as a bearer
+# token with every request
+TOKEN_VARIABLE = "WORK_QUEUE_TOKEN"
+
+
+class QueueUnreachable(Exception):
+    pass
+
+
+def _retry_queue(call, stop: threading.Event, timeout: float = QUEUE_TIMEOUT):
+    # connection errors, timeouts and server errors of the coordinator, or a
+    # locked queue file, are retried with backoff until the timeout
+    deadline = monotonic() + timeout
+    delay = 1.0
+
+    while True:
+        try:
+            return call()
+        except (requests.RequestException, sqlite3.OperationalError) as e:
+            response = getattr(e, "response", None)
+            if response is not None and response.status_code < 500:
+                raise
+            if stop.is_set() or monotonic() + delay > deadline:
+                raise QueueUnreachable(str(e)) from e
+
+            LOGGER.warning(f"Work queue unreachable ({e}), retry in {delay:.0f}s")
+            stop.wait(delay)
+            delay = min(delay * 2, MAX_QUEUE_RETRY_DELAY)
+
+
+class RemoteWorkQueue:
+    def __init__(self, url: str, token: str = None):
+        self.url = url.rstrip("/")
+        self.token = token or os.getenv(TOKEN_VARIABLE)
+
+    def _call(self, method: str, **kwargs):
+        response = requests.post(
+            f"{self.url}/{method}",
+            json=kwargs,
+            headers={"Authorization": f"Bearer {self.token}"},
+            timeout=REQUEST_TIMEOUT,
+        )
+        response.raise_for_status()
+        return response.json()
+
+    def __getattr__(self, method: str):
+        if method not in REMOTE_METHODS:
+            raise AttributeError(method)
+        return lambda **kwargs: self._call(method, **kwargs)
+
+
+class _QueueRequestHandler(BaseHTTPRequestHandler):
+    def do_POST(self):
+        method = self.path.strip("/")
+        authorization = self.headers.get("Authorization") or ""
+        if not hmac.compare_digest(
+            authorization.encode(), f"Bearer {self.server.token}".encode()
+        ):
+            LOGGER.warning(f"Unauthorized queue request from {self.address_string()}")
+            self.send_error(401)
+            return
+        if method not in REMOTE_METHODS:
+            self.send_error(404)
+            return
+
+        try:
+            length = int(self.headers.get("Content-Length") or 0)
+            kwargs = json.loads(self.rfile.read(length) or b"{}")
+            result = getattr(self.server.queue, method)(**kwargs)
+        except (ValueError, TypeError) as e:
+            # malformed requests and rows, including pydantic validation errors
+            LOGGER.warning(f"Rejected queue request {method}: {e}")
+            self.send_error(400, str(e)[:200])
+            return
+        except Exception as e:
+            LOGGER.error(f"Queue request {method} failed: {e}", exc_info=True)
+            self.send_error(500, str(e))
+            return
+
+        body = json.dumps(result).encode()
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        LOGGER.debug(f"Queue request from {self.address_string()}: {format % args}")
+
+
+def serve_queue(queue: WorkQueue, address: str, token: str = None):
+    # address is host:port, the server runs until the process exits
+    token = token or os.getenv(TOKEN_VARIABLE)
+    if not token:
+        raise ValueError(f"Set {TOKEN_VARIABLE} to serve the work queue")
+
+    (host, port) = address.rsplit(":", 1)
+    server = ThreadingHTTPServer((host, int(port)), _QueueRequestHandler)
+    server.queue = queue
+    server.token = token
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+
+    LOGGER.info(f"Serving the work queue on {address}")
+
+    return server
+
+
+def open_queue(queue: str, **kwargs):
+    if queue.startswith(("http://", "https://")):
+        return RemoteWorkQueue(queue)
+    return WorkQueue(queue, **kwargs)
+
+
+def _remaining(counts: dict):
+    return counts[PENDING] + counts[LEASED] + counts[PREPARED]
+
+
+def run_coordinator(
+    queue: WorkQueue,
+    entries: Iterable[str],
+    threads: int = 4,
+    serve: str = None,
+    failure_report: str = None,
+    poll: float = POLL_INTERVAL,
+    grace: float = FINISHED_GRACE,
+):
+    # publishes the entries, then writes the entries prepared by workers
+    # started with --send-rows until every entry is done or failed
+    queue.publish(entries)
+    if serve:
+        server = serve_queue(queue, serve)
+
+    def write(entry_id: str, rows: str):
+        try:
+            Entry(entry_id).write(json.loads(rows))
+        except Exception as e:
+            queue.fail(entry_id, classify_failure(e), f"{type(e).__name__}: {e}")
+            return
+        queue.complete(entry_id)
+
+    last = None
+    with ThreadPoolExecutor(max_workers=threads) as executor:
+        while True:
+            prepared = queue.prepared()
+            list(executor.map(lambda x: write(*x), prepared))
+
+            counts = queue.counts()
+            if counts != last:
+                LOGGER.info(
+                    ", ".join(f"{value} {key}" for key, value in counts.items())
+                )
+                last = counts
+
+            if not _remaining(counts):
+                break
+            if not prepared:
+                sleep(poll)
+
+    if serve:
+        LOGGER.info(f"Queue finished, serving it for another {grace:.0f}s")
+        sleep(grace)
+        server.shutdown()
+    if failure_report:
+        queue.write_failure_report(failure_report)
+
+    return queue.failures()
+
+
+def run_worker(
+    queue,
+    threads: int = 4,
+    lease: float = LEASE_SECONDS,
+    send_rows: bool = False,
+    worker: str = None,
+    uniprot_store=None,
+    rfam_store=None,
+    poll: float = POLL_INTERVAL,
+    timeout: float = QUEUE_TIMEOUT,
+):
+    # with send_rows the worker needs no graph access, the coordinator writes
+    # the statements of the entries it prepares
+    worker = worker or f"{socket.gethostname()}-{os.getpid()}"
+    stores = {"uniprot_store": uniprot_store, "rfam_store": rfam_store}
+    processed = []
+    # set once the queue stays unreachable, so the other threads stop too
+    stop = threading.Event()
+
+    def call(method: str, **kwargs):
+        return _retry_queue(
+            lambda: getattr(queue, method)(**kwargs), stop, timeout=timeout
+        )
+
+    def process(entry_id: str):
+        try:
+            entry = Entry(entry_id, **stores)
+
+            if send_rows:
+                entry.prepare()
+                rows = check_entry_rows(entry_id, entry.rows())
+            else:
+                entry.run()
+        except Exception as e:
+            if send_rows:
+                LOGGER.error(f"Error preparing entry {entry_id}: {e}", exc_info=True)
+            call(
+                "fail",
+                entry_id=entry_id,
+                category=classify_failure(e),
+                error=f"{type(e).__name__}: {e}",
+                worker=worker,
+            )
+            return
+
+        if send_rows:
+            call("submit", worker=worker, entry_id=entry_id, rows=rows)
+        else:
+            call("complete", entry_id=entry_id)
+
+    def work():
+        # runs until the queue is finished, entries leased by other workers
+        # come back when their lease expires
+        try:
+            while not stop.is_set():
+                claimed = call("claim", worker=worker, count=1, lease=lease)
+                if claimed:
+                    process(claimed[0])
+                    processed.append(claimed[0])
+                elif call("finished"):
+                    return
+                else:
+                    stop.wait(poll)
+        except QueueUnreachable as e:
+            if not stop.is_set():
+                LOGGER.error(f"Worker {worker} stopped, work queue unreachable: {e}")
+            stop.set()
+        except requests.HTTPError as e:
+            # eg. a wrong WORK_QUEUE_TOKEN
+            if not stop.is_set():
+                LOGGER.error(f"Worker {worker} stopped, work queue rejected it: {e}")
+            stop.set()
+
+    LOGGER.info(f"Worker {worker} started with {threads} threads")
+
+    with ThreadPoolExecutor(max_workers=threads) as executor:
+        for future in [executor.submit(work) for _ in range(threads)]:
+            future.result()
+
+    LOGGER.info(f"Worker {worker} finished, processed {len(processed)} entries")
+
+    return len(processed)
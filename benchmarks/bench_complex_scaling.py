@@ -0,0 +1,116 @@
+"""Scaling of the complex analysis: generates synthetic datasets of several
+sizes and times process_complex_data, find_subcomplexes and
+process_subcomplex_data on each, with the peak Python memory of every stage.
+
+    python -m benchmarks.bench_complex_scaling --entries 10000,20000,100000
+
+The memory backend is used by default, so no Neo4j server is needed. With
+--backend py2neo or bolt, the configured database is EMPTIED before each size.
+"""
+import argparse
+import json
+import os
+import tempfile
+from time import perf_counter
+import tracemalloc
+
+
+def measure(function, memory: bool):
+    if memory:
+        tracemalloc.start()
+
+    start = perf_counter()
+    result = function()
+    elapsed = perf_counter() - start
+
+    peak = 0
+    if memory:
+        (_, peak) = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+
+    return result, elapsed, peak / 2**20
+
+
+def bench(entries: int, seed: int, signatures: bool, memory: bool, path: str):
+    from app.graph import get_writer
+    from app.pdbe_complex import PDBeComplex
+    from app.synthetic import SyntheticDataset, write_synthetic_graph
+    from app.utils import drop_everything
+
+    drop_everything()
+    start = perf_counter()
+    write_synthetic_graph(
+        get_writer(), SyntheticDataset(entries, seed=seed, signatures=signatures)
+    )
+    load_time = perf_counter() - start
+
+    complexes = PDBeComplex(os.path.join(path, f"subcomplexes_{entries}.csv"))
+    result = {"entries": entries, "load_time": load_time}
+
+    (_, result["complex_time"], result["complex_memory"]) = measure(
+        complexes.process_complex_data, memory
+    )
+    (pairs, result["subcomplex_time"], result["subcomplex_memory"]) = measure(
+        lambda: list(complexes.find_subcomplexes()), memory
+    )
+    (_, result["write_time"], result["write_memory"]) = measure(
+        lambda: complexes.process_subcomplex_data(pairs), memory
+    )
+
+    result["assemblies"] = sum(
+        len(x) for x in complexes.dict_pdb_complex_assemblies.values()
+    )
+    result["pdb_complexes"] = len(complexes.dict_pdb_complex)
+    result["common_complexes"] = len(complexes.common_complexes)
+    result["subcomplex_pairs"] = len(pairs)
+
+    return result
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--entries", default="5000,10000,20000,50000")
+    parser.add_argument("--backend", default="memory")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument(
+        "--no-signatures",
+        action="store_true",
+        help="benchmark the assembly traversal instead of the stored signatures",
+    )
+    parser.add_argument(
+        "--no-memory",
+        action="store_true",
+        help="skip tracemalloc, which slows the stages down",
+    )
+    parser.add_argument("--output", help="write the results to a JSON file")
+    args = parser.parse_args()
+
+    # read by app.graph.get_writer on first use
+    os.environ["GRAPH_BACKEND"] = args.backend
+
+    results = []
+    with tempfile.TemporaryDirectory() as path:
+        for entries in [int(x) for x in args.entries.split(",")]:
+            result = bench(
+                entries, args.seed, not args.no_signatures, not args.no_memory, path
+            )
+            results.append(result)
+
+            print(
+                f"{entries:>8} entries, {result['pdb_complexes']:>8} complexes, "
+                f"{result['subcomplex_pairs']:>9} sub complex pairs: "
+                f"complexes {result['complex_time']:7.2f}s "
+                f"{result['complex_memory']:7.1f}MB, "
+                f"sub complexes {result['subcomplex_time']:7.2f}s "
+                f"{result['subcomplex_memory']:7.1f}MB, "
+                f"writes {result['write_time']:7.2f}s "
+                f"{result['write_memory']:7.1f}MB"
+            )
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(results, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
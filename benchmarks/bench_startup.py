@@ -0,0 +1,78 @@
+"""CLI startup time: wall time of short pdbecomplexes_demo invocations and the
+slowest imports of app.cli, measured in fresh interpreters.
+
+    python benchmarks/bench_startup.py --runs 20
+"""
+import argparse
+import os
+import statistics
+import subprocess
+import sys
+from time import perf_counter
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+COMMANDS = {
+    "import": ["-c", "import app.cli"],
+    "help": ["-c", "from app.cli import main; main()", "--help"],
+    "command-help": [
+        "-c",
+        "from app.cli import main; main()",
+        "run-pdbe-complex-analysis",
+        "--help",
+    ],
+}
+
+
+def run(args):
+    start = perf_counter()
+    subprocess.run(
+        [sys.executable] + args,
+        cwd=ROOT,
+        check=True,
+        stdout=subprocess.DEVNULL,
+        stderr=subprocess.DEVNULL,
+    )
+
+    return perf_counter() - start
+
+
+def slowest_imports(count):
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", "import app.cli"],
+        cwd=ROOT,
+        check=True,
+        capture_output=True,
+        text=True,
+    )
+
+    # lines look like "import time:   self [us] | cumulative | imported package"
+    imports = []
+    for line in result.stderr.splitlines():
+        parts = line.split("|")
+        if len(parts) == 3 and parts[1].strip().isdigit():
+            imports.append((int(parts[1]), parts[2].rstrip()))
+
+    return sorted(imports, reverse=True)[:count]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--runs", type=int, default=10)
+    parser.add_argument("--top", type=int, default=10)
+    args = parser.parse_args()
+
+    for name, command in COMMANDS.items():
+        times = sorted(run(command) for _ in range(args.runs))
+        print(
+            f"{name:>14}: min {times[0] * 1000:.1f} ms, "
+            f"median {statistics.median(times) * 1000:.1f} ms"
+        )
+
+    print("\nslowest imports of app.cli (cumulative):")
+    for cumulative, name in slowest_imports(args.top):
+        print(f"  {cumulative / 1000:8.1f} ms {name}")
+
+
+if __name__ == "__main__":
+    main()
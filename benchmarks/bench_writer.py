@@ -0,0 +1,98 @@
+"""Write throughput of the graph backends: merges batches of synthetic nodes
+and relationships with each backend against the configured Neo4j server.
+
+    python -m benchmarks.bench_writer --backends autocommit,py2neo,bolt
+
+The autocommit baseline writes like the pipeline did before the graph writers:
+each bulk merge in its own py2neo auto-commit transaction, without retries.
+
+The benchmark uses its own BenchNode label and removes it afterwards.
+"""
+import argparse
+from concurrent.futures import ThreadPoolExecutor
+from time import perf_counter
+
+from app.graph import (
+    Py2neoWriter,
+    create_writer,
+    merge_nodes_statement,
+    merge_relationships_statement,
+)
+
+BENCH_KEY = ("BenchNode", "UNIQID")
+
+
+class AutoCommitWriter(Py2neoWriter):
+    # py2neo.bulk.merge_nodes(graph.auto(), ...) runs the same statement
+    def write(self, statements):
+        for statement in statements:
+            self.graph.auto().update(statement.query, statement.parameters)
+
+
+BASELINES = {"autocommit": AutoCommitWriter}
+
+
+def statements(batch: range):
+    nodes = [{"UNIQID": f"n{i}", "NAME": f"node {i}"} for i in batch]
+    rels = [(f"n{i}", [i % 10], f"n{i - 1}") for i in batch if i != batch.start]
+
+    return [
+        merge_nodes_statement(nodes, BENCH_KEY),
+        merge_relationships_statement(
+            rels, "BENCH_LINK", BENCH_KEY, BENCH_KEY, keys=["WEIGHT"]
+        ),
+    ]
+
+
+def clean(writer):
+    writer.run("MATCH (n:BenchNode) DETACH DELETE n")
+
+
+def bench(backend: str, nodes: int, batch_size: int, threads: int):
+    if backend in BASELINES:
+        writer = BASELINES[backend]()
+    else:
+        writer = create_writer(backend)
+    writer.run(
+        "CREATE CONSTRAINT bench_node_uniqid IF NOT EXISTS "
+        "FOR (n:BenchNode) REQUIRE n.UNIQID IS UNIQUE"
+    )
+    clean(writer)
+
+    batches = [
+        range(x, min(x + batch_size, nodes)) for x in range(0, nodes, batch_size)
+    ]
+
+    start = perf_counter()
+    with ThreadPoolExecutor(max_workers=threads) as executor:
+        list(executor.map(lambda x: writer.write(statements(x)), batches))
+    write_time = perf_counter() - start
+
+    start = perf_counter()
+    rows = sum(1 for _ in writer.stream("MATCH (n:BenchNode) RETURN n.UNIQID"))
+    read_time = perf_counter() - start
+
+    clean(writer)
+    writer.run("DROP CONSTRAINT bench_node_uniqid IF EXISTS")
+    writer.close()
+
+    print(
+        f"{backend:>8}: wrote {nodes} nodes in {write_time:.2f}s "
+        f"({nodes / write_time:.0f}/s), streamed {rows} rows in {read_time:.2f}s"
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--backends", default="autocommit,py2neo,bolt")
+    parser.add_argument("--nodes", type=int, default=50000)
+    parser.add_argument("--batch-size", type=int, default=1000)
+    parser.add_argument("--threads", type=int, default=4)
+    args = parser.parse_args()
+
+    for backend in args.backends.split(","):
+        bench(backend, args.nodes, args.batch_size, args.threads)
+
+
+if __name__ == "__main__":
+    main()
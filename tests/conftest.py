@@ -0,0 +1,13 @@
+import pytest
+
+import app.graph
+from app.memory_graph import MemoryWriter
+
+
+@pytest.fixture
+def memory_writer(monkeypatch):
+    # the shared writer of app.graph.get_writer, an empty in-memory graph
+    writer = MemoryWriter()
+    monkeypatch.setattr(app.graph, "_writer", writer)
+
+    return writer
@@ -0,0 +1,133 @@
+import os
+
+from gemmi import cif
+import pytest
+import xmltodict
+
+import app.app
+from app.app import Entry
+from app.pdbe_complex import ASSEMBLY_QUERY
+from app.schema import ASSEMBLY_KEY
+from app.signature import (
+    ENTITY,
+    RFAM,
+    UNIPROT,
+    UNMAPPED,
+    Participant,
+    decode_signature,
+    make_signature,
+)
+
+DATA = os.path.join(os.path.dirname(__file__), "data")
+
+# P55555 and P66666 are unknown to UniProt, so they have no taxonomy
+UNIPROT_DATA = {
+    "P11111": {"uniProtkbId": "ONE_HUMAN", "organism": {"taxonId": 9606}},
+    "P22222": {"uniProtkbId": "TWO_MOUSE", "organism": {"taxonId": 10090}},
+    "P33333": {"uniProtkbId": "THREE_HUMAN", "organism": {"taxonId": 9606}},
+    "P44444": {"uniProtkbId": "FOUR_HUMAN", "organism": {"taxonId": 9606}},
+}
+RFAM_DATA = {
+    "Rfam": {
+        "RF00005": {"identifier": "tRNA", "mappings": [{"entity_id": 5}]},
+        "RF00001": {"identifier": "5S_rRNA", "mappings": [{"entity_id": 11}]},
+        "RF00002": {"identifier": "5_8S_rRNA", "mappings": [{"entity_id": 11}]},
+    }
+}
+
+
+class UniProtStore:
+    def get_many(self, accessions):
+        return {x: UNIPROT_DATA.get(x, {}) for x in accessions}
+
+
+class RfamStore:
+    def get(self, entry_id):
+        return RFAM_DATA
+
+
+@pytest.fixture
+def entry(memory_writer, monkeypatch):
+    def parse_entry_cif(entry_id):
+        return cif.read(os.path.join(DATA, f"{entry_id}_updated.cif")).sole_block()
+
+    def parse_assembly_xml(entry_id):
+        with open(os.path.join(DATA, f"{entry_id}-assembly.xml"), "rb") as f:
+            return xmltodict.parse(f.read(), force_list=True)
+
+    monkeypatch.setattr(app.app, "parse_entry_cif", parse_entry_cif)
+    monkeypatch.setattr(app.app, "parse_assembly_xml", parse_assembly_xml)
+
+    entry = Entry("1chm", uniprot_store=UniProtStore(), rfam_store=RfamStore())
+    entry.run()
+
+    return entry
+
+
+def stored_signatures(graph):
+    return {
+        x[1]: decode_signature(graph.node(x)["SIGNATURE"])
+        for x in graph.refs(ASSEMBLY_KEY[0])
+    }
+
+
+def query_signatures(writer):
+    # the fallback of the analysis for assemblies without a stored signature,
+    # which only reads preferred assemblies
+    writer.merge_nodes(
+        [
+            {"UNIQID": x, "PREFERED": "True", "SIGNATURE": None, "SIGNATURE_HASH": None}
+            for x in writer.graph.nodes[ASSEMBLY_KEY[0]]
+        ],
+        ASSEMBLY_KEY,
+    )
+
+    return {
+        assembly_id: make_signature(Participant(*x) for x in participants)
+        for assembly_id, participants in writer.stream(ASSEMBLY_QUERY)
+    }
+
+
+def test_stored_signatures_match_the_assembly_query(entry, memory_writer):
+    stored = stored_signatures(memory_writer.graph)
+    queried = query_signatures(memory_writer)
+
+    # the query leaves out assemblies without polymer entities
+    assert stored["1chm_4"] == ()
+    assert "1chm_4" not in queried
+    assert {x: y for x, y in stored.items() if y} == queried
+
+
+def test_stored_signatures(entry, memory_writer):
+    stored = stored_signatures(memory_writer.graph)
+
+    assert stored["1chm_1"] == make_signature(
+        [
+            # chimeric entity, both best mapped accessions
+            Participant(UNIPROT, "P11111", 2, "9606"),
+            Participant(UNIPROT, "P22222", 2, "10090"),
+            # the secondary mapping P44444 is left out; entities 2 and 13 give
+            # the same participant, entity 12 another stoichiometry
+            Participant(UNIPROT, "P33333", 1, "9606"),
+            Participant(UNIPROT, "P33333", 2, "9606"),
+            # without a UniProt mapping with a taxonomy
+            Participant(ENTITY, "1chm_3", 3),
+            Participant(ENTITY, "1chm_4", 1),
+            Participant(RFAM, "RF00005"),
+            Participant(UNMAPPED, "RNA"),
+            Participant(UNMAPPED, "DNA"),
+            Participant(UNMAPPED, "DNA/RNA"),
+            # the accession with a taxonomy of a chimeric entity
+            Participant(UNIPROT, "P11111", 1, "9606"),
+            Participant(RFAM, "RF00001"),
+            Participant(RFAM, "RF00002"),
+        ]
+    )
+    assert stored["1chm_2"] == make_signature(
+        [
+            Participant(UNIPROT, "P11111", 1, "9606"),
+            Participant(UNIPROT, "P22222", 1, "10090"),
+            Participant(RFAM, "RF00005"),
+        ]
+    )
+    assert stored["1chm_3"] == (Participant(ENTITY, "1chm_3", 1),)
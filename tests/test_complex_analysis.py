@@ -0,0 +1,233 @@
+import csv
+
+import pytest
+
+import app.app
+from app.app import ENTRY_NODE_ROWS, ENTRY_RELATIONSHIP_ROWS, ComplexPortal, Entry
+from app.pdbe_complex import run_pdbe_complex
+from app.schema import COMPLEX_KEY, ENTRY_KEY, TAXONOMY_KEY
+from app.signature import (
+    ENTITY,
+    RFAM,
+    UNIPROT,
+    Participant,
+    decode_signature,
+    make_signature,
+    parse_stoichiometry,
+)
+from app.subcomplex import SUBCOMPLEX_ENGINES
+from app.synthetic import HAS_TAXONOMY, UNIPROT_IN_COMPLEX, SyntheticDataset
+
+ENTRIES = 300
+
+# participant node labels of the PDBComplex nodes
+LABELS = {
+    UNIPROT: "UniProt",
+    ENTITY: "Entity",
+    RFAM: "RfamFamily",
+}
+
+
+def entry_rows(nodes, rels):
+    # the synthetic nodes and relationships of an entry as app.app.Entry rows
+    names = {merge_key: x for x, (_, merge_key) in ENTRY_NODE_ROWS.items()}
+    rows = {names[key]: values for key, values in nodes.items()}
+    names = {x[0]: name for name, x in ENTRY_RELATIONSHIP_ROWS.items()}
+    rows.update({names[rel_type]: values for (rel_type, *_), values in rels.items()})
+
+    return rows
+
+
+def complex_portal_files(nodes, rels):
+    # the Complex Portal release files of app.app.ComplexPortal, by file name
+    complexes = [["#Complex ac", "Name", "Aliases", "Assembly", "Taxonomy"]] + [
+        [x["COMPLEX_ID"], x["RECOMMENDED_NAME"], "", x["COMPLEX_ASSEMBLY"], ""]
+        for x in nodes[COMPLEX_KEY]
+    ]
+    components = [["#Complex ac", "Name", "Database", "Accession", "Stoich"]] + [
+        [complex_id, "", "uniprotkb", accession, stoichiometry]
+        for accession, (stoichiometry,), complex_id in rels[UNIPROT_IN_COMPLEX]
+    ]
+
+    return {
+        "complex_portal_complexes.tsv": complexes,
+        "complex_portal_components.tsv": components,
+        "complex_portal_xrefs.tsv": [["#Complex ac", "Database", "Identifiers"]],
+    }
+
+
+def participant_key(participant: Participant):
+    label = LABELS.get(participant.kind, "UnmappedPolymer")
+    return (label, participant.id, participant.stoichiometry)
+
+
+def graph_signatures(graph):
+    # PDBComplex ID -> participants as (label, key, STOICHIOMETRY)
+    return {
+        complex_id: frozenset(
+            (start[0], start[1], rel.get("STOICHIOMETRY"))
+            for (rel_type, start, end), rels in graph.rels.items()
+            if rel_type == "IS_PART_OF_PDB_COMPLEX"
+            and end == ("PDBComplex", complex_id)
+            and start[0] != "Assembly"
+            for rel in rels
+        )
+        for complex_id in graph.nodes["PDBComplex"]
+    }
+
+
+@pytest.fixture
+def dataset(memory_writer, monkeypatch):
+    # loads a synthetic dataset through Entry and ComplexPortal, returns the
+    # expected assembly and Complex Portal signatures; Complex Portal has no
+    # taxonomy, so accessions of no loaded entry are left out of the complexes
+    dataset = SyntheticDataset(ENTRIES, seed=7)
+    tax_ids = {}
+    assemblies = set()
+
+    for nodes, rels in dataset.entries():
+        tax_ids.update({x: tax_id for x, _, tax_id in rels[HAS_TAXONOMY]})
+        assemblies.update(
+            decode_signature(x["SIGNATURE"])
+            for x in nodes[("Assembly", "UNIQID")]
+            if x["PREFERED"] == "True"
+        )
+        Entry(nodes[ENTRY_KEY][0]["ID"]).write(entry_rows(nodes, rels))
+
+    (nodes, rels) = dataset.complexes()
+    files = complex_portal_files(nodes, rels)
+    monkeypatch.setattr(
+        app.app, "parse_tsv", lambda url: iter(files[url.rsplit("/", 1)[1]])
+    )
+    ComplexPortal(threads=2, chunk_size=7).run()
+
+    complexes = {}
+    for accession, (stoichiometry,), complex_id in rels[UNIPROT_IN_COMPLEX]:
+        if accession not in tax_ids:
+            continue
+        complexes.setdefault(complex_id, []).append(
+            Participant(
+                UNIPROT,
+                accession,
+                parse_stoichiometry(stoichiometry),
+                tax_ids[accession],
+            )
+        )
+
+    return (
+        {x for x in assemblies if x},
+        {x: make_signature(y) for x, y in complexes.items()},
+    )
+
+
+def expected_pairs(signatures, transitive_reduction):
+    pairs = {(x, y) for x in signatures for y in signatures if x < y}
+    if not transitive_reduction:
+        return pairs
+
+    return {(x, y) for x, y in pairs if not any(x < z < y for z in signatures)}
+
+
+@pytest.mark.parametrize("subcomplex_engine", SUBCOMPLEX_ENGINES)
+@pytest.mark.parametrize("transitive_reduction", [False, True])
+def test_complex_analysis(
+    dataset, memory_writer, tmp_path, transitive_reduction, subcomplex_engine
+):
+    (assemblies, complexes) = dataset
+    outcsv = tmp_path / "complex_subcomplex.csv"
+
+    run_pdbe_complex(
+        str(outcsv),
+        transitive_reduction=transitive_reduction,
+        subcomplex_engine=subcomplex_engine,
+    )
+
+    graph = memory_writer.graph
+    actual = graph_signatures(graph)
+    expected = {
+        frozenset(participant_key(x) for x in signature)
+        for signature in assemblies | set(complexes.values())
+    }
+
+    # one PDBComplex per distinct assembly or Complex Portal signature
+    assert len(actual) == len(expected)
+    assert set(actual.values()) == expected
+    assert all(
+        graph.node(("PDBComplex", x))["PARTICIPANT_COUNT"] == len(y)
+        for x, y in actual.items()
+    )
+
+    # SAME_AS links the Complex Portal complexes seen in a preferred assembly
+    same_as = {
+        (actual[start[1]], end[1])
+        for (rel_type, start, end) in graph.rels
+        if rel_type == "SAME_AS"
+    }
+    assert same_as
+    assert same_as == {
+        (frozenset(participant_key(x) for x in signature), complex_id)
+        for complex_id, signature in complexes.items()
+        if signature in assemblies
+    }
+
+    subcomplexes = {
+        (actual[start[1]], actual[end[1]])
+        for (rel_type, start, end) in graph.rels
+        if rel_type == "IS_SUB_COMPLEX_OF"
+    }
+    assert subcomplexes
+    assert subcomplexes == expected_pairs(expected, transitive_reduction)
+
+    with open(outcsv) as f:
+        assert len(list(csv.reader(f))) == len(subcomplexes) + 1
+
+
+def test_complex_portal_nodes(dataset, memory_writer):
+    (_, complexes) = dataset
+    graph = memory_writer.graph
+
+    assert set(complexes) <= set(graph.nodes["Complex"])
+    for complex_id, signature in complexes.items():
+        rels = graph.into((COMPLEX_KEY[0], complex_id), "IS_PART_OF_COMPLEX", "UniProt")
+        assert (
+            make_signature(
+                Participant(
+                    UNIPROT,
+                    uniprot[1],
+                    parse_stoichiometry(rel["STOICHIOMETRY"]),
+                    tax[1],
+                )
+                for uniprot, rel in rels
+                for tax, _ in graph.out(uniprot, "HAS_TAXONOMY", TAXONOMY_KEY[0])
+            )
+            == signature
+        )
+
+
+def test_synthetic_dataset_is_loaded(dataset, memory_writer):
+    graph = memory_writer.graph
+
+    assert len(graph.nodes["Entry"]) == ENTRIES
+    assert all(graph.out(x, "HAS_ENTITY", "Entity") for x in graph.refs("Entry"))
+
+
+def test_complex_analysis_snapshot(dataset, memory_writer, tmp_path):
+    pytest.importorskip("numpy")
+    from app.snapshot import ComplexSnapshot
+
+    run_pdbe_complex(
+        str(tmp_path / "complex_subcomplex.csv"), snapshot_dir=str(tmp_path / "snap")
+    )
+
+    graph = memory_writer.graph
+    snapshot = ComplexSnapshot(str(tmp_path / "snap"))
+    complex_ids = [snapshot.strings["complex_id"][i] for i in range(len(snapshot))]
+
+    assert sorted(complex_ids) == sorted(graph.nodes["PDBComplex"])
+    assert {
+        (complex_ids[x], complex_ids[y]) for x, y in snapshot.subcomplex_edges()
+    } == {
+        (start[1], end[1])
+        for (rel_type, start, end) in graph.rels
+        if rel_type == "IS_SUB_COMPLEX_OF"
+    }
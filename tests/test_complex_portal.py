@@ -0,0 +1,91 @@
+import random
+
+import pytest
+
+import app.app
+from app.app import ComplexPortal
+import app.graph
+from app.memory_graph import MemoryWriter
+
+
+def release_files(seed=3, complexes=60):
+    # Complex Portal release files, by file name, with UniProt accessions and
+    # PDB entries shared between complexes
+    rng = random.Random(seed)
+    complex_rows = [["#Complex ac", "Name", "Aliases", "Assembly", "Taxonomy"]]
+    components = [["#Complex ac", "Name", "Database", "Accession", "Stoich"]]
+    xrefs = [["#Complex ac", "Database", "Identifiers"]]
+
+    for i in range(complexes):
+        complex_id = f"CPX-{i}"
+        complex_rows.append([complex_id, f"complex {i}", "", "Heterodimer", "9606"])
+        for accession in rng.sample(range(40), rng.randint(1, 4)):
+            components.append(
+                [complex_id, "", "uniprotkb", f"P{accession:05}", rng.choice("0123")]
+            )
+        # other databases are skipped
+        components.append([complex_id, "", "chebi", "CHEBI:15377", "0"])
+        entries = [f"{rng.randrange(1, 4)}AB{rng.randrange(10)}" for _ in range(3)]
+        xrefs.append([complex_id, "wwpdb", ",".join(entries[: rng.randint(0, 3)])])
+
+    return {
+        "complex_portal_complexes.tsv": complex_rows,
+        "complex_portal_components.tsv": components,
+        "complex_portal_xrefs.tsv": xrefs,
+    }
+
+
+def graph_contents(graph):
+    return (
+        {label: dict(nodes) for label, nodes in graph.nodes.items() if nodes},
+        {key: sorted(rels, key=repr) for key, rels in graph.rels.items()},
+    )
+
+
+@pytest.fixture
+def files(monkeypatch):
+    files = release_files()
+    monkeypatch.setattr(
+        app.app, "parse_tsv", lambda url: iter(files[url.rsplit("/", 1)[1]])
+    )
+
+    return files
+
+
+def test_relationship_chunks_do_not_share_complexes(files):
+    complex_portal = ComplexPortal(chunk_size=10)
+    complex_portal.prepare()
+
+    seen = set()
+    chunks = complex_portal._relationship_chunks()
+    assert len(chunks) > 1
+
+    for chunk in chunks:
+        complex_ids = {
+            row[2] for statement in chunk for row in statement.parameters["data"]
+        }
+        assert not complex_ids & seen
+        seen |= complex_ids
+
+
+def test_chunked_write_matches_single_transaction(files, memory_writer, monkeypatch):
+    ComplexPortal(threads=4, chunk_size=7).run()
+    chunked = graph_contents(memory_writer.graph)
+
+    # every statement of an unchunked load in one transaction
+    writer = MemoryWriter()
+    monkeypatch.setattr(app.graph, "_writer", writer)
+    complex_portal = ComplexPortal(chunk_size=10**6)
+    complex_portal.prepare()
+    writer.write(
+        complex_portal._complex_node_statements()
+        + complex_portal._component_uniprot_node_statements()
+        + complex_portal._xref_entry_node_statements()
+        + [x for chunk in complex_portal._relationship_chunks() for x in chunk]
+    )
+    single = graph_contents(writer.graph)
+
+    assert chunked == single
+    assert len(chunked[0]["Complex"]) == 60
+    assert {x[0] for x in chunked[1]} == {"IS_PART_OF_COMPLEX"}
+    assert {x[1][0] for x in chunked[1]} == {"UniProt", "Entry"}
@@ -0,0 +1,52 @@
+from xml.parsers.expat import ExpatError
+
+import pytest
+import requests
+
+from app.failures import GRAPH, PARSE, TRANSIENT, UNKNOWN, UPSTREAM, classify_failure
+
+
+def http_error(status_code: int):
+    response = requests.Response()
+    response.status_code = status_code
+
+    return requests.HTTPError(f"{status_code} error", response=response)
+
+
+def graph_error(name: str, code: str = None):
+    # like the errors of the neo4j driver, without importing it
+    error = type(name, (Exception,), {"__module__": "neo4j.exceptions"})()
+    error.code = code
+
+    return error
+
+
+@pytest.mark.parametrize(
+    "error, category",
+    [
+        (requests.ConnectionError(), TRANSIENT),
+        (requests.Timeout(), TRANSIENT),
+        (ConnectionResetError(), TRANSIENT),
+        (http_error(503), TRANSIENT),
+        (http_error(429), TRANSIENT),
+        (http_error(404), UPSTREAM),
+        (http_error(400), UPSTREAM),
+        (graph_error("ServiceUnavailable"), TRANSIENT),
+        (
+            graph_error(
+                "ClientError", "Neo.TransientError.Transaction.DeadlockDetected"
+            ),
+            TRANSIENT,
+        ),
+        (graph_error("ConstraintError", "Neo.ClientError.Schema.Constraint"), GRAPH),
+        (ValueError("expected block header"), PARSE),
+        (KeyError("_entity.id"), PARSE),
+        (IndexError(), PARSE),
+        (ExpatError(), PARSE),
+        (RuntimeError(), UNKNOWN),
+        (AttributeError(), UNKNOWN),
+        (TypeError(), UNKNOWN),
+    ],
+)
+def test_classify_failure(error, category):
+    assert classify_failure(error) == category
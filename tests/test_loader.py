@@ -0,0 +1,210 @@
+import gzip
+import io
+import json
+import os
+import signal
+import threading
+from time import sleep
+
+import pytest
+import requests
+
+import app.app
+from app.failures import PARSE, TRANSIENT, UNKNOWN, UPSTREAM
+import app.loader
+from app.loader import MAX_RETRY_DELAY, EntryLoader, read_entries
+
+
+def http_error(status_code: int):
+    response = requests.Response()
+    response.status_code = status_code
+
+    return requests.HTTPError(f"{status_code} error", response=response)
+
+
+class FakeEntry:
+    # entry ID -> errors raised by the first attempts, then the entry loads
+    errors = {}
+    attempts = {}
+    lock = threading.Lock()
+    on_run = None
+
+    def __init__(self, entry_id, uniprot_store=None, rfam_store=None):
+        self.entry_id = entry_id
+
+    def run(self):
+        with self.lock:
+            attempt = self.attempts.get(self.entry_id, 0)
+            self.attempts[self.entry_id] = attempt + 1
+
+        # read from the class, so the hook is not bound to the entry
+        if FakeEntry.on_run:
+            FakeEntry.on_run(self.entry_id)
+
+        errors = self.errors.get(self.entry_id, [])
+        if attempt < len(errors):
+            raise errors[attempt]
+
+
+@pytest.fixture
+def entries(monkeypatch):
+    monkeypatch.setattr(app.app, "Entry", FakeEntry)
+    monkeypatch.setattr(FakeEntry, "errors", {})
+    monkeypatch.setattr(FakeEntry, "attempts", {})
+    monkeypatch.setattr(FakeEntry, "on_run", None)
+
+    return FakeEntry
+
+
+def test_transient_error_is_retried(entries):
+    entries.errors = {"1abc": [requests.ConnectionError("reset"), http_error(503)]}
+    loader = EntryLoader(threads=2, retries=3, retry_delay=0.001)
+
+    assert loader.load(["1abc", "2xyz"]) == {}
+    assert entries.attempts == {"1abc": 3, "2xyz": 1}
+    assert (loader.entries, loader.loaded, loader.retried) == (2, 2, 2)
+
+
+def test_retries_are_bounded(entries):
+    entries.errors = {"1abc": [requests.Timeout("timed out")] * 5}
+    loader = EntryLoader(threads=2, retries=2, retry_delay=0.001)
+
+    failures = loader.load(["1abc"])
+
+    assert entries.attempts == {"1abc": 3}
+    assert failures["1abc"]["category"] == TRANSIENT
+    assert failures["1abc"]["attempts"] == 3
+    assert loader.retried == 2
+
+
+@pytest.mark.parametrize(
+    "error, category",
+    [
+        (http_error(404), UPSTREAM),
+        (ValueError("bad cif"), PARSE),
+        (RuntimeError("bug"), UNKNOWN),
+    ],
+)
+def test_permanent_errors_are_not_retried(entries, error, category):
+    entries.errors = {"1abc": [error]}
+    loader = EntryLoader(threads=2, retries=3, retry_delay=0.001)
+
+    failures = loader.load(["1abc", "2xyz"])
+
+    assert entries.attempts == {"1abc": 1, "2xyz": 1}
+    assert failures == {
+        "1abc": {
+            "entry_id": "1abc",
+            "category": category,
+            "error": f"{type(error).__name__}: {error}",
+            "attempts": 1,
+        }
+    }
+    assert loader.loaded == 1
+
+
+def test_backoff(monkeypatch):
+    monkeypatch.setattr(app.loader.random, "uniform", lambda a, b: b)
+    loader = EntryLoader(retry_delay=10)
+
+    assert [loader._delay(x) for x in range(1, 7)] == [
+        10,
+        20,
+        40,
+        80,
+        160,
+        MAX_RETRY_DELAY,
+    ]
+
+    # jitter between half and the full delay
+    monkeypatch.setattr(app.loader.random, "uniform", lambda a, b: a)
+    assert loader._delay(2) == 10
+
+
+def test_max_pending(entries):
+    # entries read from the list but not loaded yet
+    read = []
+    loaded = []
+    in_flight = []
+
+    def entry_ids():
+        for i in range(20):
+            read.append(i)
+            in_flight.append(len(read) - len(loaded))
+            yield f"{i}abc"
+
+    def on_run(entry_id):
+        sleep(0.005)
+        loaded.append(entry_id)
+
+    entries.on_run = on_run
+    loader = EntryLoader(threads=4, max_pending=3)
+
+    assert loader.load(entry_ids()) == {}
+    assert loader.loaded == 20
+    assert max(in_flight) <= 3
+
+
+def test_cancel_stops_reading_entries(entries):
+    # the first entry fails with a transient error and cancels the load: the
+    # entries in progress finish, the retry is reported as failed
+    entries.errors = {"1abc": [requests.ConnectionError("reset")]}
+    cancel = threading.Event()
+    entries.on_run = lambda entry_id: cancel.set()
+    loader = EntryLoader(threads=1, max_pending=1, retry_delay=60, cancel=cancel)
+
+    failures = loader.load(["1abc", "2xyz", "3def"])
+
+    assert loader.interrupted
+    assert entries.attempts == {"1abc": 1}
+    assert failures["1abc"]["category"] == TRANSIENT
+    assert loader.entries == 1
+
+
+def test_interrupt(entries):
+    handler = signal.getsignal(signal.SIGINT)
+    entries.on_run = lambda entry_id: os.kill(os.getpid(), signal.SIGINT)
+    loader = EntryLoader(threads=1, max_pending=1)
+
+    assert loader.load(["1abc", "2xyz", "3def"]) == {}
+
+    assert loader.interrupted
+    assert entries.attempts == {"1abc": 1}
+    assert loader.loaded == 1
+    # the handler of the caller is restored
+    assert signal.getsignal(signal.SIGINT) is handler
+
+
+def test_failure_report(entries, tmp_path):
+    entries.errors = {
+        "3def": [http_error(404)],
+        "1abc": [http_error(410)],
+        "2xyz": [KeyError("entity")],
+    }
+    loader = EntryLoader(threads=2, retries=0)
+    loader.load(["1abc", "2xyz", "3def", "4ghi"])
+
+    loader.write_failure_report(str(tmp_path / "failures.json"))
+    with open(tmp_path / "failures.json") as f:
+        report = json.load(f)
+
+    assert report["interrupted"] is False
+    assert (report["entries"], report["loaded"], report["failed"]) == (4, 1, 3)
+    assert report["categories"] == {UPSTREAM: 2, PARSE: 1}
+    assert [x["entry_id"] for x in report["failures"]] == ["1abc", "2xyz", "3def"]
+
+
+def test_read_entries(tmp_path, monkeypatch):
+    assert list(read_entries("1abc, 2xyz,,3def")) == ["1abc", "2xyz", "3def"]
+
+    path = tmp_path / "entries.txt.gz"
+    with gzip.open(path, "wt") as f:
+        f.write("1abc\n\n 2xyz \n")
+    assert list(read_entries(str(path))) == ["1abc", "2xyz"]
+
+    path = tmp_path / "entries.txt"
+    path.write_text("1abc\n2xyz\n")
+    assert list(read_entries(str(path))) == ["1abc", "2xyz"]
+
+    monkeypatch.setattr("sys.stdin", io.StringIO("1abc\n2xyz\n"))
+    assert list(read_entries("-")) == ["1abc", "2xyz"]
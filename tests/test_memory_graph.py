@@ -0,0 +1,190 @@
+import pytest
+
+from app.app import DROP_ENTRY_QUERY
+from app.memory_graph import MemoryWriter
+from app.pdbe_complex import (
+    CREATE_PDB_COMPLEX_QUERY,
+    CREATE_SUBCOMPLEX_QUERY,
+    MERGE_ACCESSION_QUERY,
+    MERGE_ENTITY_QUERY,
+    SUB_COMPLEX_CLOSURE_QUERY,
+    SUBCOMPLEX_QUERY,
+)
+from app.schema import ASSEMBLY_KEY, ENTITY_KEY, ENTRY_KEY, UNIPROT_KEY
+
+
+@pytest.fixture
+def writer():
+    # entry 1abc: entities 1 and 2 (P1 and P2) in assembly 1abc_1, entry 2xyz:
+    # entity 1 (P1) in assembly 2xyz_1
+    writer = MemoryWriter()
+    writer.merge_nodes([{"ID": "1abc"}, {"ID": "2xyz"}], ENTRY_KEY)
+    writer.merge_nodes(
+        [
+            {"UNIQID": "1abc_1", "POLYMER_TYPE": "P"},
+            {"UNIQID": "1abc_2", "POLYMER_TYPE": "P"},
+            {"UNIQID": "2xyz_1", "POLYMER_TYPE": "P"},
+        ],
+        ENTITY_KEY,
+    )
+    writer.merge_nodes(
+        [{"UNIQID": "1abc_1", "PREFERED": "True"}, {"UNIQID": "2xyz_1"}],
+        ASSEMBLY_KEY,
+    )
+    writer.merge_nodes([{"ACCESSION": "P1"}, {"ACCESSION": "P2"}], UNIPROT_KEY)
+    writer.merge_relationships(
+        [("1abc", [], "1abc_1"), ("1abc", [], "1abc_2"), ("2xyz", [], "2xyz_1")],
+        "HAS_ENTITY",
+        ENTRY_KEY,
+        ENTITY_KEY,
+    )
+    writer.merge_relationships(
+        [
+            ("1abc_1", [2], "1abc_1"),
+            ("1abc_2", [1], "1abc_1"),
+            ("2xyz_1", [2], "2xyz_1"),
+        ],
+        "IS_PART_OF_ASSEMBLY",
+        ENTITY_KEY,
+        ASSEMBLY_KEY,
+        ["NUMBER_OF_CHAINS"],
+    )
+    writer.merge_relationships(
+        [("1abc_1", ["1"], "P1"), ("1abc_2", ["1"], "P2"), ("2xyz_1", ["1"], "P1")],
+        "HAS_UNIPROT",
+        ENTITY_KEY,
+        UNIPROT_KEY,
+        ["BEST_MAPPING"],
+    )
+    # an unknown node is skipped like an unmatched MATCH
+    writer.merge_relationships(
+        [("1abc_1", ["1"], "P9")], "HAS_UNIPROT", ENTITY_KEY, UNIPROT_KEY, ["X"]
+    )
+
+    return writer
+
+
+def pdb_complexes(writer):
+    writer.run(
+        CREATE_PDB_COMPLEX_QUERY,
+        {
+            "pdb_complex_params_list": [
+                {"complex_id": "PDB-CPX-1", "participant_count": 1},
+                {"complex_id": "PDB-CPX-2", "participant_count": 2},
+                {"complex_id": "PDB-CPX-3", "participant_count": 2},
+            ]
+        },
+    )
+    writer.run(
+        MERGE_ACCESSION_QUERY,
+        {
+            "accession_params_list": [
+                {"complex_id": "PDB-CPX-1", "accession": "P1", "stoichiometry": 2},
+                {"complex_id": "PDB-CPX-2", "accession": "P1", "stoichiometry": 2},
+                {"complex_id": "PDB-CPX-2", "accession": "P2", "stoichiometry": 1},
+                {"complex_id": "PDB-CPX-3", "accession": "P1", "stoichiometry": 1},
+                {"complex_id": "PDB-CPX-3", "accession": "P1", "stoichiometry": 3},
+                {"complex_id": "PDB-CPX-9", "accession": "P1", "stoichiometry": 1},
+            ]
+        },
+    )
+
+
+def test_merge_nodes_and_relationships(writer):
+    graph = writer.graph
+
+    assert sorted(graph.nodes["Entity"]) == ["1abc_1", "1abc_2", "2xyz_1"]
+    assert graph.node(("Entity", "1abc_2")) == {"UNIQID": "1abc_2", "POLYMER_TYPE": "P"}
+    assert graph.out(("Entity", "1abc_1"), "IS_PART_OF_ASSEMBLY", "Assembly") == [
+        (("Assembly", "1abc_1"), {"NUMBER_OF_CHAINS": 2})
+    ]
+    assert graph.out(("Entity", "1abc_1"), "HAS_UNIPROT", "UniProt") == [
+        (("UniProt", "P1"), {"BEST_MAPPING": "1"})
+    ]
+    entities = graph.into(("UniProt", "P1"), "HAS_UNIPROT", "Entity")
+    assert sorted(x[1] for x, _ in entities) == ["1abc_1", "2xyz_1"]
+
+
+def test_merge_nodes_updates_and_removes_properties(writer):
+    writer.merge_nodes(
+        [{"UNIQID": "1abc_2", "POLYMER_TYPE": None, "TYPE": "p"}], ENTITY_KEY
+    )
+
+    assert writer.graph.node(("Entity", "1abc_2")) == {"UNIQID": "1abc_2", "TYPE": "p"}
+
+
+def test_pdb_complex_participants(writer):
+    pdb_complexes(writer)
+    graph = writer.graph
+
+    assert sorted(graph.nodes["PDBComplex"]) == ["PDB-CPX-1", "PDB-CPX-2", "PDB-CPX-3"]
+    assert graph.node(("PDBComplex", "PDB-CPX-2")) == {
+        "COMPLEX_ID": "PDB-CPX-2",
+        "PARTICIPANT_COUNT": 2,
+    }
+    assert sorted(
+        x[1]
+        for x, _ in graph.into(
+            ("PDBComplex", "PDB-CPX-2"), "IS_PART_OF_PDB_COMPLEX", "UniProt"
+        )
+    ) == ["P1", "P2"]
+
+    # STOICHIOMETRY is in the MERGE pattern, Neo4j makes a relationship per value
+    rels = graph.into(("PDBComplex", "PDB-CPX-3"), "IS_PART_OF_PDB_COMPLEX", "UniProt")
+    assert sorted(rel["STOICHIOMETRY"] for _, rel in rels) == [1, 3]
+    assert {x for x, _ in rels} == {("UniProt", "P1")}
+
+    # merging an existing stoichiometry again makes no new relationship
+    pdb_complexes(writer)
+    rels = graph.into(("PDBComplex", "PDB-CPX-3"), "IS_PART_OF_PDB_COMPLEX", "UniProt")
+    assert sorted(rel["STOICHIOMETRY"] for _, rel in rels) == [1, 3]
+
+
+def test_subcomplexes(writer):
+    pdb_complexes(writer)
+
+    rows = writer.data(
+        SUBCOMPLEX_QUERY, {"source_complex_ids": ["PDB-CPX-1", "PDB-CPX-9"]}
+    )
+    assert rows == [{"sub_complex_id": "PDB-CPX-1", "complex_id": "PDB-CPX-2"}]
+
+    writer.run(CREATE_SUBCOMPLEX_QUERY, {"subcomplex_params_list": rows})
+    assert writer.data(SUB_COMPLEX_CLOSURE_QUERY, {"complex_id": "PDB-CPX-2"}) == [
+        {"complex_id": "PDB-CPX-1"}
+    ]
+
+
+def test_entity_participants_and_drop_entry(writer):
+    pdb_complexes(writer)
+    writer.run(
+        MERGE_ENTITY_QUERY,
+        {
+            "entity_params_list": [
+                {
+                    "complex_id": "PDB-CPX-1",
+                    "entity_uniqid": "1abc_1",
+                    "stoichiometry": 2,
+                }
+            ]
+        },
+    )
+    graph = writer.graph
+    assert graph.into(
+        ("PDBComplex", "PDB-CPX-1"), "IS_PART_OF_PDB_COMPLEX", "Entity"
+    ) == [(("Entity", "1abc_1"), {"STOICHIOMETRY": 2})]
+
+    writer.run(DROP_ENTRY_QUERY, {"entry_id": "1abc"})
+
+    assert sorted(graph.nodes["Entry"]) == ["2xyz"]
+    assert sorted(graph.nodes["Entity"]) == ["2xyz_1"]
+    assert sorted(graph.nodes["Assembly"]) == ["2xyz_1"]
+    assert (
+        graph.into(("PDBComplex", "PDB-CPX-1"), "IS_PART_OF_PDB_COMPLEX", "Entity")
+        == []
+    )
+    assert graph.into(("UniProt", "P2"), "HAS_UNIPROT", "Entity") == []
+
+
+def test_unsupported_query(writer):
+    with pytest.raises(NotImplementedError):
+        writer.run("MATCH (n) RETURN count(n)")
@@ -0,0 +1,191 @@
+import json
+import os
+import signal
+import threading
+from time import sleep
+
+import pytest
+
+from app.pipeline import Pipeline, Stage
+
+
+class Stages:
+    # a -> b -> c, with inputs, results and errors set per test
+    def __init__(self, tmp_path):
+        self.inputs = {"a": 1, "b": 1, "c": 1}
+        self.results = {}
+        self.errors = {}
+        self.calls = []
+        self.retries = []
+        self.outputs = {"c": str(tmp_path / "c.out")}
+        self.state_file = str(tmp_path / "build_state.json")
+
+    def run(self, name):
+        self.calls.append(name)
+        if name in self.errors:
+            raise self.errors[name]
+        if name in self.outputs:
+            with open(self.outputs[name], "w") as f:
+                f.write(name)
+
+        return self.results.get(name)
+
+    def retry(self, items):
+        self.retries.append(items)
+        return self.results.get("retry")
+
+    def stage(self, name, depends=()):
+        return Stage(
+            name,
+            lambda: self.run(name),
+            lambda: self.inputs[name],
+            depends,
+            tuple(x for x in [self.outputs.get(name)] if x),
+            retry=self.retry,
+        )
+
+    def build(self, **kwargs):
+        self.calls = []
+        stages = [self.stage("a"), self.stage("b", ("a",)), self.stage("c", ("b",))]
+        Pipeline(stages, self.state_file, **kwargs).run()
+
+        return sorted(self.calls)
+
+    def state(self):
+        with open(self.state_file) as f:
+            return json.load(f)
+
+
+@pytest.fixture
+def stages(tmp_path, monkeypatch):
+    for name in ("GRAPH_BACKEND", "NEO4J_URI", "GRAPH_MEMORY_FILE"):
+        monkeypatch.delenv(name, raising=False)
+
+    return Stages(tmp_path)
+
+
+def test_unchanged_stages_are_skipped(stages):
+    assert stages.build() == ["a", "b", "c"]
+    assert stages.build() == []
+    assert set(stages.state()) == {"a", "b", "c"}
+
+
+def test_changed_input_reruns_the_stage_and_its_dependents(stages):
+    stages.build()
+
+    stages.inputs["b"] = 2
+    assert stages.build() == ["b", "c"]
+
+    stages.inputs["c"] = 2
+    assert stages.build() == ["c"]
+
+
+def test_graph_is_part_of_the_fingerprint(stages, monkeypatch):
+    stages.build()
+
+    monkeypatch.setenv("NEO4J_URI", "bolt://other:7687")
+    assert stages.build() == ["a", "b", "c"]
+
+
+def test_missing_output_reruns_the_stage(stages):
+    stages.build()
+
+    os.remove(stages.outputs["c"])
+    assert stages.build() == ["c"]
+
+
+def test_undescribed_inputs_always_run(stages):
+    stages.inputs["b"] = None
+    stages.build()
+
+    assert stages.build() == ["b", "c"]
+    assert set(stages.state()) == {"a"}
+
+
+def test_force(stages):
+    stages.build()
+
+    assert stages.build(force=True) == ["a", "b", "c"]
+
+
+def test_failed_stage_leaves_dependents_unrun(stages):
+    stages.errors["b"] = RuntimeError("down")
+
+    with pytest.raises(RuntimeError, match="Stages b failed, not run: c"):
+        stages.build()
+    assert stages.calls == ["a", "b"]
+    assert set(stages.state()) == {"a"}
+
+    # the next build resumes from the failed stage
+    del stages.errors["b"]
+    assert stages.build() == ["b", "c"]
+
+
+def test_unfinished_stage_runs_again(stages):
+    stages.results["b"] = False
+    stages.build()
+
+    assert set(stages.state()) == {"a", "c"}
+    del stages.results["b"]
+    assert stages.build() == ["b", "c"]
+
+
+def test_retry_items(stages):
+    stages.results["b"] = ["1abc", "2xyz"]
+    stages.build()
+    assert stages.state()["b"]["retry"] == ["1abc", "2xyz"]
+
+    # an up to date stage only retries the items its last run left, and its
+    # dependents run again
+    stages.results["retry"] = ["2xyz"]
+    assert stages.build() == ["c"]
+    assert stages.retries == [["1abc", "2xyz"]]
+    assert stages.state()["b"]["retry"] == ["2xyz"]
+
+    stages.results["retry"] = []
+    stages.build()
+    assert stages.retries[-1] == ["2xyz"]
+    assert "retry" not in stages.state()["b"]
+
+    stages.retries = []
+    assert stages.build() == []
+    assert stages.retries == []
+
+
+def test_cancel_starts_no_further_stage(stages):
+    cancel = threading.Event()
+    run = stages.run
+
+    def cancel_after_a(name):
+        if name == "a":
+            cancel.set()
+        return run(name)
+
+    stages.run = cancel_after_a
+
+    with pytest.raises(RuntimeError, match="Build interrupted, not run: b, c"):
+        stages.build(cancel=cancel)
+    assert stages.calls == ["a"]
+    # the running stage finished and is recorded
+    assert set(stages.state()) == {"a"}
+
+
+def test_interrupt_waits_for_running_stages(stages):
+    finish = threading.Event()
+    run = stages.run
+
+    def interrupt_in_a(name):
+        if name == "a":
+            # once the pipeline waits for the stage, like a Ctrl-C
+            sleep(0.1)
+            os.kill(os.getpid(), signal.SIGINT)
+            finish.wait(5)
+        return run(name)
+
+    stages.run = interrupt_in_a
+    threading.Timer(0.3, finish.set).start()
+
+    with pytest.raises(RuntimeError, match="Build interrupted, not run: b, c"):
+        stages.build()
+    assert stages.calls == ["a"]
+    assert set(stages.state()) == {"a"}
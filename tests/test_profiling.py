@@ -0,0 +1,95 @@
+import json
+
+import pytest
+
+from app.pdbe_complex import ANALYSIS_QUERIES, MERGE_QUERIES, SUBCOMPLEX_QUERY
+import app.profiling
+from app.profiling import SAMPLE_QUERIES, compare_profiles, run_profile
+
+PLAN = {
+    "operatorType": "ProduceResults@neo4j",
+    "dbHits": 0,
+    "rows": 2,
+    "children": [{"operatorType": "NodeIndexSeek@neo4j", "dbHits": 4, "rows": 2}],
+}
+
+
+class Cursor(list):
+    def plan(self):
+        return PLAN
+
+
+class Graph:
+    def __init__(self):
+        self.profiled = []
+        self.rolled_back = 0
+
+    def run(self, query, parameters):
+        # sample batches
+        return [{"row": f"row-{i}"} for i in range(min(parameters["size"], 3))]
+
+    def begin(self):
+        return Transaction(self)
+
+    def rollback(self, tx):
+        self.rolled_back += 1
+
+
+class Transaction:
+    def __init__(self, graph):
+        self.graph = graph
+
+    def run(self, query, parameters=None):
+        self.graph.profiled.append((query, parameters))
+        return Cursor([{}])
+
+
+@pytest.fixture
+def graph(monkeypatch):
+    graph = Graph()
+    monkeypatch.setattr(app.profiling, "connect_graph", lambda database: graph)
+    return graph
+
+
+def test_every_batched_statement_has_a_sample_query():
+    assert set(SAMPLE_QUERIES) == set(MERGE_QUERIES)
+
+
+def test_profile_batched_statements(graph, tmp_path):
+    output = tmp_path / "profile.json"
+
+    assert run_profile(str(output), batch_size=2) == []
+
+    with open(output) as f:
+        profile = json.load(f)
+
+    assert set(profile["queries"]) == set(ANALYSIS_QUERIES) | set(MERGE_QUERIES)
+    assert graph.rolled_back == len(profile["queries"])
+    assert (
+        f"PROFILE {SUBCOMPLEX_QUERY}",
+        {"source_complex_ids": ["row-0", "row-1"]},
+    ) in graph.profiled
+
+    result = profile["queries"]["subcomplexes"]
+    assert result["batch_size"] == 2
+    assert result["db_hits"] == 4
+    assert [x["operator"] for x in result["operators"]] == [
+        "ProduceResults",
+        "NodeIndexSeek",
+    ]
+    assert "batch_size" not in profile["queries"]["assembly_signatures"]
+
+
+def test_compare_profiles(graph, tmp_path):
+    before = tmp_path / "before.json"
+    run_profile(str(before), batch_size=2)
+
+    lines = run_profile(str(tmp_path / "after.json"), str(before), batch_size=3)
+
+    assert "subcomplexes:" in lines
+    assert "  batch_size: 2 -> 3" in lines
+    assert "  db_hits: 4 -> 4 (+0.0%)" in lines
+
+    with open(before) as f:
+        lines = compare_profiles({"queries": {}}, json.load(f))
+    assert all(x.endswith(": not in baseline") for x in lines)
@@ -0,0 +1,111 @@
+import pytest
+
+from app.signature import (
+    ENTITY,
+    RFAM,
+    UNIPROT,
+    UNMAPPED,
+    Participant,
+    decode_signature,
+    encode_signature,
+    make_signature,
+    parse_stoichiometry,
+    signature_hash,
+    signature_label,
+)
+
+PARTICIPANTS = [
+    Participant(UNMAPPED, "DNA"),
+    Participant(UNIPROT, "P12345", 2, "9606"),
+    Participant(RFAM, "RF00005"),
+    Participant(ENTITY, "1abc_2", 1),
+]
+
+# the hash stored on Assembly nodes, it must not change between releases
+HASH = "9b324e4438761f14ef90cd819fab8c81e1deb250"
+
+
+def test_make_signature_order():
+    signature = make_signature(PARTICIPANTS)
+
+    assert [x.kind for x in signature] == [ENTITY, RFAM, UNIPROT, UNMAPPED]
+    assert make_signature(reversed(PARTICIPANTS)) == signature
+    assert make_signature(PARTICIPANTS + PARTICIPANTS[:2]) == signature
+    assert make_signature([]) == ()
+
+
+def test_make_signature_orders_stoichiometry_and_taxonomy():
+    signature = make_signature(
+        [
+            Participant(UNIPROT, "P1", 2, "9606"),
+            Participant(UNIPROT, "P1", 1, "9606"),
+            Participant(UNIPROT, "P1", 1, "10090"),
+            Participant(UNIPROT, "P1", None),
+            Participant(UNIPROT, "P1", 1),
+        ]
+    )
+
+    assert signature == (
+        Participant(UNIPROT, "P1", None),
+        Participant(UNIPROT, "P1", 1),
+        Participant(UNIPROT, "P1", 1, "10090"),
+        Participant(UNIPROT, "P1", 1, "9606"),
+        Participant(UNIPROT, "P1", 2, "9606"),
+    )
+
+
+@pytest.mark.parametrize(
+    "signature",
+    [
+        (),
+        make_signature(PARTICIPANTS),
+        make_signature([Participant(UNIPROT, "P1", 0), Participant(UNIPROT, "P1", 3)]),
+    ],
+)
+def test_encode_decode_round_trip(signature):
+    assert decode_signature(encode_signature(signature)) == signature
+
+
+def test_decode_signature_sorts():
+    value = '[["uniprot","P2",1,"9606"],["uniprot","P1",1,"9606"]]'
+
+    assert decode_signature(value) == (
+        Participant(UNIPROT, "P1", 1, "9606"),
+        Participant(UNIPROT, "P2", 1, "9606"),
+    )
+
+
+def test_signature_hash_is_stable():
+    assert encode_signature(make_signature(PARTICIPANTS)) == (
+        '[["entity","1abc_2",1,null],["rfam","RF00005",null,null],'
+        '["uniprot","P12345",2,"9606"],["unmapped","DNA",null,null]]'
+    )
+    assert signature_hash(make_signature(PARTICIPANTS)) == HASH
+    assert signature_hash(make_signature(reversed(PARTICIPANTS))) == HASH
+    assert signature_hash(make_signature(PARTICIPANTS[1:])) != HASH
+
+
+def test_signature_label():
+    assert signature_label(make_signature(PARTICIPANTS)) == (
+        "1abc_2_1_P,RF00005,P12345_2,DNA:UNMAPPED"
+    )
+
+
+@pytest.mark.parametrize(
+    "value, stoichiometry",
+    [
+        (2, 2),
+        (0, 0),
+        ("2", 2),
+        (" 3 ", 3),
+        ("12", 12),
+        ("", 0),
+        (None, 0),
+        ("unknown", 0),
+        ("0", 0),
+        ("-1", 0),
+        ("1.5", 0),
+    ],
+)
+def test_parse_stoichiometry(value, stoichiometry):
+    assert parse_stoichiometry(value) == stoichiometry
@@ -0,0 +1,141 @@
+import pytest
+
+from app.signature import RFAM, UNIPROT, Participant, make_signature
+from app.similarity import find_near_matches
+
+pytest.importorskip("scipy")
+
+
+def uniprot(accession, stoichiometry=1):
+    return Participant(UNIPROT, accession, stoichiometry, "9606")
+
+
+def near_matches(complexes, references, **kwargs):
+    return {
+        (x, y): round(score, 3)
+        for x, y, score in find_near_matches(
+            {x: make_signature(y) for x, y in complexes.items()},
+            {x: make_signature(y) for x, y in references.items()},
+            **kwargs,
+        )
+    }
+
+
+# copies: complex P1 x2, P2 x1 against reference P1 x1, P2 x1, P3 x1
+COMPLEX = [uniprot("P1", 2), uniprot("P2")]
+REFERENCE = [uniprot("P1"), uniprot("P2"), uniprot("P3")]
+
+
+@pytest.mark.parametrize(
+    "metric, score",
+    [
+        # 2 shared copies out of 3 + 3 - 2
+        ("jaccard", 0.5),
+        # 2 of the 3 reference copies
+        ("containment", 0.667),
+    ],
+)
+def test_scores(metric, score):
+    assert near_matches(
+        {"pdb": COMPLEX}, {"cp": REFERENCE}, metric=metric, threshold=0
+    ) == {("pdb", "cp"): score}
+
+
+def test_stoichiometry_copies():
+    # 2 shared copies out of 4 + 2 - 2
+    assert near_matches(
+        {"pdb": [uniprot("P1", 4)]}, {"cp": [uniprot("P1", 2)]}, threshold=0
+    ) == {("pdb", "cp"): 0.5}
+    # the same accession with two stoichiometries adds up to 3 copies
+    assert near_matches(
+        {"pdb": [uniprot("P1", 1), uniprot("P1", 2)]},
+        {"cp": [uniprot("P1", 3), uniprot("P2")]},
+        threshold=0,
+    ) == {("pdb", "cp"): 0.75}
+
+
+def test_threshold():
+    complexes = {"pdb": COMPLEX}
+    references = {"cp": REFERENCE}
+
+    assert near_matches(complexes, references, threshold=0.5) == {("pdb", "cp"): 0.5}
+    assert near_matches(complexes, references, threshold=0.51) == {}
+
+
+def test_top_references_per_complex():
+    # P1..P7 against references sharing 1..7 participants
+    complexes = {"pdb": [uniprot(f"P{i}") for i in range(1, 8)]}
+    references = {
+        f"cp{n}": [uniprot(f"P{i}") for i in range(1, n + 1)] + [uniprot("Q1")]
+        for n in range(1, 8)
+    }
+
+    result = list(
+        find_near_matches(
+            {x: make_signature(y) for x, y in complexes.items()},
+            {x: make_signature(y) for x, y in references.items()},
+            threshold=0,
+            top=5,
+        )
+    )
+
+    assert [y for _, y, _ in result] == ["cp7", "cp6", "cp5", "cp4", "cp3"]
+    assert [x for x, _, _ in result] == ["pdb"] * 5
+    assert [x[2] for x in result] == sorted((x[2] for x in result), reverse=True)
+
+
+def test_top_is_per_complex():
+    complexes = {"a": [uniprot("P1")], "b": [uniprot("P1"), uniprot("P2")]}
+    references = {f"cp{i}": [uniprot("P1"), uniprot(f"Q{i}")] for i in range(3)}
+
+    result = near_matches(complexes, references, threshold=0, top=2)
+
+    assert sorted(x for x, _ in result) == ["a", "a", "b", "b"]
+
+
+def test_identical_signatures_are_left_out():
+    assert near_matches(
+        {"pdb": COMPLEX, "other": [uniprot("P1")]},
+        {"cp": COMPLEX, "cp2": COMPLEX + [uniprot("P3")]},
+        threshold=0,
+    ) == {("pdb", "cp2"): 0.75, ("other", "cp"): 0.333, ("other", "cp2"): 0.25}
+
+
+def test_unknown_stoichiometry():
+    # unknown (0 from Complex Portal, or None) counts as one copy, but is not
+    # the same signature as a known stoichiometry of 1
+    assert near_matches(
+        {"pdb": [uniprot("P1", 1), Participant(RFAM, "RF00005")]},
+        {
+            "cp0": [uniprot("P1", 0), Participant(RFAM, "RF00005")],
+            "cp": [uniprot("P1", 1), Participant(RFAM, "RF00005")],
+        },
+        threshold=0,
+    ) == {("pdb", "cp0"): 1.0}
+
+
+def test_no_shared_participants():
+    assert near_matches({"pdb": [uniprot("P1")]}, {"cp": [uniprot("P2")]}) == {}
+
+
+@pytest.mark.parametrize(
+    "complexes, references",
+    [({}, {}), ({"pdb": COMPLEX}, {}), ({}, {"cp": REFERENCE})],
+)
+def test_empty_inputs(complexes, references):
+    assert near_matches(complexes, references, threshold=0) == {}
+
+
+def test_batches():
+    complexes = {f"pdb{i}": [uniprot(f"P{i}"), uniprot("P0")] for i in range(1, 11)}
+    references = {"cp": [uniprot("P0")]}
+
+    assert near_matches(complexes, references, batch_size=3) == near_matches(
+        complexes, references
+    )
+    assert len(near_matches(complexes, references, batch_size=3)) == 10
+
+
+def test_unknown_metric():
+    with pytest.raises(ValueError):
+        near_matches({}, {}, metric="cosine")
@@ -0,0 +1,147 @@
+import gzip
+import os
+import shutil
+
+import pytest
+
+import app.stores
+from app.stores import (
+    RfamMappingStore,
+    UniProtStore,
+    build_rfam_store,
+    build_uniprot_store,
+    parse_rfam_mapping_api,
+    parse_rfam_mapping_tsv,
+    parse_uniprot_dat,
+)
+
+DATA = os.path.join(os.path.dirname(__file__), "data")
+UNIPROT_DAT = os.path.join(DATA, "uniprot_sample.dat")
+RFAM_MAPPINGS = os.path.join(DATA, "rfam_mappings.tsv")
+
+
+def gzipped(path, tmp_path):
+    target = tmp_path / (os.path.basename(path) + ".gz")
+    with open(path, "rb") as f, gzip.open(target, "wb") as out:
+        shutil.copyfileobj(f, out)
+
+    return str(target)
+
+
+def test_parse_uniprot_dat(tmp_path):
+    expected = [
+        # secondary accessions on both AC lines, the nested RecName of the
+        # Includes: section and the OH host taxonomy are left out
+        (["P11111", "Q11111", "Q22222"], "ONE_HUMAN", "Protein one", "9606"),
+        # TrEMBL entries only have a SubName, evidence tags are dropped
+        (["A0A000"], "A0A000_MOUSE", None, "10090"),
+        (["P33333"], "NOTAX_SYNTH", "Synthetic peptide", None),
+    ]
+
+    assert list(parse_uniprot_dat(UNIPROT_DAT)) == expected
+    assert list(parse_uniprot_dat(gzipped(UNIPROT_DAT, tmp_path))) == expected
+
+
+def test_uniprot_store(tmp_path):
+    path = str(tmp_path / "uniprot.sqlite")
+    build_uniprot_store(path, [UNIPROT_DAT])
+    store = UniProtStore(path)
+
+    result = store.get_many(["P11111", "Q22222", "A0A000", "P33333", "P99999"])
+
+    assert result["P11111"] == {
+        "uniProtkbId": "ONE_HUMAN",
+        "proteinDescription": {
+            "recommendedName": {"fullName": {"value": "Protein one"}}
+        },
+        "organism": {"taxonId": 9606},
+    }
+    assert result["Q22222"] == result["P11111"]
+    assert result["A0A000"]["proteinDescription"] == {}
+    assert result["P33333"]["organism"] is None
+    # unknown accessions look like a failed REST call
+    assert result["P99999"] == {}
+    assert store.get("A0A000")["organism"] == {"taxonId": 10090}
+    assert not os.path.exists(f"{path}.tmp")
+
+
+def test_uniprot_store_batches(tmp_path, monkeypatch):
+    monkeypatch.setattr(app.stores, "STORE_QUERY_SIZE", 2)
+    path = str(tmp_path / "uniprot.sqlite")
+    build_uniprot_store(path, [UNIPROT_DAT])
+
+    result = UniProtStore(path).get_many(["P11111", "Q11111", "A0A000", "P33333"])
+
+    assert all(result.values())
+
+
+def test_missing_store(tmp_path):
+    with pytest.raises(FileNotFoundError):
+        UniProtStore(str(tmp_path / "missing.sqlite"))
+
+
+def test_parse_rfam_mapping_tsv(tmp_path):
+    expected = [
+        ("1ffk", 9, "RF02540", "LSU_rRNA_archaea"),
+        ("1ffk", 10, "RF00001", "5S_rRNA"),
+        ("4v9d", 1, "RF00177", "SSU_rRNA_bacteria"),
+        ("4v9d", 1, "RF02541", "LSU_rRNA_bacteria"),
+    ]
+
+    assert list(parse_rfam_mapping_tsv(RFAM_MAPPINGS)) == expected
+    assert list(parse_rfam_mapping_tsv(gzipped(RFAM_MAPPINGS, tmp_path))) == expected
+
+
+@pytest.mark.parametrize(
+    "line",
+    [
+        "1ffk\t9\tRF02540\n",
+        "1ffk 9 RF02540 LSU_rRNA_archaea\n",
+        "1ffk\tA\tRF02540\tLSU_rRNA_archaea\n",
+    ],
+)
+def test_parse_rfam_mapping_tsv_rejects_other_layouts(tmp_path, line):
+    path = tmp_path / "mappings.tsv"
+    path.write_text("# comment\n" + line)
+
+    with pytest.raises(ValueError, match=r"mappings.tsv:2: expected tab separated"):
+        list(parse_rfam_mapping_tsv(str(path)))
+
+
+def test_rfam_mapping_store(tmp_path):
+    path = str(tmp_path / "rfam.sqlite")
+    build_rfam_store(path, parse_rfam_mapping_tsv(RFAM_MAPPINGS))
+    store = RfamMappingStore(path)
+
+    # same shape as the nucleic_mappings/rfam API response
+    assert store.get("1FFK") == {
+        "Rfam": {
+            "RF02540": {
+                "identifier": "LSU_rRNA_archaea",
+                "mappings": [{"entity_id": 9}],
+            },
+            "RF00001": {"identifier": "5S_rRNA", "mappings": [{"entity_id": 10}]},
+        }
+    }
+    assert store.get("4v9d")["Rfam"].keys() == {"RF00177", "RF02541"}
+    assert store.get("2xyz") == {"Rfam": {}}
+
+
+def test_parse_rfam_mapping_api(monkeypatch):
+    responses = {
+        "1FFK": {
+            "Rfam": {
+                "RF02540": {
+                    "identifier": "LSU_rRNA_archaea",
+                    "mappings": [{"entity_id": "9"}, {"entity_id": 9}],
+                }
+            }
+        },
+        "2xyz": {},
+    }
+    monkeypatch.setattr(app.stores, "parse_entry_rfam_mapping_api", responses.get)
+
+    assert list(parse_rfam_mapping_api(["1FFK", "2xyz"])) == [
+        ("1ffk", 9, "RF02540", "LSU_rRNA_archaea"),
+        ("1ffk", 9, "RF02540", "LSU_rRNA_archaea"),
+    ]
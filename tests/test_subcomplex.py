@@ -0,0 +1,122 @@
+import random
+
+import pytest
+
+from app.signature import RFAM, UNIPROT, Participant, make_signature
+from app.subcomplex import all_pairs, covering_pairs, find_supersets
+
+
+def uniprot(accession, stoichiometry=1):
+    return Participant(UNIPROT, accession, stoichiometry, "9606")
+
+
+def signatures(**complexes):
+    return {x: make_signature(y) for x, y in complexes.items()}
+
+
+def closure(pairs):
+    pairs = set(pairs)
+    while True:
+        extra = {(x, z) for x, y in pairs for y2, z in pairs if y == y2} - pairs
+        if not extra:
+            return pairs
+        pairs |= extra
+
+
+def random_signatures(seed, count=80):
+    rng = random.Random(seed)
+    participants = [uniprot(f"P{i}", rng.choice([1, 2])) for i in range(8)]
+    participants.append(Participant(RFAM, "RF00005"))
+
+    # the analysis only ever sees distinct signatures
+    complexes = {}
+    for i in range(count):
+        signature = make_signature(rng.sample(participants, rng.randint(1, 5)))
+        complexes.setdefault(signature, f"C{i}")
+
+    return {y: x for x, y in complexes.items()}
+
+
+def test_chain():
+    supersets = find_supersets(
+        signatures(
+            a=[uniprot("P1")],
+            ab=[uniprot("P1"), uniprot("P2")],
+            abc=[uniprot("P1"), uniprot("P2"), uniprot("P3")],
+        )
+    )
+
+    assert supersets == {"a": {"ab", "abc"}, "ab": {"abc"}, "abc": set()}
+    assert set(all_pairs(supersets)) == {("a", "ab"), ("a", "abc"), ("ab", "abc")}
+    # the Hasse diagram leaves out a < abc, implied by a < ab < abc
+    assert set(covering_pairs(supersets)) == {("a", "ab"), ("ab", "abc")}
+
+
+def test_equal_signatures_are_not_sub_complexes():
+    supersets = find_supersets(
+        signatures(x=[uniprot("P1"), uniprot("P2")], y=[uniprot("P2"), uniprot("P1")])
+    )
+
+    assert supersets == {"x": set(), "y": set()}
+
+
+def test_stoichiometry_must_match():
+    supersets = find_supersets(
+        signatures(
+            a1=[uniprot("P1", 1)],
+            a2=[uniprot("P1", 2)],
+            a2b=[uniprot("P1", 2), uniprot("P2")],
+            # a different taxonomy is a different participant too
+            mouse=[Participant(UNIPROT, "P1", 1, "10090"), uniprot("P2")],
+        )
+    )
+
+    assert supersets == {"a1": set(), "a2": {"a2b"}, "a2b": set(), "mouse": set()}
+
+
+def test_diamond_keeps_both_covers():
+    supersets = find_supersets(
+        signatures(
+            a=[uniprot("P1")],
+            ab=[uniprot("P1"), uniprot("P2")],
+            ac=[uniprot("P1"), uniprot("P3")],
+            abc=[uniprot("P1"), uniprot("P2"), uniprot("P3")],
+        )
+    )
+
+    assert set(covering_pairs(supersets)) == {
+        ("a", "ab"),
+        ("a", "ac"),
+        ("ab", "abc"),
+        ("ac", "abc"),
+    }
+
+
+def test_empty_signature():
+    assert find_supersets(signatures(empty=[], a=[uniprot("P1")])) == {
+        "empty": set(),
+        "a": set(),
+    }
+
+
+@pytest.mark.parametrize("seed", range(5))
+def test_lattice_matches_brute_force(seed):
+    complexes = random_signatures(seed)
+    expected = {
+        (x, y)
+        for x, sx in complexes.items()
+        for y, sy in complexes.items()
+        if set(sx) < set(sy)
+    }
+
+    supersets = find_supersets(complexes)
+    pairs = set(all_pairs(supersets))
+    covers = set(covering_pairs(supersets))
+
+    assert pairs == expected
+    assert covers <= pairs
+    assert not any(
+        (x, z) in pairs and (z, y) in pairs for x, y in covers for z in complexes
+    )
+    # the transitive closure of the covering pairs gives back every pair
+    assert closure(covers) == pairs
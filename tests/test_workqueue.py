@@ -0,0 +1,132 @@
+import socket
+
+import pytest
+import requests
+
+from app.workqueue import (
+    LEASED,
+    PREPARED,
+    RemoteWorkQueue,
+    WorkQueue,
+    run_coordinator,
+    serve_queue,
+)
+
+TOKEN = "secret"
+
+
+def entry_rows(entry_id):
+    return {
+        "entry": [{"ID": entry_id, "TITLE": "Test"}],
+        "entities": [
+            {
+                "UNIQID": f"{entry_id}_1",
+                "ID": 1,
+                "DESCRIPTION": "Protein",
+                "POLYMER_TYPE": "P",
+                "TYPE": "p",
+            }
+        ],
+        "assemblies": [
+            {
+                "UNIQID": f"{entry_id}_1",
+                "ID": 1,
+                "PREFERED": "True",
+                "COMPOSITION": "protein structure",
+            }
+        ],
+        "uniprots": [{"ACCESSION": "P12345"}],
+        "rfams": [],
+        "taxonomies": [{"TAX_ID": "9606"}],
+        "entry_entities": [[entry_id, [], f"{entry_id}_1"]],
+        "assembly_entities": [[f"{entry_id}_1", [2], f"{entry_id}_1"]],
+        "entity_uniprots": [[f"{entry_id}_1", ["1"], "P12345"]],
+        "entity_rfams": [],
+        "uniprot_taxonomies": [["P12345", [], "9606"]],
+    }
+
+
+@pytest.fixture
+def queue(tmp_path):
+    queue = WorkQueue(str(tmp_path / "queue.sqlite"))
+    queue.publish(["1abc"])
+    assert queue.claim("worker", count=1) == ["1abc"]
+
+    return queue
+
+
+@pytest.fixture
+def url(queue):
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        port = s.getsockname()[1]
+
+    server = serve_queue(queue, f"127.0.0.1:{port}", token=TOKEN)
+    yield f"http://127.0.0.1:{port}"
+    server.shutdown()
+
+
+def test_serve_queue_requires_token(queue):
+    with pytest.raises(ValueError):
+        serve_queue(queue, "127.0.0.1:0", token="")
+
+
+def test_requests_without_token_are_rejected(url):
+    for token in (None, "wrong"):
+        with pytest.raises(requests.HTTPError) as e:
+            RemoteWorkQueue(url, token=token).counts()
+        assert e.value.response.status_code == 401
+
+    assert RemoteWorkQueue(url, token=TOKEN).counts()[LEASED] == 1
+
+
+@pytest.mark.parametrize(
+    "kwargs",
+    [
+        # statements are not accepted at all
+        {
+            "statements": '[{"query": "MATCH (n) DETACH DELETE n", '
+            '"parameters": {}, "merge": null}]'
+        },
+        {"rows": {"query": "MATCH (n) DETACH DELETE n"}},
+        # rows with properties or values outside the models
+        {"rows": dict(entry_rows("1abc"), rfams=[{"RFAM_ACC": "RF1", "X": 1}])},
+        {
+            "rows": dict(
+                entry_rows("1abc"),
+                entity_rfams=[["1abc_1", ["MATCH (n) DETACH DELETE n"], "RF1"]],
+            )
+        },
+        # rows of another entry
+        {"rows": entry_rows("2xyz")},
+    ],
+)
+def test_forged_submit_is_rejected(queue, url, memory_writer, kwargs):
+    remote = RemoteWorkQueue(url, token=TOKEN)
+    memory_writer.merge_nodes([{"ID": "9zzz"}], ("Entry", "ID"))
+
+    with pytest.raises(requests.HTTPError) as e:
+        remote.submit(worker="worker", entry_id="1abc", **kwargs)
+
+    assert e.value.response.status_code == 400
+    assert queue.counts()[LEASED] == 1
+    assert queue.prepared() == []
+    assert list(memory_writer.graph.nodes["Entry"]) == ["9zzz"]
+
+
+def test_submitted_rows_are_written_by_the_coordinator(queue, url, memory_writer):
+    RemoteWorkQueue(url, token=TOKEN).submit(
+        worker="worker", entry_id="1abc", rows=entry_rows("1abc")
+    )
+    assert queue.counts()[PREPARED] == 1
+
+    assert run_coordinator(queue, [], threads=1, poll=0) == []
+
+    graph = memory_writer.graph
+    assert sorted(graph.nodes["Entry"]) == ["1abc"]
+    assert graph.out(("Entity", "1abc_1"), "IS_PART_OF_ASSEMBLY", "Assembly") == [
+        (("Assembly", "1abc_1"), {"NUMBER_OF_CHAINS": 2})
+    ]
+    assert graph.out(("UniProt", "P12345"), "HAS_TAXONOMY", "Taxonomy") == [
+        (("Taxonomy", "9606"), {})
+    ]